@@ -0,0 +1,131 @@
+"""
+Admission control for LLM calls (chat replies, reports and API readings).
+
+Every call takes a token from the user's bucket and from a global bucket
+shared by all users, both kept in the app database (database.take_token)
+so the limits hold across replicas and worker processes. When a bucket is
+empty the call may be queued for up to MAX_WAIT seconds (the reply job is
+held back until then); beyond that it is refused with the time to retry.
+
+Answers that don't need a new Gemini call skip the limiter: bare "what is
+my ascendant / Moon sign / nakshatra / current dasha?" questions are
+answered from the chart, and a repeat of a question already answered for the same chart is
+served from a reply cache.
+
+Limits are read from the environment (per minute):
+
+    LLM_USER_RATE=6 LLM_USER_BURST=3 LLM_GLOBAL_RATE=30 LLM_GLOBAL_BURST=10 LLM_MAX_WAIT=20
+"""
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import database as db
+
+USER_RATE = float(os.environ.get("LLM_USER_RATE", "6"))
+USER_BURST = float(os.environ.get("LLM_USER_BURST", "3"))
+GLOBAL_RATE = float(os.environ.get("LLM_GLOBAL_RATE", "30"))
+GLOBAL_BURST = float(os.environ.get("LLM_GLOBAL_BURST", "10"))
+MAX_WAIT = float(os.environ.get("LLM_MAX_WAIT", "20"))
+REPLY_CACHE_SIZE = 512
+
+GLOBAL_KEY = "llm:*"
+
+# granted: whether the call may go ahead; wait: seconds it is queued for
+# (granted) or until it may be retried (refused)
+Admission = namedtuple("Admission", "granted wait")
+
+# Exactly "what is my <fact>?": anything longer asks for interpretation and goes to the astrologer
+_FACTUAL_QUESTION = re.compile(
+    r"^\s*what(?:'s|\s+is)\s+my\s+(?P<fact>ascendant|lagna|rising sign|moon sign|rashi|rasi|nakshatra|"
+    r"birth star|(?:current |running )?(?:dasha|mahadasha))\s*\??\s*$", re.I)
+_FACTUAL_TOPICS = {"ascendant": "ascendant", "lagna": "ascendant", "rising sign": "ascendant",
+                   "moon sign": "moon sign", "rashi": "moon sign", "rasi": "moon sign",
+                   "nakshatra": "nakshatra", "birth star": "nakshatra"}
+
+_replies = OrderedDict()
+_replies_lock = threading.Lock()
+
+
+def admit(db_conn, username, max_wait=MAX_WAIT):
+    """Take a token from the user's and the global bucket (see the module docstring)."""
+    user_key = f"llm:user:{username}"
+    granted, user_wait = db.take_token(db_conn, user_key, USER_RATE / 60, USER_BURST, max_wait)
+    if not granted:
+        return Admission(False, user_wait)
+    granted, global_wait = db.take_token(db_conn, GLOBAL_KEY, GLOBAL_RATE / 60, GLOBAL_BURST, max_wait)
+    if not granted:
+        # The user's token goes back: they weren't the reason for the refusal
+        db.refund_token(db_conn, user_key, USER_BURST)
+        return Admission(False, global_wait)
+    return Admission(True, max(user_wait, global_wait))
+
+
+def retry_message(admission):
+    seconds = max(1, math.ceil(admission.wait))
+    return f"The astrologer is busy right now. Please try again in {seconds} second{'s' if seconds != 1 else ''}."
+
+
+def priority_reply(chart, query):
+    """("factual" or "cached", answer) for a question that needs no Gemini call, or None."""
+    text = factual_reply(chart, query)
+    if text is not None:
+        return "factual", text
+    text = cached_reply(chart, query)
+    if text is not None:
+        return "cached", text
+    return None
+
+
+def factual_reply(chart, query):
+    """The answer to a bare "what is my <chart fact>?" question, or None if the question needs the astrologer."""
+    match = _FACTUAL_QUESTION.match(query)
+    if not match:
+        return None
+    topic = _FACTUAL_TOPICS.get(" ".join(match["fact"].lower().split()), "dasha")
+    d1 = chart.varga("D1")
+    if topic == "ascendant" and d1 and d1.ascendant:
+        asc = d1.ascendant
+        return (f"The ascendant (lagna) is {asc.sign.label} {asc.degree:.2f}°, "
+                f"in {asc.nakshatra.label} nakshatra, pada {asc.pada}.")
+    moon = d1.planets.get("Moon") if d1 else None
+    if topic == "moon sign" and moon:
+        return f"The Moon sign (rashi) is {moon.sign.label}, with the Moon at {moon.degree:.2f}°."
+    if topic == "nakshatra" and moon:
+        return f"The birth nakshatra (the Moon's) is {moon.nakshatra.label}, pada {moon.pada}."
+    current = chart.current_dasha() if topic == "dasha" else None
+    if current and current.get("dasha"):
+        levels = " / ".join(current[k] for k in ("dasha", "bhukti", "paryantardasha") if current.get(k))
+        return f"The running Vimshottari period (Mahadasha / Antardasha / Pratyantardasha) is {levels}."
+    return None
+
+
+def _reply_key(chart, query):
+    return chart.fingerprint, re.sub(r"\W+", " ", query.lower()).strip()
+
+
+def cached_reply(chart, query):
+    """A previous answer to the same question about the same chart, or None."""
+    key = _reply_key(chart, query)
+    with _replies_lock:
+        text = _replies.get(key)
+        if text is not None:
+            _replies.move_to_end(key)
+    return text
+
+
+def remember_reply(chart, query, text):
+    key = _reply_key(chart, query)
+    with _replies_lock:
+        _replies[key] = text
+        _replies.move_to_end(key)
+        if len(_replies) > REPLY_CACHE_SIZE:
+            _replies.popitem(last=False)
+
+
+def run_after(admission):
+    """Unix time a granted, queued call should start (None to run now), for db.submit_job."""
+    return time.time() + admission.wait if admission.wait > 0 else None
@@ -0,0 +1,393 @@
+"""
+Headless JSON API for charts, dashas and AI readings:
+
+    python api.py                       # local SQLite database
+    MONGO_URI=... GEMINI_API_KEY=... API_WORKERS=4 python api.py
+
+Every endpoint except /health uses HTTP Basic auth against the app's user
+accounts. Chart computation runs in a bounded process pool: requests beyond
+the worker and queue capacity get 503 with Retry-After, and computations
+exceeding API_TIMEOUT get 504. Readings share the app's per-user and global
+LLM rate limits (see admission.py): a request is held for up to
+LLM_MAX_WAIT seconds, and beyond that gets 429 with Retry-After.
+
+    GET  /health
+    GET  /metrics  stage timings in the Prometheus text format (see tracing.py)
+    POST /chart    {"name", "dob": "YYYY-MM-DD", "tob": "HH:MM", "city"} or {"profile": "<saved name>"}
+                   (plus its dob, tob or city when several profiles share the name)
+                   optional "lat", "lon" and "tz_offset" (hours; looked up from lat/lon if omitted)
+    POST /dasha    same body as /chart
+    POST /reading  chart body plus {"query", "stream": false}; uses the server's GEMINI_API_KEY
+                   stream=true (or Accept: text/event-stream) answers with Server-Sent Events
+"""
+import base64
+import datetime
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import admission
+import database as db
+from astrology import get_chart_data, get_timezone, get_utc_offset, CHART_ENGINE_VERSION
+from chart_analytics import dasha_frame
+from chart_model import Chart
+from llm import get_astrology_response, LLMError
+from tracing import trace, span, merge, prometheus_text
+
+API_HOST = os.environ.get("API_HOST", "127.0.0.1")
+API_PORT = int(os.environ.get("API_PORT", "8000"))
+API_WORKERS = int(os.environ.get("API_WORKERS", os.cpu_count() or 2))
+API_QUEUE = int(os.environ.get("API_QUEUE", API_WORKERS * 2))
+API_TIMEOUT = float(os.environ.get("API_TIMEOUT", "30"))
+MAX_BODY = 64 * 1024
+AUTH_TTL = 60
+CHART_CACHE_SIZE = 256
+
+
+def _compute_chart(name, dob, tob, city, location):
+    """Runs in a pool worker; returns the chart and the spans recorded computing it."""
+    with trace("chart.compute") as current:
+        data = get_chart_data(name, dob, tob, city, location)
+    return data, current["spans"]
+
+
+class ApiError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+class ChartService:
+    """
+    Runs get_chart_data in worker processes (jyotishyamitra keeps its state
+    in module globals, so it is not safe to share between threads) and keeps
+    an LRU of recent results.
+    """
+
+    def __init__(self, workers=API_WORKERS, queue=API_QUEUE, timeout=API_TIMEOUT):
+        self.workers = workers
+        self.timeout = timeout
+        self._pool = ProcessPoolExecutor(max_workers=workers)
+        self._slots = threading.BoundedSemaphore(workers + queue)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    def _release(self, _future):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def compute(self, name, dob, tob, city, location=None):
+        key = (name, dob, tob, city, location)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        if not self._slots.acquire(blocking=False):
+            raise ApiError(503, "Server busy, try again shortly.", {"Retry-After": "1"})
+        with self._lock:
+            self._in_flight += 1
+        # The slot is held until the computation finishes, even if the
+        # request times out, so abandoned work still counts against capacity
+        future = self._pool.submit(_compute_chart, name, dob, tob, city, location)
+        future.add_done_callback(self._release)
+        try:
+            with span("api.chart_pool"):
+                data, spans = future.result(timeout=self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise ApiError(504, f"Chart computation exceeded {self.timeout:g}s.")
+        merge(spans)
+
+        if "error" not in data:
+            with self._lock:
+                self._cache[key] = data
+                if len(self._cache) > CHART_CACHE_SIZE:
+                    self._cache.popitem(last=False)
+        return data
+
+    def shutdown(self):
+        self._pool.shutdown(cancel_futures=True)
+
+
+def _number(body, field, low, high):
+    try:
+        value = float(body[field])
+    except (TypeError, ValueError):
+        raise ApiError(400, f"{field} must be a number")
+    if not low <= value <= high:
+        raise ApiError(400, f"{field} must be between {low} and {high}")
+    return value
+
+
+def _location(body):
+    """
+    (lat, lon, tz_offset) from a chart request, or None to geocode the city.
+    Without tz_offset, the offset on the birth date is looked up from lat/lon.
+    """
+    given = [k for k in ("lat", "lon") if body.get(k) is not None]
+    if not given:
+        return None
+    if len(given) == 1:
+        raise ApiError(400, "lat and lon must be given together")
+    lat, lon = _number(body, "lat", -90, 90), _number(body, "lon", -180, 180)
+    if body.get("tz_offset") is not None:
+        return lat, lon, _number(body, "tz_offset", -14, 14)
+    try:
+        dob = datetime.datetime.strptime(body["dob"], "%Y-%m-%d")
+    except (TypeError, ValueError):
+        raise ApiError(400, "dob must be YYYY-MM-DD")
+    timezone_str = get_timezone(lat, lon)
+    if timezone_str is None:
+        raise ApiError(400, "No timezone found at lat/lon; give tz_offset")
+    return lat, lon, get_utc_offset(timezone_str, dob)
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "VedicAstrologyAPI/1.0"
+
+    # Set by make_server()
+    db_conn = None
+    charts = None
+    _auth_cache = {}
+    _auth_lock = threading.Lock()
+
+    # --- Plumbing --------------------------------------------------------------
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY:
+            raise ApiError(413, "Request body too large.")
+        raw = self.rfile.read(length) if length else b"{}"
+        try:
+            body = json.loads(raw or b"{}")
+        except ValueError:
+            raise ApiError(400, "Request body must be JSON.")
+        if not isinstance(body, dict):
+            raise ApiError(400, "Request body must be a JSON object.")
+        return body
+
+    def _authenticate(self):
+        header = self.headers.get("Authorization", "")
+        if not header.startswith("Basic "):
+            raise ApiError(401, "Authentication required.", {"WWW-Authenticate": 'Basic realm="astrology"'})
+        try:
+            username, password = base64.b64decode(header[6:]).decode("utf-8").split(":", 1)
+        except ValueError:
+            raise ApiError(401, "Malformed credentials.", {"WWW-Authenticate": 'Basic realm="astrology"'})
+
+        key = (username, hashlib.sha256(password.encode("utf-8")).hexdigest())
+        now = time.monotonic()
+        with self._auth_lock:
+            if self._auth_cache.get(key, 0) > now:
+                return username
+        if not db.login_user(self.db_conn, username, password):
+            raise ApiError(401, "Invalid username or password.", {"WWW-Authenticate": 'Basic realm="astrology"'})
+        with self._auth_lock:
+            self._auth_cache[key] = now + AUTH_TTL
+        return username
+
+    def _chart(self, username, body):
+        """Resolve the chart for a request: a saved profile or explicit birth details."""
+        if body.get("profile"):
+            # Profiles may share a name: dob, tob and city, when given, pick one of them
+            profiles = {tuple(p) for p in db.get_user_profiles(self.db_conn, username)
+                        if p[0] == body["profile"]
+                        and all(body.get(k) in (None, p[i]) for i, k in ((1, "dob"), (2, "tob"), (3, "city")))}
+            if not profiles:
+                raise ApiError(404, f"Profile not found: {body['profile']}")
+            if len(profiles) > 1:
+                raise ApiError(409, f"Several profiles are named {body['profile']}; add dob, tob or city to choose one")
+            profile = profiles.pop()
+            stored = db.get_profile_chart(self.db_conn, username, profile)
+            if not stored:
+                raise ApiError(404, f"Profile not found: {body['profile']}")
+            if stored["chart"] and stored["chart_version"] == CHART_ENGINE_VERSION:
+                return stored["chart"]
+            location = None
+            if stored["lat"] is not None:
+                location = (stored["lat"], stored["lon"], stored["tz_offset"])
+            data = self.charts.compute(profile[0], profile[1], profile[2], profile[3], location)
+        else:
+            missing = [k for k in ("name", "dob", "tob", "city") if not body.get(k)]
+            if missing:
+                raise ApiError(400, f"Missing field(s): {', '.join(missing)}")
+            data = self.charts.compute(body["name"], body["dob"], body["tob"], body["city"], _location(body))
+
+        if "error" in data:
+            raise ApiError(422, data["error"].split("\n")[0])
+        return data
+
+    def _dispatch(self, routes):
+        path = self.path.split("?", 1)[0].rstrip("/") or "/"
+        handler = routes.get(path)
+        if handler is None:
+            self._send_json(404, {"error": f"Not found: {self.path}"})
+            return
+        with trace(f"api.{self.command} {path}"):
+            try:
+                handler()
+            except ApiError as e:
+                self._send_json(e.status, {"error": str(e)}, e.headers)
+            except Exception as e:
+                self._send_json(500, {"error": f"Internal error: {e}"})
+
+    def do_GET(self):
+        self._dispatch({"/health": self.health, "/metrics": self.metrics})
+
+    def do_POST(self):
+        self._dispatch({"/chart": self.chart, "/dasha": self.dasha, "/reading": self.reading})
+
+    def log_message(self, format, *args):
+        if os.environ.get("API_ACCESS_LOG"):
+            super().log_message(format, *args)
+
+    # --- Endpoints -------------------------------------------------------------
+
+    def health(self):
+        status, error = "ok", None
+        if self.db_conn is not None:
+            healthy, error = db.mongo_health(self.db_conn.client)
+            status = "ok" if healthy else "degraded"
+        self._send_json(200, {"status": status, "backend": "sqlite" if self.db_conn is None else "mongodb",
+                              "error": error, "workers": self.charts.workers, "in_flight": self.charts.in_flight})
+
+    def metrics(self):
+        body = prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def chart(self):
+        username = self._authenticate()
+        self._send_json(200, self._chart(username, self._read_json()))
+
+    def dasha(self):
+        username = self._authenticate()
+        chart = Chart.from_engine(self._chart(username, self._read_json()))
+        df = dasha_frame(chart)
+        periods = [{"major": r["Major Lord"], "sub": r["Sub Lord"],
+                    "start": r["Start"].date().isoformat(), "end": r["Finish"].date().isoformat()}
+                   for r in df.to_dict("records")]
+        self._send_json(200, {"current": chart.current_dasha(), "periods": periods})
+
+    def reading(self):
+        username = self._authenticate()
+        body = self._read_json()
+        if not body.get("query"):
+            raise ApiError(400, "Missing field(s): query")
+        # Only the server's key: genai.configure() is process-wide, so keys sent with concurrent
+        # requests would race and one client's call could run on another's key
+        if "api_key" in body:
+            raise ApiError(400, "api_key is not accepted; readings use the server's GEMINI_API_KEY")
+        chart = Chart.from_engine(self._chart(username, body))
+        api_key = os.environ.get("GEMINI_API_KEY")
+        stream = bool(body.get("stream")) or "text/event-stream" in self.headers.get("Accept", "")
+
+        # Factual and repeated questions skip the rate limits (and Gemini)
+        priority = admission.priority_reply(chart, body["query"])
+        if priority is None:
+            admitted = admission.admit(self.db_conn, username)
+            if not admitted.granted:
+                raise ApiError(429, admission.retry_message(admitted),
+                               {"Retry-After": str(math.ceil(admitted.wait))})
+            if admitted.wait:
+                with span("api.rate_limit_wait"):
+                    time.sleep(admitted.wait)
+
+        if not stream:
+            if priority is not None:
+                self._send_json(200, {"response": priority[1]})
+                return
+            try:
+                text = get_astrology_response(chart, body["query"], api_key)
+            except LLMError as e:
+                raise ApiError(502, str(e))
+            admission.remember_reply(chart, body["query"], text)
+            self._send_json(200, {"response": text})
+            return
+
+        if priority is not None:
+            event, chunks = "message", [priority[1]]
+        else:
+            try:
+                # Setup failures are sent as a single error event rather than a stream
+                event, chunks = "message", (chunk.text for chunk in
+                                            get_astrology_response(chart, body["query"], api_key, stream=True))
+            except LLMError as e:
+                event, chunks = "error", [str(e)]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        try:
+            for text in chunks:
+                self.wfile.write(f"event: {event}\ndata: {json.dumps({'text': text})}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            self.wfile.write(b"event: done\ndata: {}\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        except Exception as e:
+            self.wfile.write(f"event: error\ndata: {json.dumps({'text': str(e)})}\n\n".encode("utf-8"))
+
+
+def make_server(host=API_HOST, port=API_PORT, db_conn=None, charts=None):
+    handler = type("BoundApiHandler", (ApiHandler,), {
+        "db_conn": db_conn,
+        "charts": charts or ChartService(),
+        "_auth_cache": {},
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    db_conn = None
+    mongo_uri = os.environ.get("MONGO_URI")
+    if mongo_uri:
+        db_conn = db.connect_mongo(mongo_uri).astrology_app
+    else:
+        db.init_db()
+
+    server = make_server(db_conn=db_conn)
+    print(f"Serving on http://{server.server_address[0]}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.RequestHandlerClass.charts.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,20 @@
 import streamlit as st
 import datetime
-import pandas as pd
-
-import google.generativeai as genai
-from astrology import get_chart_data
-from llm import get_astrology_response
+import io
+import time
+
+from astrology import CHART_ENGINE_VERSION
+from chart_model import Chart, NAKSHATRAS
+import jobs
+import admission
+from chart_render import (VARGA_NAMES, CHART_STYLES, CHART_STYLESHEET,
+                          available_vargas, chart_placements, render_chart_svg)
 import database as db
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-import textwrap
-import pymongo
+import tracing
+
+# Heavy libraries (pandas, numpy, plotly, pymongo, the Gemini client and the
+# chart engine) are imported by the tab or feature that first needs them, so
+# the login screen and cold sessions don't pay for them.
 
 # Page Config
 st.set_page_config(
@@ -22,14 +26,142 @@ st.set_page_config(
 # --- MongoDB Connection ---
 @st.cache_resource
 def init_connection(uri):
-    import certifi
-    return pymongo.MongoClient(
-        uri,
-        tls=True,
-        tlsCAFile=certifi.where(),
-        serverSelectionTimeoutMS=10,
-        retryWrites=False  # Can help with some TLS handshake issues
-    )
+    # Pool sizes, timeouts and read/write concerns: db.MONGO_CLIENT_OPTIONS, overridable with a
+    # [MONGO_OPTIONS] table in secrets
+    options = dict(st.secrets["MONGO_OPTIONS"]) if "MONGO_OPTIONS" in st.secrets else {}
+    return db.connect_mongo(uri, **options)
+
+# --- Background job workers (one pool per server and backend) ---
+@st.cache_resource
+def init_job_workers(mongo_uri):
+    count = int(st.secrets["JOB_WORKERS"]) if "JOB_WORKERS" in st.secrets else jobs.JOB_WORKERS
+    api_key = st.secrets["GEMINI_API_KEY"] if "GEMINI_API_KEY" in st.secrets else None
+    return jobs.start_local_workers(count, mongo_uri, api_key)
+
+# --- Derived chart data, keyed by chart fingerprint (shared across reruns and sessions) ---
+@st.cache_resource(show_spinner=False, max_entries=256)
+def get_chart_analytics(fingerprint, _chart):
+    from chart_analytics import build_chart_analytics
+    return build_chart_analytics(_chart)
+
+@st.cache_resource(show_spinner=False, max_entries=1024)
+def get_balance_figures(fingerprint, varga, _analytics):
+    from chart_analytics import balance_figures
+    return balance_figures(_analytics, varga)
+
+@st.cache_resource(show_spinner=False, max_entries=256)
+def get_chart_variants(fingerprint, _chart):
+    from astrology import get_chart_variants as variants
+    return variants(_chart)
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def get_transits(fingerprint, start, years, _chart):
+    from transits import find_transits
+    return find_transits(_chart, start, years)
+
+# --- Panchanga (the days themselves are cached per location and year in panchanga.py) ---
+@st.cache_data(show_spinner=False, max_entries=64)
+def get_panchanga_days(city, start, end, location):
+    from astrology import get_panchanga
+    return get_panchanga(city, start, end, location)
+
+# --- Birth time sensitivity (the sweep itself takes milliseconds; this spares the geocoding) ---
+@st.cache_data(show_spinner=False, max_entries=256)
+def get_birth_time_sensitivity(dob_str, time_str, city, window, location):
+    from astrology import get_birth_time_sensitivity as sweep
+    return sweep(dob_str, time_str, city, location, window)
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def get_location(city, dob_str):
+    from astrology import get_lat_lon, get_utc_offset
+    lat, lon, timezone_str = get_lat_lon(city)
+    if not lat:
+        return None
+    return lat, lon, get_utc_offset(timezone_str, datetime.datetime.strptime(dob_str, "%Y-%m-%d"))
+
+def render_birth_time_sensitivity(dob, birth_time, city):
+    """Sidebar report of where the key chart factors change around the entered birth time."""
+    window = st.select_slider("Window (± minutes)", [15, 30, 60, 120, 180], value=120, key="sweep_window")
+    if not st.toggle("Show sensitivity", key="sweep_on"):
+        return
+    dob_str = dob.strftime("%Y-%m-%d")
+    # The current chart's stored coordinates spare geocoding when the place and date are unchanged;
+    # otherwise it is done once per city and date, so moving the time re-runs only the sweep
+    birth = st.session_state['chart_data'].birth if st.session_state.get('chart_data') else None
+    same_birth = birth and birth.place == city and birth.moment and birth.moment.date() == dob
+    location = (same_birth and birth.location) or get_location(city, dob_str)
+    if location is None:
+        st.error(f"Could not find location: {city}")
+        return
+    result = get_birth_time_sensitivity(dob_str, birth_time.strftime("%H:%M"), city, window, location)
+    if "error" in result:
+        st.error(result["error"])
+        return
+
+    for factor, info in result["factors"].items():
+        if info["from"] is None and info["until"] is None:
+            span = f"throughout ± {window} min"
+        else:
+            since = info["from"].strftime("%H:%M:%S") if info["from"] else "…"
+            until = info["until"].strftime("%H:%M:%S") if info["until"] else "…"
+            span = f"{since} – {until}"
+        st.markdown(f"**{factor}**: {info['value']}  \n{span}")
+    with st.expander(f"All changes ({len(result['changes'])})"):
+        st.dataframe([{"Time": c["time"].strftime("%H:%M:%S"), "Change": f"{c['factor']}: {c['from']} → {c['to']}"}
+                      for c in result["changes"]], hide_index=True)
+
+def set_chart(data, name):
+    """Make a generated chart (the engine's JSON) current and build its derived data up front."""
+    chart = Chart.from_engine(data)
+    st.session_state['chart_data'] = chart
+    st.session_state['user_name'] = name
+    st.session_state['chart_fingerprint'] = chart.fingerprint
+    get_chart_analytics(chart.fingerprint, chart)
+
+# --- Compatibility candidates ---
+@st.cache_data(show_spinner=False, max_entries=64)
+def get_profile_candidates(_db_conn, username, profiles_key):
+    """Encoded Moon placements of a user's saved charts; profiles_key changes with the profile list."""
+    from matching import encode_profiles
+    placements = db.get_profile_moons(_db_conn, username)
+    return [name for name, _ in placements], encode_profiles(moon for _, moon in placements)
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def parse_candidate_upload(data):
+    from matching import read_candidates_csv
+    return read_candidates_csv(io.BytesIO(data))
+
+# --- Admin: stage timings ---
+def is_admin(username):
+    admins = st.secrets["ADMIN_USERS"] if "ADMIN_USERS" in st.secrets else []
+    if isinstance(admins, str):
+        admins = [a.strip() for a in admins.split(",")]
+    return bool(username) and username in admins
+
+def render_performance_panel():
+    """p50/p95 per pipeline stage in this server process, plus the latest traces."""
+    import pandas as pd
+    stats = tracing.stage_stats()
+    if not stats:
+        st.caption("No timings recorded yet.")
+        return
+    st.dataframe(pd.DataFrame(stats).set_index("stage"), width='stretch')
+
+    traces = tracing.recent_traces()
+    if traces:
+        st.caption("Recent requests")
+        st.dataframe(pd.DataFrame([{"trace": t["trace"], "ms": t["ms"], "spans": len(t["spans"]),
+                                    "at": datetime.datetime.fromtimestamp(t["time"]).strftime("%H:%M:%S")}
+                                   for t in traces]), hide_index=True, width='stretch')
+        with st.expander("Slowest spans of the last request"):
+            spans = sorted(traces[0]["spans"], key=lambda x: x["ms"], reverse=True)[:15]
+            st.dataframe(pd.DataFrame(spans), hide_index=True, width='stretch')
+
+    col_p1, col_p2 = st.columns(2)
+    col_p1.download_button("Prometheus", tracing.prometheus_text(), file_name="metrics.txt", mime="text/plain")
+    if col_p2.button("Reset", key="perf_reset"):
+        tracing.reset()
+        st.rerun()
 
 def main():
     st.title("🕉️ Vedic Astrology AI & Kundli GMT")
@@ -59,20 +191,33 @@ def main():
         else:
             api_key = st.text_input("Gemini API Key", type="password", key="gemini_key_input")
 
-        # Connection Check
+        # Connection Check: liveness is cached (db.mongo_health), and the backend is chosen once per
+        # session and URI, so a slow ping can't move a session to SQLite halfway and split its data
         db_conn = None
         if mongo_uri:
             try:
                 client = init_connection(mongo_uri)
-                client.admin.command('ping')
-                db_conn = client.astrology_app
-                st.success("✅ MongoDB Connected")
+                healthy, error = db.mongo_health(client)
             except Exception as e:
-                st.warning(f"⚠️ MongoDB failed, using SQLite: {str(e)[:50]}...")
-                db_conn = None
+                client, healthy, error = None, False, str(e)
+            if st.session_state.get('db_backend_uri') != mongo_uri:
+                st.session_state['db_backend_uri'] = mongo_uri
+                st.session_state['db_backend'] = "mongo" if healthy else "sqlite"
+
+            if st.session_state['db_backend'] == "mongo" and client is not None:
+                db_conn = client.astrology_app
+                if healthy:
+                    st.success("✅ MongoDB Connected")
+                else:
+                    st.warning(f"⚠️ MongoDB degraded, retrying: {error[:80]}...")
+            else:
+                st.warning("⚠️ MongoDB was unavailable when this session started, so it uses SQLite; "
+                           f"reload the page to retry. {(error or '')[:50]}")
         else:
             st.info("💾 Using local SQLite database")
 
+        init_job_workers(mongo_uri if db_conn is not None else None)
+
     # --- Authentication ---
     if 'username' not in st.session_state:
         st.session_state['username'] = None
@@ -117,21 +262,41 @@ def main():
         st.session_state['messages'] = []
         if 'current_conversation_id' in st.session_state:
              del st.session_state['current_conversation_id']
+        st.session_state.pop('rendered_profile', None)
+        st.session_state.pop('chart_fingerprint', None)
+        st.session_state.pop('db_backend_uri', None)
         st.rerun()
 
     # Sidebar: Saved Profiles
     st.sidebar.subheader("📂 Saved Profiles")
     profiles = db.get_user_profiles(db_conn, st.session_state['username'])
     if profiles:
-        selected_profile = st.sidebar.selectbox("Load Profile", ["Select..."] + [f"{p[0]} ({p[3]})" for p in profiles])
-        if selected_profile != "Select...":
-             # Find profile data
-             # Format: name, dob, tob, city
-             p_name_label = selected_profile.split(" (")[0]
-             for p in profiles:
-                 if p[0] == p_name_label:
-                     st.session_state['loaded_profile'] = p
-                     break
+        # Options are the profiles themselves: names (and even labels) may repeat
+        # Format: name, dob, tob, city
+        selected_profile = st.sidebar.selectbox(
+            "Load Profile", [None] + [tuple(p) for p in profiles],
+            format_func=lambda p: "Select..." if p is None else f"{p[0]} ({p[3]})")
+        if selected_profile is not None:
+             st.session_state['loaded_profile'] = selected_profile
+
+             # Render straight from storage when the selection changes
+             if st.session_state.get('rendered_profile') != selected_profile:
+                 st.session_state['rendered_profile'] = selected_profile
+                 lp = st.session_state['loaded_profile']
+                 stored = db.get_profile_chart(db_conn, st.session_state['username'], lp)
+                 if stored and stored["chart"] and stored["chart_version"] == CHART_ENGINE_VERSION:
+                     set_chart(stored["chart"], lp[0])
+                 else:
+                     # Legacy row or stale engine version: recompute once in the background
+                     # (reusing the stored coordinates when we have them) and backfill storage
+                     location = None
+                     if stored and stored["lat"] is not None:
+                         location = (stored["lat"], stored["lon"], stored["tz_offset"])
+                     st.session_state['chart_job'] = {
+                         "id": db.submit_job(db_conn, st.session_state['username'], "chart", {
+                             "name": lp[0], "dob": lp[1], "tob": lp[2], "city": lp[3],
+                             "location": location, "update_profile": list(lp)}),
+                         "name": lp[0], "save": False}
     
     # Main Input Form
     with st.sidebar:
@@ -163,6 +328,10 @@ def main():
         birth_time = st.time_input("Time of Birth", value=def_time)
         city = st.text_input("City of Birth", value=def_city)
 
+        with st.expander("⏱️ Birth time sensitivity"):
+            if city:
+                render_birth_time_sensitivity(dob, birth_time, city)
+
         save_checkbox = st.checkbox("Save Profile after Generation")
         generate_btn = st.button("Generate Birth Chart", type="primary")
 
@@ -171,58 +340,75 @@ def main():
         if st.button("🗑️ Clear Chat History"):
              db.clear_chat_history(db_conn, st.session_state['username'])
              st.session_state["messages"] = []
+             st.session_state['current_conversation_id'] = None
              st.success("Chat history cleared!")
              st.rerun()
 
-    # Cached wrapper for chart generation
-    @st.cache_data(show_spinner=False)
-    def cached_get_chart_data(name, dob_str, time_str, city):
-        return get_chart_data(name, dob_str, time_str, city)
-
     if generate_btn:
         if not city:
             st.error("Please enter a city.")
         else:
-            with st.spinner("Calculating planetary positions..."):
-                dob_str = dob.strftime("%Y-%m-%d")
-                time_str = birth_time.strftime("%H:%M")
-                
-                # Save to DB if requested
-                if save_checkbox:
-                    db.save_profile(db_conn, st.session_state['username'], name, dob_str, time_str, city)
-                    st.sidebar.success(f"Profile '{name}' saved!")
-                
-                # Use cached function
-                data = cached_get_chart_data(name, dob_str, time_str, city)
-                
-                if "error" in data:
-                    st.error(f"Error: {data['error']}")
-                else:
-                    st.session_state['chart_data'] = data
-                    st.session_state['user_name'] = name
-                    st.success("Birth Chart Generated Successfully!")
+            dob_str = dob.strftime("%Y-%m-%d")
+            time_str = birth_time.strftime("%H:%M")
+            # Computed by a background worker (which also saves the profile if
+            # requested); chart_job_status() below polls for the result
+            st.session_state['chart_job'] = {
+                "id": db.submit_job(db_conn, st.session_state['username'], "chart", {
+                    "name": name, "dob": dob_str, "tob": time_str, "city": city, "save": save_checkbox}),
+                "name": name, "save": save_checkbox}
+
+    if st.session_state.get('chart_job'):
+        @st.fragment(run_every=jobs.POLL_INTERVAL * 2)
+        def chart_job_status():
+            pending = st.session_state.get('chart_job')
+            if not pending:
+                return
+            job = db.get_job(db_conn, pending["id"], st.session_state['username'])
+            if job and job["status"] in ("queued", "running"):
+                st.info("⏳ Calculating planetary positions...")
+                return
+            st.session_state.pop('chart_job', None)
+            tracing.merge(job and job["trace"])
+            if job is None or job["status"] == "failed":
+                st.session_state['chart_job_error'] = job["error"] if job else "The chart job was lost."
+            else:
+                if pending["save"]:
+                    db.invalidate_read_cache(db_conn, "profiles", st.session_state['username'])
+                    st.toast(f"Profile '{pending['name']}' saved!")
+                set_chart(job["result"], pending["name"])
+                st.toast("Birth Chart Generated Successfully!")
+            st.rerun()
+
+        chart_job_status()
+
+    if st.session_state.get('chart_job_error'):
+        st.error(f"Error: {st.session_state.pop('chart_job_error')}")
 
     # Main Content Area
     if st.session_state['chart_data']:
         chart = st.session_state['chart_data']
+        if not st.session_state.get('chart_fingerprint'):
+            st.session_state['chart_fingerprint'] = chart.fingerprint
+        analytics = get_chart_analytics(st.session_state['chart_fingerprint'], chart)
         
         # Top-level Navigation
         selected_tab = st.radio(
             "Navigation", 
-            ["📊 Charts", "⏳ Dasha Timeline", "💬 Ask Astrologer"], 
+            ["📊 Charts", "⏳ Dasha Timeline", "🗓️ Panchanga", "💞 Compatibility", "💬 Ask Astrologer"], 
             horizontal=True,
             label_visibility="collapsed"
         )
         st.divider()
 
         if selected_tab == "📊 Charts":
+            import pandas as pd
             st.subheader(f"✨ Birth Details for {st.session_state['user_name']}")
              # Top Section: Panchanga & Basic Info
             with st.container():
                 col1, col2, col3, col4 = st.columns(4)
                 
-                if "user_details" in chart:
-                    ud = chart["user_details"]
+                ud = chart.details
+                if ud:
                     col1.metric("Nakshatra", ud.get('nakshatra', 'Unknown'), ud.get('rashi', ''))
                     col2.metric("Tithi", ud.get('tithi', 'Unknown'))
                     col3.metric("Yoga", ud.get('yoga', 'Unknown'))
@@ -232,36 +418,21 @@ def main():
             st.header("Divisional Charts")
             
             # Identify available charts
-            available_charts = []
-            if "D1" in chart: available_charts.append("D1 (Rasi)")
-            if "special_points" in chart and "sphuta" in chart["special_points"]:
-                sphuta = chart["special_points"]["sphuta"]
-                for k in sphuta.keys():
-                    if k.startswith("D") and k not in available_charts:
-                         available_charts.append(k)
+            vargas = available_vargas(chart) or ["D1"]
+            varga_label = lambda v: f"{v} ({VARGA_NAMES[v]})" if v in VARGA_NAMES else v
             
             # User selector
-            selected_chart_name = st.selectbox("Select Chart", available_charts if available_charts else ["D1"])
+            selected_chart_name = st.selectbox("Select Chart", vargas, format_func=varga_label)
             
             chart_planets = []
-            
-            if selected_chart_name == "D1 (Rasi)" or selected_chart_name == "D1":
-                if "D1" in chart and "planets" in chart["D1"]:
-                    for p, details in chart["D1"]["planets"].items():
-                        chart_planets.append({
-                            "Planet": p,
-                            "Sign": details.get('sign'),
-                            "House": details.get('house'),
-                            "Nakshatra": details.get('nakshatra'),
-                        })
-            else:
-                st.warning(f"Detailed planetary positions for {selected_chart_name} might not be fully parsed in this version. Showing Lagna/Points if available.")
-                if "special_points" in chart and "sphuta" in chart["special_points"]:
-                     sp = chart["special_points"]["sphuta"]
-                     # Clean name
-                     key = selected_chart_name.split()[0]
-                     if key in sp:
-                         st.write(sp[key])
+            varga_data = chart.varga(selected_chart_name)
+            for p, details in (varga_data.planets if varga_data else {}).items():
+                chart_planets.append({
+                    "Planet": p,
+                    "Sign": details.sign.label,
+                    "House": details.house,
+                    "Nakshatra": details.nakshatra.label,
+                })
 
             if chart_planets:
                 st.subheader("📋 Planetary Details Table")
@@ -269,164 +440,30 @@ def main():
                 st.table(df_planets)
                 
             # Ascendant Detail
-            if "D1" in chart and "ascendant" in chart["D1"]:
-                 st.caption(f"Ascendant Details: {chart['D1']['ascendant']}")
-
-            # Prepare data for South Indian Chart (moved calculation here)
-            sign_order = ["Aries", "Taurus", "Gemini", "Cancer", "Leo", "Virgo", "Libra", "Scorpio", "Sagittarius", "Capricorn", "Aquarius", "Pisces"]
-            sign_counts = {s: [] for s in sign_order}
-            
-            # Add Ascendant
-            if "D1" in chart and "ascendant" in chart["D1"]:
-                asc_sign = chart["D1"]["ascendant"]["sign"]
-                if asc_sign in sign_counts:
-                    sign_counts[asc_sign].append("As")
-            
-            # Add Planets
-            current_planets_list = []
-            if chart_planets: # From the selection logic above
-                for p in chart_planets: # p is dict
-                    s = p["Sign"]
-                    planet_name = p["Planet"]
-                    # Shorten names for chart
-                    short_name = planet_name[:2]
-                    if planet_name == "Jupiter": short_name = "Ju"
-                    elif planet_name == "Mars": short_name = "Ma"
-                    elif planet_name == "Mercury": short_name = "Me"
-                    elif planet_name == "Venus": short_name = "Ve"
-                    elif planet_name == "Saturn": short_name = "Sa"
-                    elif planet_name == "Moon": short_name = "Mo"
-                    elif planet_name == "Sun": short_name = "Su"
-                    elif planet_name == "Rahu": short_name = "Ra"
-                    elif planet_name == "Ketu": short_name = "Ke"
-                    
-                    if s in sign_counts:
-                        sign_counts[s].append(short_name)
-                    
-                    current_planets_list.append({"Planet": planet_name, "Sign": s})
+            if varga_data and varga_data.ascendant:
+                 asc = varga_data.ascendant
+                 st.caption(f"Ascendant: {asc.sign.label} {asc.degree:.2f}° · "
+                            f"{asc.nakshatra.label} (pada {asc.pada})")
 
             # --- Visualizations Moved to Bottom ---
             st.divider()
             st.subheader("🎨 Visual Chart Representation")
             
-            # Helper: Sign Mapping
-            element_map = {"Fire": [0, 4, 8], "Earth": [1, 5, 9], "Air": [2, 6, 10], "Water": [3, 7, 11]}
-            modality_map = {"Cardinal": [0, 3, 6, 9], "Fixed": [1, 4, 7, 10], "Mutable": [2, 5, 8, 11]}
-            
-            # South Indian Chart HTML Generator
-            def get_content(sign_name):
-                 return ", ".join(sign_counts.get(sign_name, []))
-
-            html_chart = f"""
-            <style>
-                .chart-grid {{ 
-                    display: grid; 
-                    grid-template-columns: 1fr 1fr 1fr 1fr; 
-                    grid-template-rows: 100px 100px 100px 100px; 
-                    gap: 2px; 
-                    background-color: #000; 
-                    border: 2px solid #000; 
-                    width: 100%; 
-                    max-width: 500px; 
-                    margin: auto; 
-                }}
-                .chart-box {{ 
-                    background-color: #ffffff; 
-                    color: #000000; 
-                    padding: 5px; 
-                    font-size: 14px; 
-                    display: flex; 
-                    flex-direction: column; 
-                    justify-content: center; 
-                    align-items: center; 
-                    text-align: center; 
-                    border: 1px solid #ccc; 
-                    position: relative; 
-                    transition: background-color 0.3s ease, color 0.3s ease;
-                }}
-                .chart-label {{ 
-                    font-size: 10px; 
-                    color: #555; 
-                    position: absolute; 
-                    top: 2px; 
-                    left: 2px; 
-                    text-transform: uppercase; 
-                }}
-                .chart-content {{ 
-                    font-weight: bold; 
-                    color: #d62728; 
-                }}
-                .center-box {{ 
-                    grid-column: 2 / 4; 
-                    grid-row: 2 / 4; 
-                    background-color: #ffffff; 
-                    display: flex; 
-                    justify-content: center; 
-                    align-items: center; 
-                    font-style: italic; 
-                    color: #333; 
-                    transition: background-color 0.3s ease, color 0.3s ease;
-                }}
-                @media (prefers-color-scheme: dark) {{
-                    .chart-grid {{
-                        background-color: #1a1a1a;
-                        border-color: #333;
-                    }}
-                    .chart-box {{
-                        background-color: #2a2a2a;
-                        color: #e0e0e0;
-                        border-color: #444;
-                    }}
-                    .chart-label {{
-                        color: #aaa;
-                    }}
-                    .chart-content {{
-                        color: #ff6b6b;
-                    }}
-                    .center-box {{
-                        background-color: #2a2a2a;
-                        color: #d0d0d0;
-                    }}
-                }}
-                [data-theme="dark"] .chart-grid {{
-                    background-color: #1a1a1a;
-                    border-color: #333;
-                }}
-                [data-theme="dark"] .chart-box {{
-                    background-color: #2a2a2a;
-                    color: #e0e0e0;
-                    border-color: #444;
-                }}
-                [data-theme="dark"] .chart-label {{
-                    color: #aaa;
-                }}
-                [data-theme="dark"] .chart-content {{
-                    color: #ff6b6b;
-                }}
-                [data-theme="dark"] .center-box {{
-                    background-color: #2a2a2a;
-                    color: #d0d0d0;
-                }}
-            </style>
-            <div class="chart-grid">
-                <div class="chart-box"><span class="chart-label">Pisces</span><div class="chart-content">{get_content('Pisces')}</div></div>
-                <div class="chart-box"><span class="chart-label">Aries</span><div class="chart-content">{get_content('Aries')}</div></div>
-                <div class="chart-box"><span class="chart-label">Taurus</span><div class="chart-content">{get_content('Taurus')}</div></div>
-                <div class="chart-box"><span class="chart-label">Gemini</span><div class="chart-content">{get_content('Gemini')}</div></div>
-                <div class="chart-box"><span class="chart-label">Aquarius</span><div class="chart-content">{get_content('Aquarius')}</div></div>
-                <div class="center-box">South Indian Chart</div>
-                <div class="chart-box"><span class="chart-label">Cancer</span><div class="chart-content">{get_content('Cancer')}</div></div>
-                <div class="chart-box"><span class="chart-label">Capricorn</span><div class="chart-content">{get_content('Capricorn')}</div></div>
-                <div class="chart-box"><span class="chart-label">Leo</span><div class="chart-content">{get_content('Leo')}</div></div>
-                <div class="chart-box"><span class="chart-label">Sagittarius</span><div class="chart-content">{get_content('Sagittarius')}</div></div>
-                <div class="chart-box"><span class="chart-label">Scorpio</span><div class="chart-content">{get_content('Scorpio')}</div></div>
-                <div class="chart-box"><span class="chart-label">Libra</span><div class="chart-content">{get_content('Libra')}</div></div>
-                <div class="chart-box"><span class="chart-label">Virgo</span><div class="chart-content">{get_content('Virgo')}</div></div>
-            </div>
-            """
-            st.markdown(html_chart, unsafe_allow_html=True)
-            st.caption("South Indian style chart (adapts to light/dark mode). 'As' denotes Ascendant.")
-            # st.info("Visual Chart disabled for debugging (checking layout issues).")
+            col_style, col_vargas = st.columns([1, 3])
+            chart_style = col_style.radio("Style", CHART_STYLES, key="chart_style")
+            default_vargas = [v for v in dict.fromkeys([selected_chart_name, "D9"]) if v in vargas]
+            shown_vargas = col_vargas.multiselect("Charts to show", vargas, default=default_vargas,
+                                                  format_func=varga_label)
+
+            # Stylesheet once per page, then one memoized SVG per chart
+            st.markdown(CHART_STYLESHEET, unsafe_allow_html=True)
+            if shown_vargas:
+                chart_cols = st.columns(min(len(shown_vargas), 3))
+                for i, v in enumerate(shown_vargas):
+                    with chart_cols[i % len(chart_cols)]:
+                        svg = render_chart_svg(chart_placements(chart, v), chart_style, varga_label(v))
+                        st.markdown(svg, unsafe_allow_html=True)
+            st.caption("Charts adapt to light/dark mode. 'As' denotes Ascendant; North Indian charts number the sign in each house.")
             
             st.divider()
             
@@ -434,103 +471,190 @@ def main():
             st.subheader("📈 Elemental & Modal Analysis")
             col_g1, col_g2 = st.columns(2)
             
-            # Calculate Element Distribution
-            element_counts = {"Fire": 0, "Earth": 0, "Air": 0, "Water": 0}
-            modality_counts = {"Cardinal": 0, "Fixed": 0, "Mutable": 0}
-            
-            # Use current_planets_list from above
-            for p in current_planets_list:
-                s = p["Sign"]
-                if s in sign_order:
-                    idx = sign_order.index(s)
-                    
-                    # Element
-                    for elem, indices in element_map.items():
-                        if idx in indices:
-                            element_counts[elem] += 1
-                            
-                     # Modality
-                    for mod, indices in modality_map.items():
-                        if idx in indices:
-                            modality_counts[mod] += 1
+            if selected_chart_name in analytics["elements"].index:
+                fig_elem, fig_mod = get_balance_figures(st.session_state['chart_fingerprint'],
+                                                        selected_chart_name, analytics)
                             
-            with col_g1:
-                # Donut Chart for Elements
-                fig_elem = px.pie(names=list(element_counts.keys()), values=list(element_counts.values()), hole=0.4, title="Elemental Balance")
-                fig_elem.update_traces(textinfo='percent+label')
-                st.plotly_chart(fig_elem, width='stretch')
-                with st.expander("What is Elemental Balance?"):
-                    st.write("Fire (Energy), Earth (Stability), Air (Intellect), Water (Emotion)")
-            
-            with col_g2:
-                 # Bar Chart for Modalities
-                 fig_mod = px.bar(x=list(modality_counts.keys()), y=list(modality_counts.values()), title="Modality Distribution", color=list(modality_counts.keys()))
-                 st.plotly_chart(fig_mod, width='stretch')
-                 with st.expander("What is Modality?"):
-                    st.write("Cardinal (Leaders), Fixed (Stabilizers), Mutable (Adaptable)")
+                with col_g1:
+                    # Donut Chart for Elements
+                    st.plotly_chart(fig_elem, width='stretch')
+                    with st.expander("What is Elemental Balance?"):
+                        st.write("Fire (Energy), Earth (Stability), Air (Intellect), Water (Emotion)")
+                
+                with col_g2:
+                     # Bar Chart for Modalities
+                     st.plotly_chart(fig_mod, width='stretch')
+                     with st.expander("What is Modality?"):
+                        st.write("Cardinal (Leaders), Fixed (Stabilizers), Mutable (Adaptable)")
+
+            # --- Strength ---
+            st.divider()
+            st.subheader("💪 Ashtakavarga & Shadbala")
+            st.markdown("**Ashtakavarga** (bindus per sign, from the D1 chart)")
+            st.dataframe(analytics["ashtakavarga"], width='stretch')
+            st.markdown("**Shadbala** (virupas; 60 virupas = 1 rupa)")
+            st.dataframe(analytics["shadbala"].style.format("{:.2f}"), width='stretch')
+            st.caption("The component rows are those that follow from planet positions: Sthana bala "
+                       "(Uchcha, Saptavargaja, Ojhayugma, Kendradi, Drekkana), Dig, Paksha, Natonnata and "
+                       "Naisargika. Chesta, Drik, Ayana and the Kala balas of the ruling lords are not among "
+                       "them, so they don't add up to the totals, which are the chart engine's full Shadbala.")
+
+            # --- Ayanamsa & house system comparison ---
+            st.divider()
+            st.subheader("🔀 Ayanamsa & House System Comparison")
+            chart_variants = get_chart_variants(st.session_state['chart_fingerprint'], chart)
+            if "error" in chart_variants:
+                st.info(chart_variants["error"])
+            else:
+                from chart_analytics import variant_frames
+                from variants import AYANAMSA_LABELS, HOUSE_SYSTEMS
+                col_ayan, col_houses = st.columns(2)
+                ayanamsas = col_ayan.multiselect("Ayanamsas", list(AYANAMSA_LABELS), default=list(AYANAMSA_LABELS),
+                                                 format_func=AYANAMSA_LABELS.get, key="variant_ayanamsas")
+                systems = col_houses.multiselect("House systems", list(HOUSE_SYSTEMS),
+                                                 default=["Whole sign", "Placidus"], key="variant_houses")
+                if ayanamsas:
+                    positions, houses, differs = variant_frames(chart_variants, ayanamsas, systems)
+                    offsets = dict(zip(chart_variants["ayanamsas"], chart_variants["ayanamsa"]))
+                    st.caption("Ayanamsa at birth: " + ", ".join(
+                        f"{AYANAMSA_LABELS[m]} {offsets[m]:.4f}°" for m in ayanamsas))
+                    st.dataframe(positions, width='stretch')
+                    if differs:
+                        st.warning(f"Sign or nakshatra differs between these ayanamsas for: {', '.join(differs)}")
+                    if systems:
+                        st.markdown("**House** of each point")
+                        st.dataframe(houses, width='stretch')
 
         elif selected_tab == "⏳ Dasha Timeline":
             st.header("Vimshottari Dasha Timeline")
             
-            if "dasha" in chart and "Vimshottari" in chart["dasha"]:
-                dasha_dict = chart["dasha"]["Vimshottari"]
-                
-                timeline_data = []
+            df_dasha = analytics["dasha"]
+            if not df_dasha.empty:
+                st.write("### 📅 Detailed Dasha Periods (Antardashas)")
+                st.plotly_chart(analytics["dasha_figure"], width='stretch')
                 
-                for key, val in dasha_dict.items():
-                    if isinstance(val, dict) and "startDate" in val:
-                        segments = key.split('-')
-                        level = len(segments)
-                        
-                        start = pd.to_datetime(val["startDate"])
-                        end = pd.to_datetime(val["endDate"])
-                        
-                        if level == 2:
-                            major_lord = segments[0]
-                            sub_lord = segments[1]
-                            timeline_data.append({
-                                "Period": f"{major_lord} - {sub_lord}",
-                                "Start": start,
-                                "Finish": end,
-                                "Major Lord": major_lord,
-                                "Sub Lord": sub_lord
-                            })
-                
-                if not timeline_data:
-                     for key, val in dasha_dict.items():
-                         if "startDate" in val:
-                             segments = key.split('-')
-                             if len(segments) > 1: # At least L2
-                                start = pd.to_datetime(val["startDate"])
-                                end = pd.to_datetime(val["endDate"])
-                                timeline_data.append({
-                                    "Period": key,
-                                    "Start": start,
-                                    "Finish": end,
-                                    "Major Lord": segments[0],
-                                    "Sub Lord": segments[1] if len(segments) > 1 else segments[0]
-                                })
-                
-                if timeline_data:
-                    df_dasha = pd.DataFrame(timeline_data)
-                    df_dasha = df_dasha.sort_values("Start")
-                    
-                    st.write("### 📅 Detailed Dasha Periods (Antardashas)")
-                    fig = px.timeline(df_dasha, x_start="Start", x_end="Finish", y="Major Lord", color="Sub Lord", hover_name="Period", title="Vimshottari Dasha (Mahadasha > Antardasha)")
-                    fig.update_yaxes(categoryorder="category ascending")
-                    st.plotly_chart(fig, width='stretch')
-                    
-                    with st.expander("View Dasha Table"):
-                        st.dataframe(df_dasha[["Major Lord", "Sub Lord", "Start", "Finish"]])
+                with st.expander("View Dasha Table"):
+                    st.dataframe(df_dasha[["Major Lord", "Sub Lord", "Start", "Finish"]])
 
-                    st.subheader("Current Dasha")
-                    if "current" in chart["dasha"]:
-                        st.json(chart["dasha"]["current"])
-                else:
-                    st.info("No detailed dasha data available.")
+                st.subheader("Current Dasha")
+                if analytics["current_dasha"]:
+                    st.json(analytics["current_dasha"])
             else:
                  st.info("Dasha data not available.")
 
+            from transits import TRANSIT_PLANETS, SLOW_PLANETS, highlights
+            st.subheader("🪐 Transits")
+            col_years, col_planets, col_events = st.columns([1, 2, 2])
+            years = col_years.selectbox("Years ahead", [1, 2, 5, 10, 20], index=2, key="transit_years")
+            planets = col_planets.multiselect("Planets", TRANSIT_PLANETS, default=list(SLOW_PLANETS),
+                                              key="transit_planets")
+            kinds = col_events.multiselect("Events", ["Ingress", "Station", "Conjunction"],
+                                           default=["Ingress", "Station", "Conjunction"], key="transit_kinds")
+            today = datetime.datetime.now(datetime.timezone.utc).date()
+            with st.spinner("Finding transits..."):
+                events = get_transits(st.session_state['chart_fingerprint'], today, years, chart)
+            key_dates = highlights(chart, events)
+            if key_dates:
+                st.info("\n".join(f"- {line}" for line in key_dates))
+            rows = [{"Date (UTC)": e["date"], "Planet": e["planet"], "Event": e["event"], "Details": e["description"]}
+                    for e in events if e["planet"] in planets and e["event"] in kinds]
+            st.dataframe(rows, hide_index=True, width='stretch')
+            st.caption("Sidereal (Lahiri) positions. Conjunctions are transiting planets crossing "
+                       "the exact degree of a natal point.")
+
+        elif selected_tab == "🗓️ Panchanga":
+            import pandas as pd
+            from panchanga import TITHI_NAMES, WEEKDAYS
+            st.header("Panchanga Calendar")
+
+            birth_place = chart.birth.place
+            col_city, col_start, col_end = st.columns([2, 1, 1])
+            city = col_city.text_input("Place", value=birth_place, key="panchanga_city").strip()
+            today = datetime.date.today()
+            start = col_start.date_input("From", today, key="panchanga_start")
+            end = col_end.date_input("To", today + datetime.timedelta(days=30), key="panchanga_end")
+
+            # The birth place's stored coordinates spare a geocoding round trip
+            location = chart.birth.location if city == birth_place else None
+            with st.spinner("Calculating Panchanga..."):
+                result = get_panchanga_days(city, start, end, location)
+
+            if "error" in result:
+                st.error(result["error"])
+            else:
+                days = result["days"]
+                with st.expander("🔍 Find days"):
+                    col_t, col_n, col_w = st.columns(3)
+                    tithis = col_t.multiselect("Tithi", TITHI_NAMES, key="panchanga_tithis")
+                    nakshatras = col_n.multiselect("Nakshatra", NAKSHATRAS, key="panchanga_nakshatras")
+                    weekdays = col_w.multiselect("Weekday", WEEKDAYS, key="panchanga_weekdays")
+                mask = pd.Series(True, index=days.index)
+                for column, chosen in (("tithi", tithis), ("nakshatra", nakshatras), ("weekday", weekdays)):
+                    if chosen:
+                        mask &= days[column].isin(chosen)
+                shown = days[mask]
+
+                hhmm = lambda col: shown[col].dt.strftime("%H:%M")
+                ends = lambda col: shown[col].dt.strftime("%d %b %H:%M")
+                st.dataframe({
+                    "Date": shown["date"], "Day": shown["weekday"],
+                    "Sunrise": hhmm("sunrise"), "Sunset": hhmm("sunset"),
+                    "Rahu Kalam": hhmm("rahu_kalam_start") + "–" + hhmm("rahu_kalam_end"),
+                    "Tithi": shown["tithi"], "Tithi ends": ends("tithi_ends"),
+                    "Nakshatra": shown["nakshatra"], "Nakshatra ends": ends("nakshatra_ends"),
+                    "Yoga": shown["yoga"], "Karana": shown["karana"],
+                }, hide_index=True, width='stretch')
+                tz = result["timezone"]
+                st.caption(f"{len(shown)} of {len(days)} days at {result['lat']:.2f}, {result['lon']:.2f}. "
+                           f"Times are local ({tz if isinstance(tz, str) else f'UTC{tz:+g}'}); tithi, "
+                           "nakshatra, yoga and karana are those prevailing at sunrise.")
+
+        elif selected_tab == "💞 Compatibility":
+            from matching import moon_profile, rank_matches
+            st.header("Kundli Matching (Ashtakoota)")
+            subject = moon_profile(chart)
+            if not subject:
+                st.info("Moon placement not available for this chart.")
+            else:
+                col_m1, col_m2 = st.columns(2)
+                with col_m1:
+                    role = st.radio("Match as", ["Groom", "Bride"], horizontal=True, key="match_role")
+                with col_m2:
+                    source = st.radio("Candidates", ["Saved Profiles", "Upload List"], horizontal=True,
+                                      key="match_source")
+
+                names, candidates = [], None
+                if source == "Saved Profiles":
+                    names, candidates = get_profile_candidates(db_conn, st.session_state['username'],
+                                                               tuple(map(tuple, profiles or [])))
+                    # Don't match the chart against its own saved profile
+                    keep = [i for i, n in enumerate(names) if n != st.session_state['user_name']]
+                    names = [names[i] for i in keep]
+                    candidates = {k: v[keep] for k, v in candidates.items()}
+                    if not names:
+                        st.info("No other saved profiles with stored charts to match against.")
+                else:
+                    upload = st.file_uploader("Candidate list (CSV)", type="csv",
+                                              help="Columns: name, nakshatra, sign (Moon nakshatra and sign), "
+                                                   "optional manglik (yes/no)")
+                    if upload:
+                        try:
+                            names, candidates, skipped = parse_candidate_upload(upload.getvalue())
+                            if skipped:
+                                st.warning(f"Skipped {len(skipped)} row(s) with an unrecognised nakshatra or "
+                                           f"sign (rows {', '.join(map(str, skipped[:10]))}"
+                                           f"{'...' if len(skipped) > 10 else ''}).")
+                        except ValueError as e:
+                            st.error(f"Error: {e}")
+
+                if names:
+                    df_match = rank_matches(subject, names, candidates, subject_is_groom=(role == "Groom"))
+                    st.caption(f"{len(df_match)} candidates ranked by Guna score (out of 36), "
+                               "then by number of doshas. 18+ is traditionally considered acceptable.")
+                    st.dataframe(df_match, width='stretch')
+                    st.download_button("Download Results (CSV)", df_match.to_csv(index_label="Rank"),
+                                       file_name="matches.csv", mime="text/csv")
+
         elif selected_tab == "💬 Ask Astrologer":
             st.header("Ask the AI Astrologer")
             st.markdown(f"Ask questions based on **{st.session_state['user_name']}'s** chart.")
@@ -585,13 +709,44 @@ def main():
                             st.rerun()
                             
                         if st.button("🗑️ Delete Current", type="primary", use_container_width=True):
-                            db.delete_conversation(db_conn, st.session_state['current_conversation_id'])
+                            db.delete_conversation(db_conn, st.session_state['current_conversation_id'], st.session_state['username'])
                             st.session_state['current_conversation_id'] = None
                             st.success("Deleted!")
                             st.rerun()
                     else:
                         st.caption("No history.")
 
+                    # Search across all of this user's conversations
+                    search_query = st.text_input("🔍 Search chats", key="chat_search_query")
+                    if search_query:
+                        if st.session_state.get('chat_search_last') != search_query:
+                            st.session_state['chat_search_last'] = search_query
+                            st.session_state['chat_search_page'] = 0
+                        page = st.session_state.get('chat_search_page', 0)
+                        page_size = 10
+                        results = db.search_chats(db_conn, st.session_state['username'], search_query,
+                                                  limit=page_size + 1, offset=page * page_size)
+
+                        def open_conversation(conv_id):
+                            st.session_state['current_conversation_id'] = conv_id
+                            st.session_state['conv_selector'] = conv_id
+
+                        if not results:
+                            st.caption("No matches.")
+                        for i, r in enumerate(results[:page_size]):
+                            st.markdown(f"**{r['title'] or 'Untitled'}** · {r['role']} · {r['timestamp'][:10]}")
+                            st.caption(r['snippet'])
+                            st.button("Open", key=f"search_open_{page}_{i}",
+                                      on_click=open_conversation, args=(r['conversation_id'],))
+
+                        col_prev, col_next = st.columns(2)
+                        if page > 0 and col_prev.button("← Prev", key="search_prev"):
+                            st.session_state['chat_search_page'] = page - 1
+                            st.rerun()
+                        if len(results) > page_size and col_next.button("Next →", key="search_next"):
+                            st.session_state['chat_search_page'] = page + 1
+                            st.rerun()
+
                 # --- Chat Interface ---
                 
                 # Verify we have a valid Conversation ID, if not create/reset
@@ -611,47 +766,109 @@ def main():
                 for msg in st.session_state["messages"]:
                     st.chat_message(msg["role"]).write(msg["content"])
 
-                if prompt := st.chat_input("Ask about career, marriage, health, etc..."):
-                    
+                # Replies are generated by a background worker, which saves them to the
+                # conversation; poll until it finishes and then reload the history
+                pending_reply = st.session_state.get('reply_job')
+                if pending_reply and pending_reply["conversation_id"] == st.session_state.get('current_conversation_id'):
+                    @st.fragment(run_every=jobs.POLL_INTERVAL * 2)
+                    def reply_job_status():
+                        job = db.get_job(db_conn, pending_reply["id"], st.session_state['username'])
+                        if job and job["status"] in ("queued", "running"):
+                            wait = (pending_reply.get("run_after") or 0) - time.time()
+                            with st.chat_message("assistant"):
+                                if job["status"] == "queued" and wait > 1:
+                                    st.markdown(f"⏳ In the queue, starting in about {wait:.0f} seconds...")
+                                else:
+                                    st.markdown("✨ Consulting the stars...")
+                            return
+                        st.session_state.pop('reply_job', None)
+                        tracing.merge(job and job["trace"])
+                        if job is None or job["status"] == "failed":
+                            # Errors are not saved to DB
+                            st.session_state['reply_error'] = job["error"] if job else "The reply job was lost."
+                        elif job["result"] and pending_reply.get("query"):
+                            admission.remember_reply(st.session_state['chart_data'], pending_reply["query"],
+                                                     job["result"]["text"])
+                        st.rerun()
+
+                    reply_job_status()
+
+                if st.session_state.get('reply_error'):
+                    st.chat_message("assistant").error(st.session_state.pop('reply_error'))
+                if st.session_state.get('reply_limited'):
+                    st.chat_message("assistant").warning(st.session_state.pop('reply_limited'))
+
+                def answer_inline(query, run_after):
+                    # No local workers to hand the user's key to (JOB_WORKERS = 0): answer in this run
+                    from llm import get_astrology_response, LLMError
+                    with st.spinner("✨ Consulting the stars..."):
+                        if run_after:
+                            time.sleep(max(0.0, run_after - time.time()))
+                        try:
+                            text = get_astrology_response(st.session_state['chart_data'], query, api_key)
+                        except LLMError as e:
+                            st.session_state['reply_error'] = str(e)
+                            return
+                    db.save_chat(db_conn, st.session_state['username'], "assistant", text,
+                                 st.session_state['current_conversation_id'])
+                    admission.remember_reply(st.session_state['chart_data'], query, text)
+
+                def ask(prompt, query, title):
+                    # Factual and repeated questions are answered without Gemini, so they skip the rate limits
+                    priority = admission.priority_reply(st.session_state['chart_data'], query)
+                    if priority is None:
+                        admitted = admission.admit(db_conn, st.session_state['username'])
+                        if not admitted.granted:
+                            st.session_state['reply_limited'] = admission.retry_message(admitted)
+                            st.rerun()
+
                     # Auto-create conversation if needed
                     if not st.session_state.get('current_conversation_id'):
-                        # Use first few words as title
-                        title = (prompt[:30] + '..') if len(prompt) > 30 else prompt
-                        new_id = db.create_conversation(db_conn, st.session_state['username'], title)
-                        st.session_state['current_conversation_id'] = new_id
-                        st.rerun() # Rerun to refresh sidebar list logic
+                        st.session_state['current_conversation_id'] = db.create_conversation(
+                            db_conn, st.session_state['username'], title)
 
-                    st.chat_message("user").write(prompt)
-                    st.session_state["messages"].append({"role": "user", "content": prompt})
-                    
-                    # Save user message
+                    # Save user message, then answer directly or queue the reply
                     db.save_chat(db_conn, st.session_state['username'], "user", prompt, st.session_state['current_conversation_id'])
-                    
-                    # Display assistant response with streaming
-                    with st.chat_message("assistant"):
-                        message_placeholder = st.empty()
-                        full_response = ""
-                        
-                        try:
-                            with st.spinner("Consulting the stars..."):
-                                # Synchronous call as requested
-                                full_response = get_astrology_response(st.session_state['chart_data'], prompt, api_key)
-                                message_placeholder.markdown(full_response)
-                            
-                            # Save assistant response only if valid
-                            if not full_response.startswith("Error"):
-                                db.save_chat(db_conn, st.session_state['username'], "assistant", full_response, st.session_state['current_conversation_id'])
-                            
-                        except Exception as e:
-                            full_response = f"Error: {str(e)}"
-                            message_placeholder.error(full_response)
-                            # Errors are not saved to DB
-                            
-                        st.session_state["messages"].append({"role": "assistant", "content": full_response})
+                    if priority is not None:
+                        db.save_chat(db_conn, st.session_state['username'], "assistant", priority[1],
+                                     st.session_state['current_conversation_id'])
+                        st.rerun()
+                    run_after = admission.run_after(admitted)
+                    payload = {"chart": jobs.encode_chart(st.session_state['chart_data']), "query": query,
+                               "conversation_id": st.session_state['current_conversation_id']}
+                    affinity = None
+                    if "GEMINI_API_KEY" not in st.secrets:
+                        # The workers have the key from secrets; one entered here is handed over
+                        # in memory, so only this server's own workers can run the job
+                        affinity = jobs.local_affinity()
+                        if affinity is None:
+                            answer_inline(query, run_after)
+                            st.rerun()
+                        payload["key_ref"] = jobs.share_key(api_key)
+                    st.session_state['reply_job'] = {
+                        "id": db.submit_job(db_conn, st.session_state['username'], "report", payload,
+                                            run_after=run_after, affinity=affinity),
+                        "conversation_id": st.session_state['current_conversation_id'],
+                        "query": query, "run_after": run_after}
+                    st.rerun()
+
+                busy = bool(st.session_state.get('reply_job'))
+                if st.button("📝 Generate Full Report", disabled=busy):
+                    ask("📝 Full chart report", jobs.FULL_REPORT_QUERY, "Full Report")
+
+                if prompt := st.chat_input("Ask about career, marriage, health, etc...", disabled=busy):
+                    # Use first few words as title
+                    ask(prompt, prompt, (prompt[:30] + '..') if len(prompt) > 30 else prompt)
 
 
     else:
         st.info("👈 Please enter birth details and click 'Generate Birth Chart' in the sidebar to begin.")
 
+    if is_admin(st.session_state['username']):
+        with st.sidebar.expander("📈 Performance"):
+            render_performance_panel()
+
 if __name__ == "__main__":
-    main()
+    # Each script run (page render) is one trace
+    with tracing.trace("page"):
+        main()
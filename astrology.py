@@ -1,37 +1,76 @@
 import json
-from geopy.geocoders import Nominatim
-from timezonefinder import TimezoneFinder
-from jyotishyamitra import input_birthdata, generate_astrologicalData, set_output, validate_birthdata, get_birthdata
+import os
+import tempfile
 import datetime
+from functools import lru_cache
+from tracing import span
+
+# Bump whenever the chart engine (jyotishyamitra version or the way we call it)
+# changes, so charts persisted with saved profiles get recomputed.
+CHART_ENGINE_VERSION = "jyotishyamitra-1.4/1"
+
+# Longest date range get_panchanga() computes in one call
+MAX_PANCHANGA_DAYS = 3 * 366
 
 def get_lat_lon(city_name):
     """
     Resolves city name to latitude, longitude and timezone.
     """
-    geolocator = Nominatim(user_agent="astrology_app")
-    location = geolocator.geocode(city_name)
+    # Imported here rather than at module load: geopy is only needed when a
+    # chart is generated for a new city
+    from geopy.geocoders import Nominatim
+
+    with span("chart.geocode"):
+        geolocator = Nominatim(user_agent="astrology_app")
+        location = geolocator.geocode(city_name)
     
     if not location:
         return None, None, None
         
     lat = location.latitude
     lon = location.longitude
-    
-    tf = TimezoneFinder()
-    timezone_str = tf.timezone_at(lng=lon, lat=lat)
-    
-    return lat, lon, timezone_str
+    return lat, lon, get_timezone(lat, lon)
+
+def get_timezone(lat, lon):
+    """
+    Returns the timezone name at a coordinate, or None (e.g. at sea).
+    """
+    from timezonefinder import TimezoneFinder
+    with span("chart.timezone"):
+        return TimezoneFinder().timezone_at(lng=lon, lat=lat)
+
+def get_utc_offset(timezone_str, dt_date):
+    """
+    Returns the UTC offset in hours for a timezone on the given date.
+    """
+    import pytz
+    with span("chart.timezone"):
+        tz = pytz.timezone(timezone_str)
+        # Arbitrary date for offset calculation (using birth date)
+        local_dt = tz.localize(datetime.datetime(dt_date.year, dt_date.month, dt_date.day))
+        offset_seconds = local_dt.utcoffset().total_seconds()
+    return offset_seconds / 3600.0
+
+def get_chart_location(chart_data):
+    """
+    Returns (lat, lon, tz_offset) recorded in a generated chart, or None.
+    """
+    try:
+        pob = chart_data["user_details"]["birthdetails"]["POB"]
+        return float(pob["lat"]), float(pob["lon"]), float(pob["timezone"])
+    except (KeyError, TypeError, ValueError):
+        return None
 
-def get_chart_data(name, dob_str, time_str, city_name):
+def get_chart_data(name, dob_str, time_str, city_name, location=None):
     """
     Generates Vedic Astrology chart data using jyotishyamitra.
     dob_str: YYYY-MM-DD
     time_str: HH:MM
+    location: optional (lat, lon, tz_offset) tuple, e.g. stored with a saved
+              profile. When given, geocoding and timezone lookup are skipped.
+    Returns the engine's JSON, the storage and API format; chart_model.Chart.from_engine()
+    turns it into the in-memory model.
     """
-    lat, lon, timezone_str = get_lat_lon(city_name)
-    if not lat:
-        return {"error": f"Could not find location: {city_name}"}
-
     # Parse date and time
     try:
         dt_date = datetime.datetime.strptime(dob_str, "%Y-%m-%d")
@@ -39,6 +78,14 @@ def get_chart_data(name, dob_str, time_str, city_name):
     except ValueError as e:
         return {"error": f"Invalid date/time format: {e}"}
 
+    if location:
+        lat, lon, offset_hours = location
+    else:
+        lat, lon, timezone_str = get_lat_lon(city_name)
+        if not lat:
+            return {"error": f"Could not find location: {city_name}"}
+        offset_hours = get_utc_offset(timezone_str, dt_date)
+
     # jyotishyamitra input format: 
     # (name, gender, day, month, year, hour, min, sec, lat, lon, timezone_str)
     # Gender is required but not critical for planetary pos, defaulting to 'unknown'
@@ -55,17 +102,13 @@ def get_chart_data(name, dob_str, time_str, city_name):
     # Timezone often needs to be +5.5 format for some libs, but let's see. 
     # If the library takes a string timezone, great. If it needs offset, we need to calculate.
     
-    # Calculate offset
-    import pytz
-    tz = pytz.timezone(timezone_str)
-    # Arbitrary date for offset calculation (using birth date)
-    local_dt = tz.localize(datetime.datetime(dt_date.year, dt_date.month, dt_date.day))
-    offset_seconds = local_dt.utcoffset().total_seconds()
-    offset_hours = offset_seconds / 3600.0
-    
     # jyotishyamitra 1.3+ likely takes arguments.
     # We will wrap this in a try-except block and print what we get.
     
+    # The chart engine pulls in its ephemeris on import, so it is loaded on first use
+    from jyotishyamitra import (input_birthdata, generate_astrologicalData, set_output,
+                                validate_birthdata, get_birthdata)
+
     try:
         birthdata = input_birthdata(
             name=name,
@@ -82,48 +125,120 @@ def get_chart_data(name, dob_str, time_str, city_name):
             timezone=offset_hours 
         )
         
-        if validate_birthdata() != "SUCCESS":
+        with span("chart.validate"):
+            valid = validate_birthdata()
+        if valid != "SUCCESS":
              return {"error": "Birth data validation failed."}
              
         # Get cleaned birthdata
         bd = get_birthdata()
              
-        # Set output
-        # Using current directory for simplicity, using safe filename
-        safe_name = "".join(x for x in name if x.isalnum())
-        set_output(".", safe_name)
-        
-        # Generate data
-        output_path = generate_astrologicalData(bd)
-        
-        # Hack to handle the way library constructs path with backslash on non-windows
-        # It seems it joins dir + "\\" + name + ".json"
-        # If output_path exists, use it. If not, try to account for the backslash in filename.
-        import os
-        final_path = output_path
-        if not os.path.exists(final_path):
-             # Try to find the file if it has a backslash in name
-             possible_name = f".\\{safe_name}.json"
-             if os.path.exists(possible_name):
-                 final_path = possible_name
-        
-        if not os.path.exists(final_path):
-             return {"error": f"Output file not found at {output_path} or {final_path}"}
-             
-        with open(final_path, 'r') as f:
-            data = json.load(f)
-            
-        # Clean up
-        try:
-            os.remove(final_path)
-        except:
-            pass
+        # Write into a private temporary directory so concurrent computations
+        # (e.g. API worker processes) never share an output file.
+        # jyotishyamitra joins directory and file name with a backslash; with
+        # a trailing separator on the directory the file still lands inside it.
+        safe_name = "".join(x for x in name if x.isalnum()) or "chart"
+        with tempfile.TemporaryDirectory() as out_dir:
+            set_output(os.path.join(out_dir, ""), safe_name)
+            with span("chart.ephemeris"):
+                output_path = generate_astrologicalData(bd)
+            if not os.path.exists(output_path):
+                return {"error": f"Output file not found at {output_path}"}
+            with span("chart.read_output"), open(output_path, 'r') as f:
+                data = json.load(f)
             
         return data
     except Exception as e:
         import traceback
         return {"error": f"Astrology calculation failed: {str(e)}\n{traceback.format_exc()}"}
 
+def get_panchanga(city_name, start_date, end_date, location=None):
+    """
+    Daily Panchanga (sunrise, sunset, Rahu Kalam, tithi, nakshatra, yoga,
+    karana) for a place over a date range, as {"lat", "lon", "timezone",
+    "days": DataFrame}. Times are local.
+    start_date / end_date: datetime.date, inclusive
+    location: optional (lat, lon, tz_offset) tuple, as for get_chart_data;
+    the offset is only used where (lat, lon) has no timezone, since a
+    stored offset is the one in force on the birth date, not today's.
+    """
+    from panchanga import panchanga
+
+    if end_date < start_date:
+        return {"error": "The end date is before the start date."}
+    if (end_date - start_date).days > MAX_PANCHANGA_DAYS:
+        return {"error": f"Date ranges are limited to {MAX_PANCHANGA_DAYS} days."}
+
+    if location:
+        lat, lon, tz = location
+        tz = get_timezone(lat, lon) or tz
+    else:
+        lat, lon, tz = get_lat_lon(city_name)
+        if not lat or not tz:
+            return {"error": f"Could not find location: {city_name}"}
+
+    try:
+        # With a timezone name the offsets follow daylight saving time
+        days = panchanga(lat, lon, tz, start_date, end_date)
+    except Exception as e:
+        return {"error": f"Panchanga calculation failed: {str(e)}"}
+    return {"lat": lat, "lon": lon, "timezone": tz, "days": days}
+
+def get_birth_time_sensitivity(dob_str, time_str, city_name, location=None, window_minutes=120):
+    """
+    How the ascendant, its nakshatra, the D9/D10 lagnas and the Moon's
+    nakshatra change within ± window_minutes of a birth time (see
+    rectification.sensitivity), without running the chart engine.
+    location: optional (lat, lon, tz_offset) tuple, as for get_chart_data;
+    the offset is only used where (lat, lon) has no timezone, since a
+    stored offset is the one in force on the birth date, not today's.
+    """
+    from rectification import sensitivity
+
+    try:
+        birth = datetime.datetime.strptime(f"{dob_str} {time_str}", "%Y-%m-%d %H:%M")
+    except ValueError as e:
+        return {"error": f"Invalid date/time format: {e}"}
+
+    if location:
+        lat, lon, offset_hours = location
+    else:
+        lat, lon, timezone_str = get_lat_lon(city_name)
+        if not lat:
+            return {"error": f"Could not find location: {city_name}"}
+        offset_hours = get_utc_offset(timezone_str, birth)
+
+    try:
+        return sensitivity(birth, lat, lon, offset_hours, window_minutes)
+    except Exception as e:
+        return {"error": f"Birth time sweep failed: {str(e)}"}
+
+@lru_cache(maxsize=256)
+def get_chart_strength(chart):
+    """
+    Ashtakavarga and Shadbala (see strength.py) for a chart_model.Chart,
+    cached on its fingerprint. The result is shared: treat it as read-only.
+    """
+    from strength import chart_strength
+    with span("chart.strength"):
+        return chart_strength(chart)
+
+def get_profile_strengths(charts):
+    """get_chart_strength() for a list of Charts (e.g. a user's profiles) in one vectorized pass."""
+    from strength import batch_strength
+    with span("chart.strength"):
+        return batch_strength(charts)
+
+@lru_cache(maxsize=256)
+def get_chart_variants(chart):
+    """
+    The chart under every supported ayanamsa and house system (see variants.py),
+    from one tropical computation, cached on its fingerprint. Treat it as read-only.
+    """
+    from variants import chart_variants
+    with span("chart.variants"):
+        return chart_variants(chart)
+
 if __name__ == "__main__":
     # Test run
     result = get_chart_data("TestUser", "1990-01-01", "12:00", "New Delhi")
@@ -0,0 +1,72 @@
+"""
+Offline stand-ins for the network services the app calls: a geocoder that
+answers from recorded Nominatim responses and a Gemini client that returns
+canned text. offline() patches both in where astrology.py and llm.py load them.
+"""
+import json
+import os
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+from geopy.location import Location
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+class RecordedNominatim:
+    """Drop-in for geopy's Nominatim that replays fixtures/geocode.json."""
+
+    _responses = None
+
+    def __init__(self, user_agent=None, **kwargs):
+        if RecordedNominatim._responses is None:
+            with open(os.path.join(FIXTURES, "geocode.json")) as f:
+                RecordedNominatim._responses = json.load(f)
+
+    def geocode(self, query, exactly_one=True, **kwargs):
+        raw = self._responses.get(str(query).strip().lower())
+        if not raw:
+            return None
+        locations = [Location(r["display_name"], (float(r["lat"]), float(r["lon"])), r) for r in raw]
+        return locations[0] if exactly_one else locations
+
+
+class FakeGenerativeModel:
+    """Answers every prompt with fixed text; records the last prompt it saw."""
+
+    last_prompt = ""
+    response_text = "The Moon in Aquarius favours steady, humanitarian work. " * 20
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+
+    def generate_content(self, prompt, stream=False):
+        FakeGenerativeModel.last_prompt = prompt
+        if stream:
+            words = self.response_text.split(" ")
+            return (SimpleNamespace(text=" ".join(words[i:i + 20]) + " ") for i in range(0, len(words), 20))
+        return SimpleNamespace(text=self.response_text)
+
+
+fake_genai = SimpleNamespace(
+    configure=lambda api_key=None, **kwargs: None,
+    list_models=lambda: [SimpleNamespace(name="models/gemini-1.5-flash",
+                                         supported_generation_methods=["generateContent"])],
+    GenerativeModel=FakeGenerativeModel,
+)
+
+
+@contextmanager
+def offline():
+    """Patch the geocoder and Gemini client used by astrology.py and llm.py."""
+    import geopy.geocoders
+    import llm
+
+    # astrology.py imports Nominatim when it geocodes, and llm.py only loads
+    # the real client while llm.genai is unset
+    saved = geopy.geocoders.Nominatim, llm.genai
+    geopy.geocoders.Nominatim, llm.genai = RecordedNominatim, fake_genai
+    try:
+        yield
+    finally:
+        geopy.geocoders.Nominatim, llm.genai = saved
@@ -0,0 +1,67 @@
+"""
+Cold import time of the app's modules, each measured in a fresh interpreter.
+
+    python benchmarks/import_time.py                 # app, astrology, llm, database, jobs
+    python benchmarks/import_time.py app --top 15    # slowest modules pulled in by app.py
+
+Uses `python -X importtime`, so the numbers include everything a module
+drags in at import. run.py records these as import.<module> benchmarks.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ["app", "astrology", "llm", "database", "jobs", "api"]
+
+
+def import_profile(module):
+    """Cumulative import time (ms) of `module` and of everything it imported, from a fresh process."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=ROOT, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"import {module} failed")
+    modules = {}
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = int(cumulative) / 1000
+        # Entries are listed children first; an unindented one closes a top-level
+        # import, so anything before it that isn't part of `module` is interpreter startup
+        if not name[1:].startswith(" ") and name.strip() != module:
+            modules.clear()
+        if name.strip() == module:
+            break
+    return modules[module], modules
+
+
+def measure_import(module, repeat=3):
+    samples = sorted(import_profile(module)[0] for _ in range(repeat))
+    return {"median_ms": round(statistics.median(samples), 4), "p95_ms": round(samples[-1], 4), "runs": repeat}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold import times.")
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    parser.add_argument("--top", type=int, default=10, help="Slowest top-level packages to list per module")
+    args = parser.parse_args()
+
+    for module in args.modules:
+        total, modules = import_profile(module)
+        print(f"{module}: {total:.1f} ms")
+        packages = {}
+        for name, ms in modules.items():
+            top = name.split(".")[0]
+            if top != module:
+                packages[top] = max(packages.get(top, 0), ms)
+        for name, ms in sorted(packages.items(), key=lambda kv: -kv[1])[:args.top]:
+            print(f"    {name:<30} {ms:>9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
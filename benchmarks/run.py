@@ -0,0 +1,262 @@
+"""
+Offline benchmarks for the chart, prompt, LLM and database hot paths.
+
+    python benchmarks/run.py                    # run and compare with baseline.json
+    python benchmarks/run.py --save-baseline    # add new benchmarks to baseline.json
+    python benchmarks/run.py --filter sqlite    # only benchmarks whose name contains "sqlite"
+    python benchmarks/run.py --filter import.   # only cold import times (see import_time.py)
+
+Geocoding and Gemini are replaced by recorded responses and a fake client
+(see fakes.py), so no network is needed. Mongo benchmarks use mongomock
+(pip install -r benchmarks/requirements.txt) and are skipped without it.
+
+Each benchmark reports the median and p95 of its timed runs. A run fails
+(exit status 1) when a median, or a tracked size, exceeds its baseline by
+more than the tolerance; baselines are machine specific, so record one on
+the machine you compare on.
+"""
+import argparse
+import datetime
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import database as db  # noqa: E402
+from benchmarks.fakes import offline, FakeGenerativeModel  # noqa: E402
+from benchmarks.import_time import MODULES, measure_import  # noqa: E402
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+DEFAULT_TOLERANCE = 0.5
+# Slowdowns smaller than this are timer noise, whatever the ratio
+MIN_REGRESSION_MS = 0.2
+
+BIRTH = ("Bench", "1990-01-01", "12:00", "New Delhi, India")
+USER = "bench_user"
+
+
+def measure(fn, repeat=20, warmup=1, setup=None):
+    """Time fn() `repeat` times (after `warmup` untimed calls); returns stats in ms."""
+    for _ in range(warmup):
+        if setup:
+            setup()
+        fn()
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {"median_ms": round(statistics.median(samples), 4),
+            "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 4),
+            "runs": repeat}
+
+
+# --- Benchmark groups ----------------------------------------------------------
+
+def chart_benchmarks(results):
+    import astrology
+    from chart_model import Chart
+    from llm import format_chart_for_prompt, get_astrology_response
+
+    results["astrology.get_lat_lon"] = measure(lambda: astrology.get_lat_lon(BIRTH[3]), repeat=10)
+    results["astrology.get_chart_data"] = measure(lambda: astrology.get_chart_data(*BIRTH), repeat=5)
+    location = astrology.get_chart_location(astrology.get_chart_data(*BIRTH))
+    results["astrology.get_chart_data (stored location)"] = measure(
+        lambda: astrology.get_chart_data(*BIRTH, location=location), repeat=5)
+
+    chart = astrology.get_chart_data(*BIRTH)
+    results["chart_model.from_engine"] = measure(lambda: Chart.from_engine(chart), repeat=20)
+    model = Chart.from_engine(chart)
+    blob = model.to_bytes()
+    stats = measure(lambda: Chart.from_bytes(blob), repeat=50)
+    stats["size_bytes"] = len(blob)
+    results["chart_model.from_bytes"] = stats
+    results["chart_model.to_bytes"] = measure(model.to_bytes, repeat=50)
+    from strength import batch_strength
+    profiles = [Chart.from_bytes(blob) for _ in range(500)]
+    results["strength.batch_strength (500 charts)"] = measure(lambda: batch_strength(profiles), repeat=10)
+    from variants import chart_variants
+    results["variants.chart_variants (3 ayanamsas x 6 house systems)"] = measure(
+        lambda: chart_variants(model), repeat=20)
+
+    stats = measure(lambda: format_chart_for_prompt(model), repeat=20)
+    stats["size_chars"] = len(format_chart_for_prompt(model))
+    results["llm.format_chart_for_prompt"] = stats
+
+    # Prompt assembly plus the (fake) model round trip
+    stats = measure(lambda: get_astrology_response(model, "How will my career develop?", "fake-key"), repeat=20)
+    stats["size_chars"] = len(FakeGenerativeModel.last_prompt)
+    results["llm.get_astrology_response"] = stats
+    from panchanga import year_panchanga
+    results["panchanga.year_panchanga"] = measure(
+        lambda: (year_panchanga.cache_clear(), year_panchanga(28.6139, 77.209, 5.5, 2026)), repeat=3)
+    from rectification import sensitivity
+    results["rectification.sensitivity"] = measure(
+        lambda: sensitivity(datetime.datetime(1990, 1, 1, 12), 28.6139, 77.209, 5.5), repeat=10)
+
+    results["llm.get_astrology_response (stream)"] = measure(
+        lambda: "".join(c.text for c in get_astrology_response(model, "And marriage?", "fake-key", stream=True)),
+        repeat=20)
+    return chart
+
+
+def database_benchmarks(results, backend, db_conn, chart):
+    prefix = f"db.{backend}."
+
+    def bench(name, fn, **kwargs):
+        try:
+            results[prefix + name] = measure(fn, **kwargs)
+        except Exception as e:
+            # e.g. operators the in-memory Mongo stand-in does not implement
+            results[prefix + name] = {"skipped": f"{type(e).__name__}: {e}"[:200]}
+
+    def uncached(kind, fn):
+        return lambda: (db.invalidate_read_cache(db_conn, kind, USER), fn())
+
+    # Seed: 20 profiles, 30 conversations of 20 messages
+    db.add_user(db_conn, USER, "secret")
+    for i in range(20):
+        db.save_profile(db_conn, USER, f"Profile {i}", "1990-01-01", "12:00", "New Delhi, India",
+                        28.61, 77.21, 5.5, chart, "bench")
+    conv_ids = []
+    for i in range(30):
+        conv_id = db.create_conversation(db_conn, USER, f"Conversation {i}")
+        conv_ids.append(conv_id)
+        for j in range(20):
+            db.save_chat(db_conn, USER, "user" if j % 2 == 0 else "assistant",
+                         f"Question {j} about career, marriage and the Saturn mahadasha in house {j % 12 + 1}", conv_id)
+
+    counter = iter(range(10 ** 9))
+    bench("add_user", lambda: db.add_user(db_conn, f"user_{next(counter)}", "secret"))
+    bench("login_user", lambda: db.login_user(db_conn, USER, "secret"))
+    bench("save_profile", lambda: db.save_profile(db_conn, USER, f"Extra {next(counter)}", "1990-01-01", "12:00",
+                                                  "Mumbai, India", 19.08, 72.88, 5.5, chart, "bench"), repeat=10)
+    bench("get_user_profiles", uncached("profiles", lambda: db.get_user_profiles(db_conn, USER)))
+    bench("get_user_profiles (cached)", lambda: db.get_user_profiles(db_conn, USER))
+    profile = ("Profile 7", "1990-01-01", "12:00", "New Delhi, India")
+    bench("get_profile_chart", lambda: db.get_profile_chart(db_conn, USER, profile))
+    bench("get_profile_moons", lambda: db.get_profile_moons(db_conn, USER))
+    bench("update_profile_chart", lambda: db.update_profile_chart(db_conn, USER, profile, 28.61, 77.21, 5.5,
+                                                                  chart, "bench"), repeat=10)
+    bench("create_conversation", lambda: db.create_conversation(db_conn, USER, "Bench"))
+    bench("get_user_conversations", uncached("conversations", lambda: db.get_user_conversations(db_conn, USER)))
+    bench("save_chat", lambda: db.save_chat(db_conn, USER, "user", "What does Jupiter in the tenth house mean?",
+                                            conv_ids[0]))
+    bench("get_chat_history", lambda: db.get_chat_history(db_conn, conv_ids[1]))
+    bench("search_chats", lambda: db.search_chats(db_conn, USER, "saturn mahadasha"))
+    bench("delete_conversation", lambda: db.delete_conversation(db_conn, db.create_conversation(db_conn, USER, "Tmp"),
+                                                                USER))
+    bench("submit_claim_finish_job", lambda: db.finish_job(
+        db_conn, db.claim_job(db_conn, "bench")["id"], "bench", result={"ok": True}),
+        setup=lambda: db.submit_job(db_conn, USER, "chart", {"name": "x"}))
+    bench("take_token", lambda: db.take_token(db_conn, "llm:bench", 1000.0, 10 ** 6))
+    bench("run_maintenance", lambda: db.run_maintenance(db_conn), repeat=3)
+
+
+def import_benchmarks(results):
+    # Each sample is a fresh interpreter, so this is what a cold app start pays
+    for module in MODULES:
+        results[f"import.{module}"] = measure_import(module)
+
+
+# --- Baselines -----------------------------------------------------------------
+
+def compare(results, baseline, tolerance):
+    """Returns a list of human readable regressions."""
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if not base or "skipped" in current or "skipped" in base:
+            continue
+        if current["median_ms"] - base["median_ms"] > max(MIN_REGRESSION_MS, base["median_ms"] * tolerance):
+            regressions.append(f"{name}: median {current['median_ms']:.3f} ms vs baseline {base['median_ms']:.3f} ms")
+        if "size_chars" in base and current.get("size_chars", 0) > base["size_chars"] * (1 + tolerance):
+            regressions.append(f"{name}: {current['size_chars']} chars vs baseline {base['size_chars']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run offline benchmarks.")
+    parser.add_argument("--filter", default="", help="Only report benchmarks whose name contains this text")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="Add benchmarks missing from the baseline (existing entries are kept)")
+    parser.add_argument("--replace", action="store_true",
+                        help="With --save-baseline, also overwrite existing entries")
+    parser.add_argument("--tolerance", type=float, help=f"Allowed slowdown ratio (default {DEFAULT_TOLERANCE})")
+    parser.add_argument("--output", help="Also write results to this JSON file")
+    args = parser.parse_args()
+
+    results = {}
+    if "import.".startswith(args.filter) or args.filter.startswith("import."):
+        import_benchmarks(results)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="astro_bench_") as workdir, offline():
+        os.chdir(workdir)
+        try:
+            chart = chart_benchmarks(results)
+
+            db.DB_NAME = os.path.join(workdir, "bench.db")
+            db.init_db()
+            database_benchmarks(results, "sqlite", None, chart)
+            try:
+                import mongomock
+                database_benchmarks(results, "mongo", mongomock.MongoClient().astrology_app, chart)
+            except ImportError:
+                print("mongomock not installed; skipping Mongo benchmarks", file=sys.stderr)
+        finally:
+            os.chdir(cwd)
+
+    results = {k: v for k, v in results.items() if args.filter in k}
+    width = max(len(k) for k in results)
+    for name, r in results.items():
+        if "skipped" in r:
+            print(f"{name:<{width}}  skipped ({r['skipped']})")
+        else:
+            size = f"  {r['size_chars']:>9} chars" if "size_chars" in r else ""
+            print(f"{name:<{width}}  median {r['median_ms']:>10.3f} ms  p95 {r['p95_ms']:>10.3f} ms{size}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    stored = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            stored = json.load(f)
+    tolerance = args.tolerance if args.tolerance is not None else stored.get("tolerance", DEFAULT_TOLERANCE)
+
+    if args.save_baseline:
+        # Re-recording existing entries would hide regressions against them
+        old = stored.get("results", {})
+        merged = {**old, **results} if args.replace else {**results, **old}
+        with open(args.baseline, "w") as f:
+            json.dump({"tolerance": tolerance, "results": merged}, f, indent=2, sort_keys=True)
+            f.write("\n")
+        added = len(merged) - len(old)
+        print(f"Baseline written to {args.baseline} ({added} new, "
+              f"{len(results) - added if args.replace else 0} replaced)")
+        return
+
+    if not stored:
+        print("No baseline yet; run with --save-baseline to record one.")
+        return
+    regressions = compare(results, stored["results"], tolerance)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {tolerance:.0%}:")
+        for r in regressions:
+            print(f"  {r}")
+        sys.exit(1)
+    print(f"\nNo regressions beyond {tolerance:.0%} of baseline.")
+
+
+if __name__ == "__main__":
+    main()
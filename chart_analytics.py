@@ -0,0 +1,128 @@
+"""
+Derived, display-ready data for a generated chart: the Vimshottari dasha
+timeline, elemental/modality balance for every varga, the Ashtakavarga
+and Shadbala tables, and the ayanamsa/house system comparison.
+
+Everything here is built once per chart in vectorized form; app.py caches
+the result on the chart fingerprint so reruns and other sessions reuse it.
+"""
+import numpy as np
+import pandas as pd
+
+from astrology import get_chart_strength
+from chart_model import NAKSHATRAS, Planet
+from chart_render import SIGNS, available_vargas
+from strength import PLANETS, SHADBALA_COMPONENTS
+from variants import AYANAMSA_LABELS
+
+ELEMENTS = ["Fire", "Earth", "Air", "Water"]
+MODALITIES = ["Cardinal", "Fixed", "Mutable"]
+
+# Sign index (Aries = 0) -> element / modality index
+SIGN_ELEMENT = np.arange(12) % 4
+SIGN_MODALITY = np.arange(12) % 3
+
+PLANET_NAMES = np.array([p.label for p in Planet])
+
+
+def dasha_frame(chart):
+    """
+    One row per Mahadasha > Antardasha period, sorted by start, with columns
+    Period, Start, Finish, Major Lord, Sub Lord.
+    """
+    periods = chart.dasha_periods(1)
+    major = PLANET_NAMES[periods["lords"][:, 0]]
+    sub = PLANET_NAMES[periods["lords"][:, 1]]
+    return pd.DataFrame({
+        "Period": np.char.add(np.char.add(major, " - "), sub),
+        "Start": pd.to_datetime(periods["start"]),
+        "Finish": pd.to_datetime(periods["end"]),
+        "Major Lord": major,
+        "Sub Lord": sub,
+    })
+
+
+def dasha_figure(df):
+    import plotly.express as px  # only the UI draws figures; the API uses the frames
+    fig = px.timeline(df, x_start="Start", x_end="Finish", y="Major Lord", color="Sub Lord",
+                      hover_name="Period", title="Vimshottari Dasha (Mahadasha > Antardasha)")
+    fig.update_yaxes(categoryorder="category ascending")
+    return fig
+
+
+def balance_counts(signs, lookup, n):
+    """Count planets per category for every row of a sign matrix in one pass."""
+    valid = signs >= 0
+    rows = np.nonzero(valid)[0]
+    counts = np.zeros((signs.shape[0], n), dtype=np.int16)
+    np.add.at(counts, (rows, lookup[signs[valid]]), 1)
+    return counts
+
+
+def strength_frames(strength, totals=None):
+    """
+    (Ashtakavarga frame: planets and SAV x signs, Shadbala frame: components x
+    planets). The components don't add up to Shadbala, so the only totals shown
+    are the engine's full ones (Chart.shadbala), when given.
+    """
+    bav = pd.DataFrame(strength["bhinnashtakavarga"], index=PLANETS, columns=SIGNS)
+    bav.loc["Sarvashtakavarga"] = strength["sarvashtakavarga"]
+    bav["Total"] = bav.sum(axis=1)
+    shadbala = pd.DataFrame(strength["shadbala"], index=PLANETS)[SHADBALA_COMPONENTS].T
+    if totals:
+        shadbala.loc["Shadbala total (virupas)"] = pd.Series(totals["Total"])
+        shadbala.loc["Shadbala total (rupas)"] = pd.Series(totals["Rupas"])
+    return bav, shadbala
+
+
+def variant_frames(variants, ayanamsas, house_systems):
+    """
+    Side-by-side views of chosen ayanamsas and house systems from
+    variants.chart_variants(): (positions frame: points x ayanamsas, houses
+    frame: points x "ayanamsa · house system", points whose sign or
+    nakshatra differs between the chosen ayanamsas).
+    """
+    a = [variants["ayanamsas"].index(m) for m in ayanamsas]
+    h = [variants["house_systems"].index(s) for s in house_systems]
+    lon = variants["longitude"][a]
+    sign, degree = (lon // 30).astype(int), lon % 30
+    nakshatra = (lon // (360 / 27)).astype(int)
+    pada = (lon % (360 / 27) // (360 / 108)).astype(int) + 1
+    positions = pd.DataFrame(
+        {AYANAMSA_LABELS[m]: [f"{SIGNS[s]} {d:.2f}° · {NAKSHATRAS[n]} {p}"
+                              for s, d, n, p in zip(sign[i], degree[i], nakshatra[i], pada[i])]
+         for i, m in enumerate(ayanamsas)}, index=variants["points"])
+    houses = variants["house"][np.ix_(a, h)]
+    houses = pd.DataFrame(
+        {f"{AYANAMSA_LABELS[m]} · {s}": houses[i, j] for i, m in enumerate(ayanamsas)
+         for j, s in enumerate(house_systems)}, index=variants["points"])
+    differs = (sign != sign[:1]).any(axis=0) | (nakshatra != nakshatra[:1]).any(axis=0)
+    return positions, houses, [p for p, d in zip(variants["points"], differs) if d]
+
+
+def build_chart_analytics(chart):
+    """All derived frames for a chart. The returned objects are shared: treat them as read-only."""
+    vargas = available_vargas(chart)
+    signs = chart.sign_matrix()
+    df_dasha = dasha_frame(chart)
+    ashtakavarga, shadbala = strength_frames(get_chart_strength(chart), chart.shadbala)
+    return {
+        "dasha": df_dasha,
+        "dasha_figure": dasha_figure(df_dasha) if not df_dasha.empty else None,
+        "current_dasha": chart.current_dasha(),
+        "elements": pd.DataFrame(balance_counts(signs, SIGN_ELEMENT, 4), index=vargas, columns=ELEMENTS),
+        "modalities": pd.DataFrame(balance_counts(signs, SIGN_MODALITY, 3), index=vargas, columns=MODALITIES),
+        "ashtakavarga": ashtakavarga,
+        "shadbala": shadbala,
+    }
+
+
+def balance_figures(analytics, varga):
+    """Element donut and modality bar charts for one varga."""
+    import plotly.express as px
+    elements = analytics["elements"].loc[varga]
+    modalities = analytics["modalities"].loc[varga]
+    fig_elem = px.pie(names=ELEMENTS, values=elements.to_numpy(), hole=0.4, title="Elemental Balance")
+    fig_elem.update_traces(textinfo='percent+label')
+    fig_mod = px.bar(x=MODALITIES, y=modalities.to_numpy(), title="Modality Distribution", color=MODALITIES)
+    return fig_elem, fig_mod
@@ -0,0 +1,415 @@
+"""
+Compact in-memory model of a generated chart.
+
+jyotishyamitra returns a ~450 KB nested JSON document per chart, most of it
+repeated descriptive text and the dasha tree spelled out as strings. The app
+only needs positions, houses and periods, so Chart keeps those as two NumPy
+structured arrays (one row per point per varga, one row per dasha period)
+with enum-coded signs, nakshatras and planets, plus a few strings. That is
+about 20 KB per chart, read with array operations instead of dict walks.
+
+Chart.to_bytes() is a compact, deterministic binary form: the fingerprint is
+its hash, and it is also what pickling a Chart produces, so st.cache_data and
+the job queue store the small form. The engine JSON remains the storage and
+API format; Chart.from_engine() converts it at the boundary.
+"""
+import datetime
+import hashlib
+import json
+import struct
+import zlib
+from enum import IntEnum
+
+import numpy as np
+
+from chart_render import SIGNS, PLANET_ABBR, sign_index
+
+NAKSHATRAS = [
+    "Ashwini", "Bharani", "Krittika", "Rohini", "Mrigashira", "Ardra", "Punarvasu",
+    "Pushya", "Ashlesha", "Magha", "Purva Phalguni", "Uttara Phalguni", "Hasta",
+    "Chitra", "Swati", "Vishakha", "Anuradha", "Jyeshtha", "Mula", "Purva Ashadha",
+    "Uttara Ashadha", "Shravana", "Dhanishta", "Shatabhisha", "Purva Bhadrapada",
+    "Uttara Bhadrapada", "Revati",
+]
+
+# Canonical names plus the spellings jyotishyamitra and common tables use
+_NAKSHATRA_LOOKUP = {n.lower(): i for i, n in enumerate(NAKSHATRAS)}
+_NAKSHATRA_LOOKUP.update({
+    "kritika": 2, "mrigasira": 4, "aridra": 5, "aslesha": 8, "purvaphalguni": 10,
+    "uttaraphalguni": 11, "chitta": 13, "swathi": 14, "vishaka": 15, "visakha": 15,
+    "anurada": 16, "anuradha": 16, "jyeshta": 17, "moola": 18, "purvashada": 19,
+    "purva shadha": 19, "uttarashada": 20, "uttara shadha": 20, "sravana": 21,
+    "shravan": 21, "dhanista": 22, "shatabhishak": 23, "satabhisha": 23,
+    "purvabhadra": 24, "uttarabhadra": 25, "revathi": 26,
+})
+
+
+def nakshatra_index(name):
+    """0-based index of a nakshatra name (Ashwini = 0), or None if unrecognised."""
+    if not name:
+        return None
+    return _NAKSHATRA_LOOKUP.get(str(name).strip().lower())
+
+
+class Sign(IntEnum):
+    ARIES = 0
+    TAURUS = 1
+    GEMINI = 2
+    CANCER = 3
+    LEO = 4
+    VIRGO = 5
+    LIBRA = 6
+    SCORPIO = 7
+    SAGITTARIUS = 8
+    CAPRICORN = 9
+    AQUARIUS = 10
+    PISCES = 11
+
+    @property
+    def label(self):
+        return SIGNS[self]
+
+    @classmethod
+    def parse(cls, name):
+        idx = sign_index(name)
+        return None if idx is None else cls(idx)
+
+
+class Nakshatra(IntEnum):
+    ASHWINI = 0
+    BHARANI = 1
+    KRITTIKA = 2
+    ROHINI = 3
+    MRIGASHIRA = 4
+    ARDRA = 5
+    PUNARVASU = 6
+    PUSHYA = 7
+    ASHLESHA = 8
+    MAGHA = 9
+    PURVA_PHALGUNI = 10
+    UTTARA_PHALGUNI = 11
+    HASTA = 12
+    CHITRA = 13
+    SWATI = 14
+    VISHAKHA = 15
+    ANURADHA = 16
+    JYESHTHA = 17
+    MULA = 18
+    PURVA_ASHADHA = 19
+    UTTARA_ASHADHA = 20
+    SHRAVANA = 21
+    DHANISHTA = 22
+    SHATABHISHA = 23
+    PURVA_BHADRAPADA = 24
+    UTTARA_BHADRAPADA = 25
+    REVATI = 26
+
+    @property
+    def label(self):
+        return NAKSHATRAS[self]
+
+    @classmethod
+    def parse(cls, name):
+        idx = nakshatra_index(name)
+        return None if idx is None else cls(idx)
+
+
+class Planet(IntEnum):
+    SUN = 0
+    MOON = 1
+    MARS = 2
+    MERCURY = 3
+    JUPITER = 4
+    VENUS = 5
+    SATURN = 6
+    RAHU = 7
+    KETU = 8
+
+    @property
+    def label(self):
+        return self.name.title()
+
+    @property
+    def abbr(self):
+        return PLANET_ABBR[self.label]
+
+    @classmethod
+    def parse(cls, name):
+        return cls.__members__.get(str(name).strip().upper()) if name else None
+
+
+# Point codes in the placement table: the planets, then the ascendant, then special points
+ASCENDANT = len(Planet)
+_FIRST_SPECIAL = ASCENDANT + 1
+
+# Sign dignity as reported by the engine, coded by its first word
+DIGNITIES = ["", "Exalted", "Moolatrikona", "Own sign", "Friend's sign", "Neutral sign", "Enemy sign", "Debilitated"]
+_DIGNITY_LOOKUP = {"exhalted": 1, "exalted": 1, "prime": 2, "own": 3, "friends": 4, "neutral": 5,
+                   "enemy": 6, "debilitated": 7}
+
+DASHA_LEVELS = ["mahadashas", "antardashas", "paryantardashas"]
+# Engine fields naming the lords of a period, outermost first, per level
+_DASHA_LORD_FIELDS = [("lord",), ("dashaLord", "lord"), ("dashaLord", "bhuktiLord", "lord")]
+_PLANET_CODES = {p.label: int(p) for p in Planet}
+_NO_LORD = 255
+
+PLACEMENT_DTYPE = np.dtype([("varga", "u1"), ("point", "u1"), ("sign", "u1"), ("degree", "f8"),
+                            ("nakshatra", "u1"), ("pada", "u1"), ("house", "u1"), ("retro", "?"),
+                            ("dignity", "u1")])
+DASHA_DTYPE = np.dtype([("level", "u1"), ("lords", "u1", (3,)), ("start", "M8[us]"), ("end", "M8[us]")])
+
+_MAGIC = b"VCM1"
+
+
+class BirthDetails:
+    __slots__ = ("name", "gender", "moment", "place", "lat", "lon", "tz_offset")
+
+    def __init__(self, name, gender, moment, place, lat, lon, tz_offset):
+        self.name, self.gender, self.moment = name, gender, moment
+        self.place, self.lat, self.lon, self.tz_offset = place, lat, lon, tz_offset
+
+    @property
+    def location(self):
+        """(lat, lon, tz_offset), as get_chart_data() accepts it, or None."""
+        if self.lat is None or self.lon is None or self.tz_offset is None:
+            return None
+        return self.lat, self.lon, self.tz_offset
+
+
+class Placement:
+    """One point (planet, ascendant or special point) in one varga."""
+    __slots__ = ("sign", "degree", "nakshatra", "pada", "house", "retro", "dignity")
+
+    def __init__(self, row):
+        self.sign = Sign(row["sign"])
+        self.degree = float(row["degree"])
+        self.nakshatra = Nakshatra(row["nakshatra"])
+        self.pada = int(row["pada"])
+        self.house = int(row["house"]) or None
+        self.retro = bool(row["retro"])
+        self.dignity = DIGNITIES[row["dignity"]]
+
+    @property
+    def longitude(self):
+        return self.sign * 30 + self.degree
+
+
+class Varga:
+    """A divisional chart: its ascendant and planets (by planet name, in Planet order)."""
+    __slots__ = ("name", "ascendant", "planets")
+
+    def __init__(self, name, ascendant, planets):
+        self.name, self.ascendant, self.planets = name, ascendant, planets
+
+    def houses(self):
+        """Whole-sign houses from the ascendant: [(house number, sign, [planet names]), ...]."""
+        if self.ascendant is None:
+            return []
+        occupants = [[] for _ in range(12)]
+        for planet, placement in self.planets.items():
+            occupants[placement.sign].append(planet)
+        asc = self.ascendant.sign
+        return [(h + 1, Sign((asc + h) % 12), occupants[(asc + h) % 12]) for h in range(12)]
+
+
+def _dignity(text):
+    return _DIGNITY_LOOKUP.get(str(text or "").split(" ")[0].lower(), 0)
+
+
+def _placement_row(varga, point, details, rows):
+    sign = sign_index(details.get("sign"))
+    if sign is None:
+        return
+    degree = float((details.get("pos") or {}).get("dec_deg") or 0.0)
+    nakshatra = nakshatra_index(details.get("nakshatra"))
+    if nakshatra is None:
+        nakshatra = int((sign * 30 + degree) // (360 / 27))
+    rows.append((varga, point, sign, degree, nakshatra, int(details.get("pada") or 0),
+                 int(details.get("house-num") or 0), bool(details.get("retro")),
+                 _dignity(details.get("house-rel"))))
+
+
+def _dasha_rows(vimshottari):
+    rows, starts, ends = [], [], []
+    for level, key in enumerate(DASHA_LEVELS):
+        fields = _DASHA_LORD_FIELDS[level]
+        for period in (vimshottari.get(key) or {}).values():
+            lords = [_PLANET_CODES.get(period.get(f)) for f in fields]
+            if None in lords or "startDate" not in period:
+                continue
+            rows.append((level, lords + [_NO_LORD] * (2 - level)))
+            starts.append(period["startDate"])
+            ends.append(period["endDate"])
+    table = np.zeros(len(rows), dtype=DASHA_DTYPE)
+    if rows:
+        table["level"] = [r[0] for r in rows]
+        table["lords"] = [r[1] for r in rows]
+        table["start"] = np.array(starts, dtype="M8[us]")
+        table["end"] = np.array(ends, dtype="M8[us]")
+    return table[np.lexsort((table["start"], table["level"]))]
+
+
+class Chart:
+    __slots__ = ("birth", "details", "vargas", "points", "placements", "dashas", "shadbala", "_fingerprint")
+
+    def __init__(self, birth, details, vargas, points, placements, dashas, shadbala=None):
+        self.birth = birth
+        self.details = details          # Panchanga at birth: nakshatra, rashi, tithi, yoga, karana, vaara, maasa
+        self.vargas = vargas            # varga names, e.g. ("D1", "D2", ...); index = placements["varga"]
+        self.points = points            # special point names; index + _FIRST_SPECIAL = placements["point"]
+        self.placements = placements    # PLACEMENT_DTYPE rows
+        self.dashas = dashas            # DASHA_DTYPE rows, by level then start
+        self.shadbala = shadbala        # engine's full Shadbala: {"Total": {planet: virupas}, "Rupas": {...}} or None
+        self._fingerprint = None
+
+    @classmethod
+    def from_engine(cls, data):
+        """Build a Chart from get_chart_data()'s JSON."""
+        ud = data.get("user_details") or {}
+        bd = ud.get("birthdetails") or {}
+        dob, tob, pob = bd.get("DOB") or {}, bd.get("TOB") or {}, bd.get("POB") or {}
+        try:
+            moment = datetime.datetime(int(dob["year"]), int(dob["month"]), int(dob["day"]),
+                                       int(tob.get("hour", 0)), int(tob.get("min", 0)), int(tob.get("sec", 0)))
+        except (KeyError, TypeError, ValueError):
+            moment = None
+        number = lambda x: None if x in (None, "") else float(x)
+        birth = BirthDetails(ud.get("name") or bd.get("name") or "", bd.get("Gender") or "", moment,
+                             pob.get("name") or "", number(pob.get("lat")), number(pob.get("lon")),
+                             number(pob.get("timezone")))
+        details = {k: ud[k] for k in ("nakshatra", "rashi", "tithi", "yoga", "karana", "vaara", "maasa") if k in ud}
+
+        vargas = sorted((k for k in data if k[:1] == "D" and k[1:].isdigit() and isinstance(data[k], dict)),
+                        key=lambda k: int(k[1:]))
+        rows = []
+        for v, name in enumerate(vargas):
+            _placement_row(v, ASCENDANT, data[name].get("ascendant") or {}, rows)
+            for planet, details_ in (data[name].get("planets") or {}).items():
+                point = Planet.parse(planet)
+                if point is not None:
+                    _placement_row(v, point, details_, rows)
+
+        # Special points (sphutas) are given for a few vargas each
+        points = []
+        for key, point in (data.get("special_points") or {}).items():
+            if not isinstance(point, dict):
+                continue
+            code = _FIRST_SPECIAL + len(points)
+            points.append(f"{point.get('type', key)} {key}".strip())
+            for v, name in enumerate(vargas):
+                if isinstance(point.get(name), dict):
+                    _placement_row(v, code, point[name], rows)
+
+        placements = np.array(rows, dtype=PLACEMENT_DTYPE)
+        dashas = (data.get("Dashas") or data.get("dasha") or {}).get("Vimshottari") or {}
+        balas = (data.get("Balas") or {}).get("Shadbala") or {}
+        shadbala = {k: {p: float(v) for p, v in balas[k].items()} for k in ("Total", "Rupas")
+                    if isinstance(balas.get(k), dict)} or None
+        return cls(birth, details, tuple(vargas), tuple(points), placements, _dasha_rows(dashas), shadbala)
+
+    # --- Lookups ---
+
+    def _rows(self, varga):
+        if varga not in self.vargas:
+            return self.placements[:0]
+        return self.placements[self.placements["varga"] == self.vargas.index(varga)]
+
+    def varga(self, name="D1"):
+        """The Varga for a divisional chart name, or None if the chart doesn't have it."""
+        if name not in self.vargas:
+            return None
+        rows = self._rows(name)
+        ascendant = next((Placement(r) for r in rows if r["point"] == ASCENDANT), None)
+        planets = {Planet(r["point"]).label: Placement(r) for r in rows if r["point"] < ASCENDANT}
+        return Varga(name, ascendant, planets)
+
+    def special_point(self, name):
+        """{varga name: Placement} for a special point."""
+        code = _FIRST_SPECIAL + self.points.index(name)
+        rows = self.placements[self.placements["point"] == code]
+        return {self.vargas[r["varga"]]: Placement(r) for r in rows}
+
+    def longitudes(self, varga="D1"):
+        """{point: sidereal longitude} for the ascendant ("Ascendant") and planets of a varga."""
+        rows = self._rows(varga)
+        rows = rows[rows["point"] <= ASCENDANT]
+        names = ["Ascendant" if p == ASCENDANT else Planet(p).label for p in rows["point"]]
+        return dict(zip(names, (rows["sign"] * 30.0 + rows["degree"]).tolist()))
+
+    def sign_matrix(self):
+        """(len(vargas), len(Planet)) array of planet sign indices, -1 where unknown."""
+        matrix = np.full((len(self.vargas), len(Planet)), -1, dtype=np.int8)
+        rows = self.placements[self.placements["point"] < ASCENDANT]
+        matrix[rows["varga"], rows["point"]] = rows["sign"]
+        return matrix
+
+    def dasha_periods(self, level=1):
+        """Vimshottari periods of one level (0 maha, 1 antar, 2 pratyantar), sorted by start."""
+        return self.dashas[self.dashas["level"] == level]
+
+    def dasha_table(self, level=1):
+        """[(lord names, start, end), ...] for one level, with datetimes, for display and prompts."""
+        periods = self.dasha_periods(level)
+        return [(tuple(Planet(l).label for l in lords[:level + 1]), start.item(), end.item())
+                for lords, start, end in zip(periods["lords"], periods["start"], periods["end"])]
+
+    def current_dasha(self, moment=None):
+        """{"date", "dasha", "bhukti", "paryantardasha"} running at `moment` (local time, default now)."""
+        moment = moment or datetime.datetime.now()
+        now = np.datetime64(moment, "us")
+        current = {"date": moment.isoformat(sep=" ", timespec="seconds")}
+        for level, key in enumerate(("dasha", "bhukti", "paryantardasha")):
+            periods = self.dasha_periods(level)
+            hit = np.nonzero((periods["start"] <= now) & (now < periods["end"]))[0]
+            if not hit.size:
+                return current if level else None
+            current[key] = Planet(periods["lords"][hit[0], level]).label
+        return current
+
+    # --- Serialization ---
+
+    def to_bytes(self):
+        header = json.dumps({
+            "birth": {"name": self.birth.name, "gender": self.birth.gender,
+                      "moment": self.birth.moment.isoformat() if self.birth.moment else None,
+                      "place": self.birth.place, "lat": self.birth.lat, "lon": self.birth.lon,
+                      "tz_offset": self.birth.tz_offset},
+            "details": self.details, "vargas": self.vargas, "points": self.points,
+            "placements": len(self.placements), "dashas": len(self.dashas), "shadbala": self.shadbala,
+        }, sort_keys=True, separators=(",", ":")).encode("utf-8")
+        body = struct.pack("<I", len(header)) + header + self.placements.tobytes() + self.dashas.tobytes()
+        return _MAGIC + zlib.compress(body, 1)
+
+    @classmethod
+    def from_bytes(cls, blob):
+        if bytes(blob[:4]) != _MAGIC:
+            raise ValueError("Not a serialized chart")
+        body = zlib.decompress(blob[4:])
+        (size,) = struct.unpack_from("<I", body)
+        header = json.loads(body[4:4 + size])
+        offset = 4 + size
+        placements = np.frombuffer(body, PLACEMENT_DTYPE, header["placements"], offset)
+        offset += placements.nbytes
+        dashas = np.frombuffer(body, DASHA_DTYPE, header["dashas"], offset)
+        b = header["birth"]
+        moment = datetime.datetime.fromisoformat(b["moment"]) if b["moment"] else None
+        birth = BirthDetails(b["name"], b["gender"], moment, b["place"], b["lat"], b["lon"], b["tz_offset"])
+        return cls(birth, header["details"], tuple(header["vargas"]), tuple(header["points"]), placements, dashas,
+                   header.get("shadbala"))
+
+    def __reduce__(self):
+        return Chart.from_bytes, (self.to_bytes(),)
+
+    @property
+    def fingerprint(self):
+        """Stable content hash, used as the cache key for data derived from the chart."""
+        if self._fingerprint is None:
+            self._fingerprint = hashlib.sha1(self.to_bytes()).hexdigest()
+        return self._fingerprint
+
+    # Charts compare and hash by content, so they can key caches directly
+    def __eq__(self, other):
+        return isinstance(other, Chart) and self.fingerprint == other.fingerprint
+
+    def __hash__(self):
+        return hash(self.fingerprint)
@@ -0,0 +1,189 @@
+"""
+SVG rendering of Vedic charts in South, North and East Indian styles.
+
+Charts are drawn from a compact, hashable placement tuple so rendered SVG
+can be memoized on it; the stylesheet is a constant emitted once per page.
+"""
+from functools import lru_cache
+
+SIGNS = ["Aries", "Taurus", "Gemini", "Cancer", "Leo", "Virgo",
+         "Libra", "Scorpio", "Sagittarius", "Capricorn", "Aquarius", "Pisces"]
+
+# jyotishyamitra spells Sagittarius as "Saggitarius"
+_SIGN_LOOKUP = {s.lower(): i for i, s in enumerate(SIGNS)}
+_SIGN_LOOKUP["saggitarius"] = 8
+
+PLANET_ABBR = {
+    "Sun": "Su", "Moon": "Mo", "Mars": "Ma", "Mercury": "Me", "Jupiter": "Ju",
+    "Venus": "Ve", "Saturn": "Sa", "Rahu": "Ra", "Ketu": "Ke", "Ascendant": "As",
+}
+
+VARGA_NAMES = {
+    "D1": "Rasi", "D2": "Hora", "D3": "Drekkana", "D4": "Chaturthamsa", "D7": "Saptamsa",
+    "D9": "Navamsa", "D10": "Dasamsa", "D12": "Dwadasamsa", "D16": "Shodasamsa",
+    "D20": "Vimsamsa", "D24": "Chaturvimsamsa", "D27": "Bhamsa", "D30": "Trimsamsa",
+    "D40": "Khavedamsa", "D45": "Akshavedamsa", "D60": "Shashtiamsa",
+}
+
+CHART_STYLES = ["South Indian", "North Indian", "East Indian"]
+
+CHART_STYLESHEET = """
+<style>
+    .vchart { width: 100%; max-width: 420px; display: block; margin: auto; }
+    .vchart-bg { fill: #ffffff; }
+    .vchart-line { stroke: #000000; stroke-width: 1.5; fill: none; }
+    .vchart-label { font-size: 10px; fill: #555555; text-transform: uppercase; }
+    .vchart-planets { font-size: 14px; font-weight: bold; fill: #d62728; }
+    .vchart-title { font-size: 14px; font-style: italic; fill: #333333; }
+    @media (prefers-color-scheme: dark) {
+        .vchart-bg { fill: #2a2a2a; }
+        .vchart-line { stroke: #888888; }
+        .vchart-label { fill: #aaaaaa; }
+        .vchart-planets { fill: #ff6b6b; }
+        .vchart-title { fill: #d0d0d0; }
+    }
+    [data-theme="dark"] .vchart-bg { fill: #2a2a2a; }
+    [data-theme="dark"] .vchart-line { stroke: #888888; }
+    [data-theme="dark"] .vchart-label { fill: #aaaaaa; }
+    [data-theme="dark"] .vchart-planets { fill: #ff6b6b; }
+    [data-theme="dark"] .vchart-title { fill: #d0d0d0; }
+</style>
+"""
+
+SIZE = 400
+
+# South Indian: fixed signs on the outer ring of a 4x4 grid, (row, col) per sign
+_SOUTH_CELLS = [(0, 1), (0, 2), (0, 3), (1, 3), (2, 3), (3, 3),
+                (3, 2), (3, 1), (3, 0), (2, 0), (1, 0), (0, 0)]
+
+# North Indian: fixed houses (1..12), signs rotate with the ascendant.
+# (planet text anchor, sign number anchor) per house. Every house meets the
+# centre, so the title goes in the top of house 2 instead.
+_NORTH_HOUSES = [
+    ((200, 100), (200, 180)), ((100, 48), (100, 85)), ((40, 100), (85, 100)),
+    ((100, 200), (180, 200)), ((40, 300), (85, 300)), ((100, 360), (100, 315)),
+    ((200, 300), (200, 220)), ((300, 360), (300, 315)), ((360, 300), (315, 300)),
+    ((300, 200), (220, 200)), ((360, 100), (315, 100)), ((300, 40), (300, 85)),
+]
+
+# East Indian: fixed signs running anticlockwise from Aries at top centre,
+# corner cells split diagonally. Text anchor per sign.
+_EAST_SIGNS = [(200, 66), (89, 44), (44, 89), (66, 200), (44, 311), (89, 356),
+               (200, 333), (311, 356), (356, 311), (333, 200), (356, 89), (311, 44)]
+
+
+def sign_index(name):
+    """0-based index of a sign name (Aries = 0), or None if unrecognised."""
+    if not name:
+        return None
+    return _SIGN_LOOKUP.get(str(name).strip().lower())
+
+
+def available_vargas(chart):
+    """Divisional chart names present in a Chart, e.g. ['D1', 'D2', 'D3', 'D9', ...]."""
+    return list(chart.vargas)
+
+
+def chart_placements(chart, varga="D1"):
+    """
+    Compact, hashable placement for one varga of a Chart:
+    (ascendant sign index, ((abbreviation, sign index), ...)).
+    """
+    data = chart.varga(varga)
+    if data is None:
+        return None, ()
+    asc = int(data.ascendant.sign) if data.ascendant else None
+    return asc, tuple((PLANET_ABBR.get(name, name[:2]), int(p.sign)) for name, p in data.planets.items())
+
+
+def _text(x, y, lines, css_class, line_height=16):
+    if not lines:
+        return ""
+    start = y - (len(lines) - 1) * line_height / 2
+    spans = "".join(f'<tspan x="{x:.0f}" y="{start + i * line_height:.0f}">{line}</tspan>'
+                    for i, line in enumerate(lines))
+    return f'<text class="{css_class}" text-anchor="middle" dominant-baseline="middle">{spans}</text>'
+
+
+def _wrap(names, per_line=3):
+    return [" ".join(names[i:i + per_line]) for i in range(0, len(names), per_line)]
+
+
+def _by_sign(asc, planets, include_asc=True):
+    cells = [[] for _ in SIGNS]
+    if include_asc and asc is not None:
+        cells[asc].append("As")
+    for abbr, idx in planets:
+        cells[idx].append(abbr)
+    return cells
+
+
+def _south(asc, planets, title):
+    cell = SIZE / 4
+    parts = []
+    for idx, names in enumerate(_by_sign(asc, planets)):
+        row, col = _SOUTH_CELLS[idx]
+        x, y = col * cell, row * cell
+        parts.append(f'<rect class="vchart-line" x="{x:.0f}" y="{y:.0f}" width="{cell:.0f}" height="{cell:.0f}"/>')
+        parts.append(f'<text class="vchart-label" x="{x + 4:.0f}" y="{y + 12:.0f}">{SIGNS[idx]}</text>')
+        parts.append(_text(x + cell / 2, y + cell / 2 + 6, _wrap(names), "vchart-planets"))
+    parts.append(_text(SIZE / 2, SIZE / 2, [title], "vchart-title"))
+    return parts
+
+
+def _north(asc, planets, title):
+    parts = [
+        f'<line class="vchart-line" x1="0" y1="0" x2="{SIZE}" y2="{SIZE}"/>',
+        f'<line class="vchart-line" x1="{SIZE}" y1="0" x2="0" y2="{SIZE}"/>',
+        f'<polygon class="vchart-line" points="{SIZE / 2:.0f},0 {SIZE},{SIZE / 2:.0f} '
+        f'{SIZE / 2:.0f},{SIZE} 0,{SIZE / 2:.0f}"/>',
+    ]
+    parts.append(_text(SIZE / 4, 14, [title], "vchart-title"))
+    # Houses are counted from the ascendant, so without one nothing can be placed
+    if asc is None:
+        parts.append(_text(SIZE / 2, SIZE / 2, ["No ascendant"], "vchart-title"))
+        return parts
+    cells = _by_sign(asc, planets, include_asc=False)
+    for house, (planet_xy, label_xy) in enumerate(_NORTH_HOUSES):
+        idx = (asc + house) % 12
+        parts.append(_text(label_xy[0], label_xy[1], [str(idx + 1)], "vchart-label"))
+        per_line = 3 if house in (0, 3, 6, 9) else 2
+        parts.append(_text(planet_xy[0], planet_xy[1], _wrap(cells[idx], per_line), "vchart-planets", 14))
+    return parts
+
+
+def _east(asc, planets, title):
+    third = SIZE / 3
+    parts = [
+        f'<line class="vchart-line" x1="{third:.1f}" y1="0" x2="{third:.1f}" y2="{SIZE}"/>',
+        f'<line class="vchart-line" x1="{2 * third:.1f}" y1="0" x2="{2 * third:.1f}" y2="{SIZE}"/>',
+        f'<line class="vchart-line" x1="0" y1="{third:.1f}" x2="{SIZE}" y2="{third:.1f}"/>',
+        f'<line class="vchart-line" x1="0" y1="{2 * third:.1f}" x2="{SIZE}" y2="{2 * third:.1f}"/>',
+        f'<line class="vchart-line" x1="0" y1="0" x2="{third:.1f}" y2="{third:.1f}"/>',
+        f'<line class="vchart-line" x1="{SIZE}" y1="0" x2="{2 * third:.1f}" y2="{third:.1f}"/>',
+        f'<line class="vchart-line" x1="0" y1="{SIZE}" x2="{third:.1f}" y2="{2 * third:.1f}"/>',
+        f'<line class="vchart-line" x1="{SIZE}" y1="{SIZE}" x2="{2 * third:.1f}" y2="{2 * third:.1f}"/>',
+    ]
+    for idx, names in enumerate(_by_sign(asc, planets)):
+        x, y = _EAST_SIGNS[idx]
+        parts.append(_text(x, y - 14, [SIGNS[idx][:3]], "vchart-label"))
+        parts.append(_text(x, y + 4, _wrap(names, 2), "vchart-planets", 14))
+    parts.append(_text(SIZE / 2, SIZE / 2, [title], "vchart-title"))
+    return parts
+
+
+_RENDERERS = {"South Indian": _south, "North Indian": _north, "East Indian": _east}
+
+
+@lru_cache(maxsize=1024)
+def render_chart_svg(placements, style="South Indian", title=""):
+    """
+    SVG markup for a placement from chart_placements(). Memoized on
+    (placements, style, title); pair with CHART_STYLESHEET.
+    """
+    asc, planets = placements
+    body = "".join(_RENDERERS[style](asc, planets, title))
+    return (f'<svg class="vchart" viewBox="-2 -2 {SIZE + 4} {SIZE + 4}" xmlns="http://www.w3.org/2000/svg">'
+            f'<rect class="vchart-bg" x="0" y="0" width="{SIZE}" height="{SIZE}"/>'
+            f'<rect class="vchart-line" x="0" y="0" width="{SIZE}" height="{SIZE}"/>'
+            f'{body}</svg>')
@@ -1,13 +1,48 @@
 import sqlite3
 import hashlib
-from datetime import datetime, timezone
+import importlib.util
+import json
+import re
+import threading
+import time
+import zlib
+from datetime import datetime, timezone, timedelta
+
+from tracing import traced
 
 DB_NAME = "astrology_app.db"
 
+# Retention: conversations idle this long are compacted into one archive blob,
+# and each user keeps at most this many conversations (overridable per user).
+ARCHIVE_AFTER_DAYS = 30
+DEFAULT_MAX_CONVERSATIONS = 200
+
+# Sidebar reads (profiles, conversation list) are cached per user and dropped
+# by the matching write functions below; the TTL only guards against writes
+# made by other processes/replicas.
+READ_CACHE_TTL = 30
+
+# Background jobs: a worker renews its lease on a running job every
+# JOB_HEARTBEAT_INTERVAL seconds; a job whose lease is older than
+# JOB_STALE_AFTER seconds is assumed lost with its worker and requeued.
+# Finished jobs are purged by run_maintenance after JOB_RETENTION_DAYS.
+JOB_HEARTBEAT_INTERVAL = 30
+JOB_STALE_AFTER = 120
+JOB_RETENTION_DAYS = 7
+
+# Token buckets (see admission.py) retry their compare-and-set this often on Mongo
+TOKEN_CAS_RETRIES = 5
+
+_read_cache = {}
+_read_cache_lock = threading.Lock()
+
 def init_db():
     """Initialize SQLite database (fallback for local development)"""
     conn = sqlite3.connect(DB_NAME)
     c = conn.cursor()
+
+    # Only takes effect on a fresh database; vacuum_sqlite() converts older ones
+    c.execute("PRAGMA auto_vacuum = INCREMENTAL")
     
     # Users Table
     c.execute('''CREATE TABLE IF NOT EXISTS users
@@ -21,8 +56,24 @@ def init_db():
                   dob TEXT, 
                   tob TEXT, 
                   city TEXT,
+                  lat REAL,
+                  lon REAL,
+                  tz_offset REAL,
+                  chart BLOB,
+                  chart_version TEXT,
+                  moon_nakshatra INTEGER,
+                  moon_sign INTEGER,
+                  manglik INTEGER,
                   FOREIGN KEY(username) REFERENCES users(username))''')
-    
+
+    # Older databases predate the resolved location / stored chart columns
+    existing = {row[1] for row in c.execute("PRAGMA table_info(profiles)")}
+    for column, col_type in [("lat", "REAL"), ("lon", "REAL"), ("tz_offset", "REAL"),
+                             ("chart", "BLOB"), ("chart_version", "TEXT"), ("moon_nakshatra", "INTEGER"),
+                             ("moon_sign", "INTEGER"), ("manglik", "INTEGER")]:
+        if column not in existing:
+            c.execute(f"ALTER TABLE profiles ADD COLUMN {column} {col_type}")
+
     # Conversations Table
     c.execute('''CREATE TABLE IF NOT EXISTS conversations
                  (id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -41,13 +92,160 @@ def init_db():
                   timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
                   FOREIGN KEY(username) REFERENCES users(username),
                   FOREIGN KEY(conversation_id) REFERENCES conversations(id))''')
-    
+
+    # Compacted conversations: all messages as one compressed JSON blob
+    c.execute('''CREATE TABLE IF NOT EXISTS conversation_archives
+                 (conversation_id INTEGER PRIMARY KEY,
+                  username TEXT,
+                  messages BLOB,
+                  message_count INTEGER,
+                  archived_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                  FOREIGN KEY(conversation_id) REFERENCES conversations(id))''')
+
+    # Per-user retention quotas (users without a row get DEFAULT_MAX_CONVERSATIONS)
+    c.execute('''CREATE TABLE IF NOT EXISTS user_quotas
+                 (username TEXT PRIMARY KEY,
+                  max_conversations INTEGER,
+                  FOREIGN KEY(username) REFERENCES users(username))''')
+
+    # Background job queue (see jobs.py); payload and result are pack_json blobs
+    c.execute('''CREATE TABLE IF NOT EXISTS jobs
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  username TEXT,
+                  kind TEXT,
+                  status TEXT,
+                  payload BLOB,
+                  result BLOB,
+                  error TEXT,
+                  trace BLOB,
+                  worker TEXT,
+                  created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                  started_at DATETIME,
+                  finished_at DATETIME,
+                  heartbeat_at DATETIME,
+                  affinity TEXT)''')
+
+    existing = {row[1] for row in c.execute("PRAGMA table_info(jobs)")}
+    for column, col_type in [("trace", "BLOB"), ("run_after", "REAL"), ("heartbeat_at", "DATETIME"),
+                             ("affinity", "TEXT")]:
+        if column not in existing:
+            c.execute(f"ALTER TABLE jobs ADD COLUMN {column} {col_type}")
+
+    # Rate limiting token buckets, shared by every process using this database
+    c.execute('''CREATE TABLE IF NOT EXISTS rate_buckets
+                 (key TEXT PRIMARY KEY,
+                  tokens REAL,
+                  updated REAL)''')
+
+    c.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_chats_conversation ON chats(conversation_id, id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_chats_username ON chats(username)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_conversations_username ON conversations(username, id)")
+
+    # Full-text index over chats (external content table kept in sync by triggers)
+    try:
+        fts_exists = c.execute("SELECT 1 FROM sqlite_master WHERE name = 'chats_fts'").fetchone()
+        c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS chats_fts
+                     USING fts5(content, username, content='chats', content_rowid='id')''')
+        c.execute('''CREATE TRIGGER IF NOT EXISTS chats_fts_ai AFTER INSERT ON chats BEGIN
+                         INSERT INTO chats_fts(rowid, content, username) VALUES (new.id, new.content, new.username);
+                     END''')
+        c.execute('''CREATE TRIGGER IF NOT EXISTS chats_fts_ad AFTER DELETE ON chats BEGIN
+                         INSERT INTO chats_fts(chats_fts, rowid, content, username)
+                         VALUES ('delete', old.id, old.content, old.username);
+                     END''')
+        c.execute('''CREATE TRIGGER IF NOT EXISTS chats_fts_au AFTER UPDATE ON chats BEGIN
+                         INSERT INTO chats_fts(chats_fts, rowid, content, username)
+                         VALUES ('delete', old.id, old.content, old.username);
+                         INSERT INTO chats_fts(rowid, content, username) VALUES (new.id, new.content, new.username);
+                     END''')
+        if not fts_exists:
+            # Index chats written before the FTS table existed
+            c.execute("INSERT INTO chats_fts(chats_fts) VALUES ('rebuild')")
+    except sqlite3.OperationalError:
+        # SQLite build without FTS5; search_chats_sqlite returns no results
+        pass
+
     conn.commit()
     conn.close()
 
 def hash_password(password):
     return hashlib.sha256(str.encode(password)).hexdigest()
 
+def pack_json(value):
+    """Serialize a chart dict (or any JSON value) to compressed bytes for storage."""
+    return zlib.compress(json.dumps(value, separators=(",", ":")).encode("utf-8"))
+
+def unpack_json(blob):
+    """Inverse of pack_json. Returns None for missing blobs."""
+    if not blob:
+        return None
+    return json.loads(zlib.decompress(bytes(blob)).decode("utf-8"))
+
+def _moon_placement(chart):
+    """
+    (Moon nakshatra index, Moon sign index, Manglik flag) of a chart dict, as
+    stored with a profile for matching (see matching.moon_profile), or None.
+    """
+    if not chart:
+        return None
+    from chart_model import Chart
+    from matching import moon_profile
+    moon = moon_profile(Chart.from_engine(chart))
+    return moon and (moon[0], moon[1], bool(moon[2]))
+
+def _search_terms(query):
+    return re.findall(r"\w+", query or "")
+
+def _fts_query(username, query):
+    """
+    Build a safe FTS5 MATCH expression: the user's rows only, every query term
+    required in the content and the last one matched as a prefix.
+    """
+    terms = _search_terms(query)
+    if not terms:
+        return None
+    user_phrase = " ".join(_search_terms(username))
+    clauses = [f'username:"{user_phrase}"'] if user_phrase else []
+    clauses += [f'content:"{t}"' for t in terms]
+    clauses[-1] += "*"
+    return " AND ".join(clauses)
+
+def _highlight(text, query, width=160):
+    """Snippet of text around the first matching term with terms wrapped in **."""
+    terms = _search_terms(query)
+    if not terms:
+        return text[:width]
+    pattern = re.compile("|".join(re.escape(t) for t in terms), re.IGNORECASE)
+    match = pattern.search(text)
+    start = max(0, match.start() - width // 3) if match else 0
+    snippet = text[start:start + width]
+    snippet = pattern.sub(lambda m: f"**{m.group(0)}**", snippet)
+    return ("…" if start > 0 else "") + snippet + ("…" if start + width < len(text) else "")
+
+def _backend_key(db_or_none):
+    return ("sqlite", DB_NAME) if db_or_none is None else ("mongo", db_or_none.name)
+
+def _cached_read(db_or_none, kind, username, loader):
+    key = (_backend_key(db_or_none), kind, username)
+    now = time.monotonic()
+    with _read_cache_lock:
+        hit = _read_cache.get(key)
+    if hit and hit[0] > now:
+        return list(hit[1])
+    value = list(loader())
+    with _read_cache_lock:
+        _read_cache[key] = (now + READ_CACHE_TTL, value)
+    return list(value)
+
+def invalidate_read_cache(db_or_none, kind, username=None):
+    """Drop cached reads of one kind for a user, or for every user when username is None."""
+    backend = _backend_key(db_or_none)
+    with _read_cache_lock:
+        for key in list(_read_cache):
+            if key[0] == backend and key[1] == kind and (username is None or key[2] == username):
+                del _read_cache[key]
+
 # SQLite functions (for local development)
 def add_user_sqlite(username, password):
     init_db()
@@ -71,11 +269,15 @@ def login_user_sqlite(username, password):
     conn.close()
     return data
 
-def save_profile_sqlite(username, profile_name, dob, tob, city):
+def save_profile_sqlite(username, profile_name, dob, tob, city,
+                        lat=None, lon=None, tz_offset=None, chart=None, chart_version=None, moon=None):
     conn = sqlite3.connect(DB_NAME)
     c = conn.cursor()
-    c.execute("INSERT INTO profiles (username, profile_name, dob, tob, city) VALUES (?, ?, ?, ?, ?)", 
-              (username, profile_name, dob, tob, city))
+    c.execute("""INSERT INTO profiles (username, profile_name, dob, tob, city, lat, lon, tz_offset, chart, chart_version,
+                                       moon_nakshatra, moon_sign, manglik)
+                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+              (username, profile_name, dob, tob, city, lat, lon, tz_offset,
+               pack_json(chart) if chart else None, chart_version, *(moon or (None, None, None))))
     conn.commit()
     conn.close()
 
@@ -87,6 +289,52 @@ def get_user_profiles_sqlite(username):
     conn.close()
     return data
 
+def get_profile_chart_sqlite(username, profile):
+    conn = sqlite3.connect(DB_NAME)
+    c = conn.cursor()
+    c.execute("""SELECT lat, lon, tz_offset, chart, chart_version FROM profiles
+                 WHERE username = ? AND profile_name = ? AND dob = ? AND tob = ? AND city = ?
+                 ORDER BY id DESC LIMIT 1""",
+              (username, *profile))
+    row = c.fetchone()
+    conn.close()
+    if not row:
+        return None
+    return {"lat": row[0], "lon": row[1], "tz_offset": row[2],
+            "chart": unpack_json(row[3]), "chart_version": row[4]}
+
+def get_profile_moons_sqlite(username):
+    conn = sqlite3.connect(DB_NAME)
+    c = conn.cursor()
+    rows = c.execute("""SELECT id, profile_name, moon_nakshatra, moon_sign, manglik FROM profiles
+                        WHERE username = ? AND chart IS NOT NULL ORDER BY id""", (username,)).fetchall()
+    moons = []
+    for row_id, profile_name, *moon in rows:
+        if moon[1] is None:
+            # Saved or imported before placements were stored: read the chart once and keep the result
+            chart = c.execute("SELECT chart FROM profiles WHERE id = ?", (row_id,)).fetchone()[0]
+            moon = _moon_placement(unpack_json(chart))
+            if moon is None:
+                continue
+            c.execute("UPDATE profiles SET moon_nakshatra = ?, moon_sign = ?, manglik = ? WHERE id = ?",
+                      (*moon, row_id))
+        moons.append((profile_name, (moon[0], moon[1], bool(moon[2]))))
+    conn.commit()
+    conn.close()
+    return moons
+
+def update_profile_chart_sqlite(username, profile, lat, lon, tz_offset, chart, chart_version, moon=None):
+    conn = sqlite3.connect(DB_NAME)
+    c = conn.cursor()
+    # Rows with the same name and birth details share the chart; other same-named profiles keep theirs
+    c.execute("""UPDATE profiles SET lat = ?, lon = ?, tz_offset = ?, chart = ?, chart_version = ?,
+                                     moon_nakshatra = ?, moon_sign = ?, manglik = ?
+                 WHERE username = ? AND profile_name = ? AND dob = ? AND tob = ? AND city = ?""",
+              (lat, lon, tz_offset, pack_json(chart), chart_version, *(moon or (None, None, None)),
+               username, *profile))
+    conn.commit()
+    conn.close()
+
 def create_conversation_sqlite(username, title="New Chat"):
     conn = sqlite3.connect(DB_NAME)
     c = conn.cursor()
@@ -94,6 +342,7 @@ def create_conversation_sqlite(username, title="New Chat"):
     conn.commit()
     new_id = str(c.lastrowid)
     conn.close()
+    enforce_quota_sqlite(username)
     return new_id
 
 def get_user_conversations_sqlite(username):
@@ -109,12 +358,31 @@ def delete_conversation_sqlite(conversation_id):
     conn = sqlite3.connect(DB_NAME)
     c = conn.cursor()
     c.execute("DELETE FROM chats WHERE conversation_id = ?", (conversation_id,))
+    c.execute("DELETE FROM conversation_archives WHERE conversation_id = ?", (conversation_id,))
     c.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
     conn.commit()
     conn.close()
 
+def _rehydrate_sqlite(conn, conversation_id):
+    """Restore an archived conversation's messages into chats, if it has an archive (commits)."""
+    # Live conversations (nearly every call) are a read, with no write lock taken
+    if not conn.execute("SELECT 1 FROM conversation_archives WHERE conversation_id = ?",
+                        (conversation_id,)).fetchone():
+        return
+    # Re-read under the write lock, so two concurrent opens restore the archive once
+    conn.execute("BEGIN IMMEDIATE")
+    row = conn.execute("SELECT messages FROM conversation_archives WHERE conversation_id = ?",
+                       (conversation_id,)).fetchone()
+    if row:
+        messages = unpack_json(row[0])
+        conn.executemany("INSERT INTO chats (username, role, content, conversation_id, timestamp) VALUES (?, ?, ?, ?, ?)",
+                         [(m["username"], m["role"], m["content"], conversation_id, m["timestamp"]) for m in messages])
+        conn.execute("DELETE FROM conversation_archives WHERE conversation_id = ?", (conversation_id,))
+    conn.commit()
+
 def save_chat_sqlite(username, role, content, conversation_id):
-    conn = sqlite3.connect(DB_NAME)
+    conn = sqlite3.connect(DB_NAME, timeout=30)
+    _rehydrate_sqlite(conn, conversation_id)
     c = conn.cursor()
     c.execute("INSERT INTO chats (username, role, content, conversation_id) VALUES (?, ?, ?, ?)", 
               (username, role, content, conversation_id))
@@ -122,23 +390,342 @@ def save_chat_sqlite(username, role, content, conversation_id):
     conn.close()
 
 def get_chat_history_sqlite(conversation_id):
-    conn = sqlite3.connect(DB_NAME)
+    conn = sqlite3.connect(DB_NAME, timeout=30)
+    _rehydrate_sqlite(conn, conversation_id)
     c = conn.cursor()
     c.execute("SELECT role, content FROM chats WHERE conversation_id = ? ORDER BY id ASC", (conversation_id,))
     data = c.fetchall()
     conn.close()
     return [{"role": r, "content": c} for r, c in data]
 
+def search_chats_sqlite(username, query, limit=20, offset=0):
+    match = _fts_query(username, query)
+    if not match:
+        return []
+    conn = sqlite3.connect(DB_NAME)
+    c = conn.cursor()
+    try:
+        # The username column narrows the MATCH; the join filter keeps it exact
+        c.execute("""SELECT chats.conversation_id, conversations.title, chats.role,
+                            snippet(chats_fts, 0, '**', '**', '…', 16), chats.timestamp, bm25(chats_fts)
+                     FROM chats_fts
+                     JOIN chats ON chats.id = chats_fts.rowid
+                     LEFT JOIN conversations ON conversations.id = chats.conversation_id
+                     WHERE chats_fts MATCH ? AND chats.username = ?
+                     ORDER BY bm25(chats_fts)
+                     LIMIT ? OFFSET ?""",
+                  (match, username, limit, offset))
+        data = c.fetchall()
+    except sqlite3.OperationalError:
+        data = []
+    finally:
+        conn.close()
+    return [{"conversation_id": str(r[0]), "title": r[1], "role": r[2], "snippet": r[3],
+             "timestamp": str(r[4]), "score": -r[5]} for r in data]
+
 def clear_chat_history_sqlite(username):
-    pass
+    conn = sqlite3.connect(DB_NAME)
+    c = conn.cursor()
+    c.execute("DELETE FROM chats WHERE username = ?", (username,))
+    c.execute("DELETE FROM conversation_archives WHERE username = ?", (username,))
+    c.execute("DELETE FROM conversations WHERE username = ?", (username,))
+    conn.commit()
+    conn.close()
+
+def compact_conversations_sqlite(idle_days=ARCHIVE_AFTER_DAYS, username=None):
+    """Archive conversations with no messages for idle_days. Returns how many were compacted."""
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=idle_days)).strftime("%Y-%m-%d %H:%M:%S")
+    conn = sqlite3.connect(DB_NAME)
+    c = conn.cursor()
+    query = "SELECT conversation_id FROM chats"
+    params = ()
+    if username:
+        query += " WHERE username = ?"
+        params = (username,)
+    query += " GROUP BY conversation_id HAVING MAX(timestamp) < ?"
+    c.execute(query, params + (cutoff,))
+    idle_ids = [r[0] for r in c.fetchall()]
+    compacted = 0
+    for conversation_id in idle_ids:
+        # Read, archive and delete under one write lock, so a message saved
+        # meanwhile is neither deleted unarchived nor lets the chat be compacted
+        c.execute("BEGIN IMMEDIATE")
+        c.execute("""SELECT id, username, role, content, timestamp FROM chats WHERE conversation_id = ?
+                     ORDER BY id ASC""", (conversation_id,))
+        rows = c.fetchall()
+        if not rows or max(r[4] for r in rows) >= cutoff:
+            conn.commit()
+            continue
+        messages = [{"username": u, "role": r, "content": t, "timestamp": ts} for _, u, r, t, ts in rows]
+        # A message saved just after an earlier compaction sits beside its archive
+        c.execute("SELECT messages FROM conversation_archives WHERE conversation_id = ?", (conversation_id,))
+        archived = c.fetchone()
+        if archived:
+            messages = unpack_json(archived[0]) + messages
+        c.execute("""INSERT OR REPLACE INTO conversation_archives (conversation_id, username, messages, message_count)
+                     VALUES (?, ?, ?, ?)""",
+                  (conversation_id, messages[0]["username"], pack_json(messages), len(messages)))
+        c.execute("DELETE FROM chats WHERE conversation_id = ? AND id <= ?", (conversation_id, rows[-1][0]))
+        conn.commit()
+        compacted += 1
+    conn.close()
+    return compacted
+
+def set_user_quota_sqlite(username, max_conversations):
+    conn = sqlite3.connect(DB_NAME)
+    c = conn.cursor()
+    c.execute("INSERT OR REPLACE INTO user_quotas (username, max_conversations) VALUES (?, ?)",
+              (username, max_conversations))
+    conn.commit()
+    conn.close()
+
+def enforce_quota_sqlite(username):
+    """Delete a user's oldest conversations beyond their quota. Returns how many were removed."""
+    conn = sqlite3.connect(DB_NAME)
+    c = conn.cursor()
+    c.execute("SELECT max_conversations FROM user_quotas WHERE username = ?", (username,))
+    row = c.fetchone()
+    quota = row[0] if row and row[0] is not None else DEFAULT_MAX_CONVERSATIONS
+    c.execute("SELECT id FROM conversations WHERE username = ? ORDER BY id DESC LIMIT -1 OFFSET ?",
+              (username, quota))
+    excess = [(r[0],) for r in c.fetchall()]
+    if excess:
+        c.executemany("DELETE FROM chats WHERE conversation_id = ?", excess)
+        c.executemany("DELETE FROM conversation_archives WHERE conversation_id = ?", excess)
+        c.executemany("DELETE FROM conversations WHERE id = ?", excess)
+        conn.commit()
+    conn.close()
+    return len(excess)
+
+def vacuum_sqlite():
+    """Return free pages to the OS: incremental when enabled, otherwise a one-off full VACUUM that enables it."""
+    conn = sqlite3.connect(DB_NAME)
+    c = conn.cursor()
+    mode = c.execute("PRAGMA auto_vacuum").fetchone()[0]
+    if mode == 2:
+        c.execute("PRAGMA incremental_vacuum")
+        c.fetchall()
+    else:
+        c.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        c.execute("VACUUM")
+    conn.close()
+
+def run_maintenance_sqlite(idle_days=ARCHIVE_AFTER_DAYS):
+    init_db()
+    conn = sqlite3.connect(DB_NAME)
+    usernames = [r[0] for r in conn.execute("SELECT DISTINCT username FROM conversations")]
+    conn.close()
+    stats = {"compacted": compact_conversations_sqlite(idle_days),
+             "deleted_over_quota": sum(enforce_quota_sqlite(u) for u in usernames),
+             "purged_jobs": purge_jobs_sqlite()}
+    vacuum_sqlite()
+    return stats
+
+def submit_job_sqlite(username, kind, payload, run_after=None, affinity=None):
+    conn = sqlite3.connect(DB_NAME)
+    c = conn.cursor()
+    c.execute("""INSERT INTO jobs (username, kind, status, payload, run_after, affinity)
+                 VALUES (?, ?, 'queued', ?, ?, ?)""",
+              (username, kind, pack_json(payload), run_after, affinity))
+    job_id = c.lastrowid
+    conn.commit()
+    conn.close()
+    return job_id
+
+def claim_job_sqlite(worker, affinity=None):
+    # BEGIN IMMEDIATE takes the write lock up front so two workers can't claim the same row
+    conn = sqlite3.connect(DB_NAME, timeout=30, isolation_level=None)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("""SELECT id, username, kind, payload FROM jobs
+                              WHERE status = 'queued' AND (run_after IS NULL OR run_after <= ?)
+                                AND (affinity IS NULL OR affinity = ?)
+                              ORDER BY id LIMIT 1""", (time.time(), affinity)).fetchone()
+        if row:
+            conn.execute("""UPDATE jobs SET status = 'running', worker = ?, started_at = CURRENT_TIMESTAMP,
+                            heartbeat_at = CURRENT_TIMESTAMP WHERE id = ?""", (worker, row[0]))
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+    if not row:
+        return None
+    return {"id": row[0], "username": row[1], "kind": row[2], "payload": unpack_json(row[3])}
+
+def heartbeat_job_sqlite(job_id, worker):
+    conn = sqlite3.connect(DB_NAME, timeout=30)
+    c = conn.cursor()
+    c.execute("""UPDATE jobs SET heartbeat_at = CURRENT_TIMESTAMP
+                 WHERE id = ? AND worker = ? AND status = 'running'""", (job_id, worker))
+    owned = c.rowcount == 1
+    conn.commit()
+    conn.close()
+    return owned
+
+def finish_job_sqlite(job_id, worker, result=None, error=None, trace=None):
+    conn = sqlite3.connect(DB_NAME, timeout=30)
+    c = conn.cursor()
+    c.execute("""UPDATE jobs SET status = ?, result = ?, error = ?, trace = ?, payload = NULL,
+                 finished_at = CURRENT_TIMESTAMP WHERE id = ? AND worker = ? AND status = 'running'""",
+              ("failed" if error else "done", pack_json(result), error, pack_json(trace), job_id, worker))
+    owned = c.rowcount == 1
+    conn.commit()
+    conn.close()
+    return owned
+
+def get_job_sqlite(job_id, username=None):
+    conn = sqlite3.connect(DB_NAME)
+    c = conn.cursor()
+    query = """SELECT id, username, kind, status, result, error, created_at, started_at, finished_at, trace
+               FROM jobs WHERE id = ?"""
+    params = [job_id]
+    if username is not None:
+        query += " AND username = ?"
+        params.append(username)
+    row = c.execute(query, params).fetchone()
+    conn.close()
+    if not row:
+        return None
+    return {"id": row[0], "username": row[1], "kind": row[2], "status": row[3], "result": unpack_json(row[4]),
+            "error": row[5], "created_at": row[6], "started_at": row[7], "finished_at": row[8],
+            "trace": unpack_json(row[9])}
+
+def requeue_stale_jobs_sqlite(stale_after=JOB_STALE_AFTER):
+    conn = sqlite3.connect(DB_NAME, timeout=30)
+    c = conn.cursor()
+    # Jobs claimed before leases existed have no heartbeat_at; their start time stands in
+    c.execute("""UPDATE jobs SET status = 'queued', worker = NULL, started_at = NULL, heartbeat_at = NULL
+                 WHERE status = 'running' AND COALESCE(heartbeat_at, started_at) < datetime('now', ?)""",
+              (f"-{int(stale_after)} seconds",))
+    count = c.rowcount
+    conn.commit()
+    conn.close()
+    return count
+
+def purge_jobs_sqlite(retention_days=JOB_RETENTION_DAYS):
+    conn = sqlite3.connect(DB_NAME, timeout=30)
+    c = conn.cursor()
+    c.execute("""DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < datetime('now', ?)""",
+              (f"-{int(retention_days)} days",))
+    count = c.rowcount
+    conn.commit()
+    conn.close()
+    return count
+
+def _take_token(tokens, updated, now, rate, burst, max_wait):
+    """
+    Token bucket step shared by both backends. Returns (granted, wait, tokens):
+    a granted token may be reserved up to max_wait seconds ahead (wait is
+    when it becomes available); a refused one says how long until a request
+    would be granted.
+    """
+    tokens = burst if tokens is None else min(burst, tokens + max(0.0, now - updated) * rate)
+    wait = max(0.0, (1 - tokens) / rate)
+    if wait > max_wait:
+        return False, wait - max_wait, tokens
+    return True, wait, tokens - 1
+
+def take_token_sqlite(key, rate, burst, max_wait):
+    # BEGIN IMMEDIATE serializes concurrent takes on the same bucket
+    conn = sqlite3.connect(DB_NAME, timeout=30, isolation_level=None)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("SELECT tokens, updated FROM rate_buckets WHERE key = ?", (key,)).fetchone()
+        now = time.time()
+        granted, wait, tokens = _take_token(row[0] if row else None, row[1] if row else now, now,
+                                            rate, burst, max_wait)
+        if granted:
+            conn.execute("INSERT OR REPLACE INTO rate_buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                         (key, tokens, now))
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+    return granted, wait
+
+def refund_token_sqlite(key, burst):
+    conn = sqlite3.connect(DB_NAME, timeout=30)
+    conn.execute("UPDATE rate_buckets SET tokens = MIN(?, tokens + 1) WHERE key = ?", (burst, key))
+    conn.commit()
+    conn.close()
 
 # MongoDB functions (for cloud deployment) - same as before
-try:
-    from bson.objectid import ObjectId
+# pymongo is imported where it is used, so SQLite deployments never load it
+MONGO_AVAILABLE = importlib.util.find_spec("pymongo") is not None
+
+# Client settings shared by the app and the job workers: a bounded pool per
+# process, timeouts well under a page load, majority writes and reads so
+# every replica reads what another acknowledged, and one automatic retry of
+# reads and single-document writes after a failover or dropped connection.
+# Overridable per deployment (see connect_mongo).
+MONGO_CLIENT_OPTIONS = {
+    "maxPoolSize": 50,
+    "minPoolSize": 1,
+    "maxIdleTimeMS": 5 * 60 * 1000,
+    "waitQueueTimeoutMS": 5000,
+    "connectTimeoutMS": 5000,
+    "serverSelectionTimeoutMS": 5000,
+    "socketTimeoutMS": 30000,
+    "w": "majority",
+    "wTimeoutMS": 10000,
+    "readConcernLevel": "majority",
+    "retryReads": True,
+    "retryWrites": True,
+}
+
+# Liveness is pinged at most once per MONGO_HEALTH_TTL seconds per client;
+# timeouts and dropped connections are retried MONGO_HEALTH_RETRIES times.
+MONGO_HEALTH_TTL = 15
+MONGO_HEALTH_RETRIES = 1
+MONGO_PING_TIMEOUT = 2.0
+
+_mongo_health = {}
+_mongo_health_refreshing = set()
+_mongo_health_lock = threading.Lock()
+
+def ObjectId(value):
+    from bson.objectid import ObjectId as _ObjectId
+    return _ObjectId(value)
+
+def connect_mongo(uri, **options):
+    """A TLS MongoClient with MONGO_CLIENT_OPTIONS, updated with any options given."""
+    import certifi
+    import pymongo
+    return pymongo.MongoClient(uri, tls=True, tlsCAFile=certifi.where(), **{**MONGO_CLIENT_OPTIONS, **options})
+
+def mongo_health(client, ttl=MONGO_HEALTH_TTL):
+    """
+    (ok, error message or None) for a MongoClient, from a ping cached for ttl
+    seconds. While one caller refreshes an expired result, others get the
+    previous one instead of waiting on the server too.
+    """
     import pymongo
-    MONGO_AVAILABLE = True
-except ImportError:
-    MONGO_AVAILABLE = False
+    from pymongo.errors import AutoReconnect
+
+    key = id(client)
+    now = time.monotonic()
+    with _mongo_health_lock:
+        hit = _mongo_health.get(key)
+        if hit and (hit[0] > now or key in _mongo_health_refreshing):
+            return hit[1]
+        _mongo_health_refreshing.add(key)
+    result = (False, "not checked")
+    try:
+        for attempt in range(MONGO_HEALTH_RETRIES + 1):
+            try:
+                with pymongo.timeout(MONGO_PING_TIMEOUT):
+                    client.admin.command("ping")
+                result = (True, None)
+                break
+            except AutoReconnect as e:
+                # Network errors, timeouts and failed server selection are transient
+                result = (False, str(e))
+            except Exception as e:
+                result = (False, str(e))
+                break
+    finally:
+        with _mongo_health_lock:
+            _mongo_health[key] = (time.monotonic() + ttl, result)
+            _mongo_health_refreshing.discard(key)
+    return result
 
 def add_user_mongo(db, username, password):
     users = db.users
@@ -152,21 +739,67 @@ def login_user_mongo(db, username, password):
     user = users.find_one({"username": username, "password": hash_password(password)})
     return user
 
-def save_profile_mongo(db, username, profile_name, dob, tob, city):
+def save_profile_mongo(db, username, profile_name, dob, tob, city,
+                       lat=None, lon=None, tz_offset=None, chart=None, chart_version=None, moon=None):
     profiles = db.profiles
     profiles.insert_one({
         "username": username,
         "profile_name": profile_name,
         "dob": dob,
         "tob": tob,
-        "city": city
+        "city": city,
+        "lat": lat,
+        "lon": lon,
+        "tz_offset": tz_offset,
+        "chart": pack_json(chart) if chart else None,
+        "chart_version": chart_version,
+        "moon": list(moon) if moon else None
     })
 
 def get_user_profiles_mongo(db, username):
     profiles = db.profiles
-    data = list(profiles.find({"username": username}))
+    data = list(profiles.find({"username": username}, {"chart": 0}))
     return [(p["profile_name"], p["dob"], p["tob"], p["city"]) for p in data]
 
+def _profile_query(username, profile):
+    profile_name, dob, tob, city = profile
+    return {"username": username, "profile_name": profile_name, "dob": dob, "tob": tob, "city": city}
+
+def get_profile_chart_mongo(db, username, profile):
+    profiles = db.profiles
+    p = profiles.find_one(_profile_query(username, profile), sort=[("_id", -1)])
+    if not p:
+        return None
+    return {"lat": p.get("lat"), "lon": p.get("lon"), "tz_offset": p.get("tz_offset"),
+            "chart": unpack_json(p.get("chart")), "chart_version": p.get("chart_version")}
+
+def get_profile_moons_mongo(db, username):
+    profiles = db.profiles
+    moons = []
+    for p in profiles.find({"username": username, "chart": {"$ne": None}},
+                           {"profile_name": 1, "moon": 1}).sort("_id", 1):
+        moon = p.get("moon")
+        if not moon:
+            # Saved or imported before placements were stored: read the chart once and keep the result
+            chart = profiles.find_one({"_id": p["_id"]}, {"chart": 1})
+            moon = chart and _moon_placement(unpack_json(chart.get("chart")))
+            if not moon:
+                continue
+            profiles.update_one({"_id": p["_id"]}, {"$set": {"moon": list(moon)}})
+        moons.append((p["profile_name"], (moon[0], moon[1], bool(moon[2]))))
+    return moons
+
+def update_profile_chart_mongo(db, username, profile, lat, lon, tz_offset, chart, chart_version, moon=None):
+    profiles = db.profiles
+    profiles.update_many(_profile_query(username, profile), {"$set": {
+        "lat": lat,
+        "lon": lon,
+        "tz_offset": tz_offset,
+        "chart": pack_json(chart),
+        "chart_version": chart_version,
+        "moon": list(moon) if moon else None
+    }})
+
 def create_conversation_mongo(db, username, title="New Chat"):
     conversations = db.conversations
     result = conversations.insert_one({
@@ -174,11 +807,12 @@ def create_conversation_mongo(db, username, title="New Chat"):
         "title": title,
         "created_at": datetime.now(timezone.utc)
     })
+    enforce_quota_mongo(db, username)
     return str(result.inserted_id)
 
 def get_user_conversations_mongo(db, username):
     conversations = db.conversations
-    data = list(conversations.find({"username": username}).sort("_id", -1))
+    data = list(conversations.find({"username": username}, {"archive": 0}).sort("_id", -1))
     return [(str(c["_id"]), c["title"], str(c["created_at"])) for c in data]
 
 def delete_conversation_mongo(db, conversation_id):
@@ -190,7 +824,34 @@ def delete_conversation_mongo(db, conversation_id):
     except Exception:
         pass
 
+def _rehydrate_mongo(db, conversation_id):
+    """Restore an archived conversation's messages into chats."""
+    try:
+        oid = ObjectId(conversation_id)
+    except Exception:
+        return
+    from pymongo import ReturnDocument
+    # Claim the archive atomically, so two concurrent opens can't both restore it
+    conv = db.conversations.find_one_and_update(
+        {"_id": oid, "archive": {"$exists": True}},
+        {"$unset": {"archive": "", "archived_at": "", "message_count": ""}},
+        projection={"archive": 1},
+        return_document=ReturnDocument.BEFORE
+    )
+    if not conv:
+        return
+    messages = unpack_json(conv["archive"])
+    if messages:
+        db.chats.insert_many([{
+            "username": m["username"],
+            "role": m["role"],
+            "content": m["content"],
+            "conversation_id": conversation_id,
+            "timestamp": datetime.fromisoformat(m["timestamp"])
+        } for m in messages])
+
 def save_chat_mongo(db, username, role, content, conversation_id):
+    _rehydrate_mongo(db, conversation_id)
     chats = db.chats
     chats.insert_one({
         "username": username,
@@ -201,60 +862,425 @@ def save_chat_mongo(db, username, role, content, conversation_id):
     })
 
 def get_chat_history_mongo(db, conversation_id):
+    _rehydrate_mongo(db, conversation_id)
     chats = db.chats
     data = list(chats.find({"conversation_id": conversation_id}).sort("timestamp", 1))
     return [{"role": c["role"], "content": c["content"]} for c in data]
 
+_mongo_indexed = set()
+
+def ensure_indexes_mongo(db):
+    """Create the indexes the Mongo backend relies on (once per process per database)."""
+    if db.name in _mongo_indexed:
+        return
+    import pymongo
+    # Compound text index: every $text query is scoped to one user
+    db.chats.create_index([("username", pymongo.ASCENDING), ("content", pymongo.TEXT)],
+                          name="chats_username_content_text")
+    db.chats.create_index([("conversation_id", pymongo.ASCENDING), ("timestamp", pymongo.ASCENDING)])
+    db.conversations.create_index([("username", pymongo.ASCENDING), ("_id", pymongo.DESCENDING)])
+    db.jobs.create_index([("status", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)])
+    _mongo_indexed.add(db.name)
+
+def search_chats_mongo(db, username, query, limit=20, offset=0):
+    if not _search_terms(query):
+        return []
+    ensure_indexes_mongo(db)
+    cursor = db.chats.find(
+        {"username": username, "$text": {"$search": query}},
+        {"score": {"$meta": "textScore"}, "role": 1, "content": 1, "conversation_id": 1, "timestamp": 1}
+    ).sort([("score", {"$meta": "textScore"})]).skip(offset).limit(limit)
+    hits = list(cursor)
+    # One round trip for all titles on the page
+    oids = []
+    for h in hits:
+        try:
+            oids.append(ObjectId(h["conversation_id"]))
+        except Exception:
+            pass
+    titles = {str(c["_id"]): c["title"] for c in db.conversations.find({"_id": {"$in": oids}}, {"title": 1})}
+    return [{"conversation_id": h["conversation_id"], "title": titles.get(h["conversation_id"]),
+             "role": h["role"], "snippet": _highlight(h["content"], query),
+             "timestamp": str(h["timestamp"]), "score": h["score"]} for h in hits]
+
 def clear_chat_history_mongo(db, username):
-    pass
+    db.chats.delete_many({"username": username})
+    db.conversations.delete_many({"username": username})
+
+def compact_conversations_mongo(db, idle_days=ARCHIVE_AFTER_DAYS, username=None):
+    """Archive conversations with no messages for idle_days. Returns how many were compacted."""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=idle_days)
+    pipeline = [{"$match": {"username": username}}] if username else []
+    pipeline += [
+        {"$group": {"_id": "$conversation_id", "last": {"$max": "$timestamp"}}},
+        {"$match": {"last": {"$lt": cutoff}}}
+    ]
+    compacted = 0
+    for g in db.chats.aggregate(pipeline):
+        conversation_id = g["_id"]
+        try:
+            oid = ObjectId(conversation_id)
+        except Exception:
+            continue
+        chats = list(db.chats.find({"conversation_id": conversation_id}).sort("timestamp", 1))
+        messages = [{"username": c["username"], "role": c["role"], "content": c["content"],
+                     "timestamp": c["timestamp"].isoformat()} for c in chats]
+        archived = db.conversations.update_one({"_id": oid, "archive": {"$exists": False}}, {"$set": {
+            "archive": pack_json(messages),
+            "archived_at": datetime.now(timezone.utc),
+            "message_count": len(messages)
+        }})
+        # Chats of a missing (or already archived) conversation are left alone; only the
+        # messages now in the archive are removed, not any that arrived meanwhile
+        if archived.matched_count == 1:
+            db.chats.delete_many({"_id": {"$in": [c["_id"] for c in chats]}})
+            compacted += 1
+    return compacted
 
-# Wrapper functions that route to SQLite or MongoDB
+def set_user_quota_mongo(db, username, max_conversations):
+    db.user_quotas.update_one({"username": username},
+                              {"$set": {"max_conversations": max_conversations}}, upsert=True)
+
+def enforce_quota_mongo(db, username):
+    """Delete a user's oldest conversations beyond their quota. Returns how many were removed."""
+    row = db.user_quotas.find_one({"username": username})
+    quota = row["max_conversations"] if row else DEFAULT_MAX_CONVERSATIONS
+    excess = [c["_id"] for c in db.conversations.find({"username": username}, {"_id": 1})
+              .sort("_id", -1).skip(quota)]
+    if excess:
+        db.chats.delete_many({"conversation_id": {"$in": [str(oid) for oid in excess]}})
+        db.conversations.delete_many({"_id": {"$in": excess}})
+    return len(excess)
+
+def run_maintenance_mongo(db, idle_days=ARCHIVE_AFTER_DAYS):
+    ensure_indexes_mongo(db)
+    return {"compacted": compact_conversations_mongo(db, idle_days),
+            "deleted_over_quota": sum(enforce_quota_mongo(db, u) for u in db.conversations.distinct("username")),
+            "purged_jobs": purge_jobs_mongo(db)}
+
+def submit_job_mongo(db, username, kind, payload, run_after=None, affinity=None):
+    ensure_indexes_mongo(db)
+    jobs = db.jobs
+    result = jobs.insert_one({
+        "username": username,
+        "kind": kind,
+        "status": "queued",
+        "payload": pack_json(payload),
+        "run_after": datetime.fromtimestamp(run_after, timezone.utc) if run_after else None,
+        "affinity": affinity,
+        "created_at": datetime.now(timezone.utc)
+    })
+    return str(result.inserted_id)
+
+def claim_job_mongo(db, worker, affinity=None):
+    from pymongo import ReturnDocument
+    jobs = db.jobs
+    job = jobs.find_one_and_update(
+        {"status": "queued", "$or": [{"run_after": None}, {"run_after": {"$lte": datetime.now(timezone.utc)}}],
+         "affinity": {"$in": [None, affinity]}},
+        {"$set": {"status": "running", "worker": worker, "started_at": datetime.now(timezone.utc),
+                  "heartbeat_at": datetime.now(timezone.utc)}},
+        sort=[("_id", 1)],
+        return_document=ReturnDocument.AFTER
+    )
+    if not job:
+        return None
+    return {"id": str(job["_id"]), "username": job["username"], "kind": job["kind"],
+            "payload": unpack_json(job.get("payload"))}
+
+def heartbeat_job_mongo(db, job_id, worker):
+    jobs = db.jobs
+    result = jobs.update_one({"_id": ObjectId(job_id), "worker": worker, "status": "running"},
+                             {"$set": {"heartbeat_at": datetime.now(timezone.utc)}})
+    return result.matched_count == 1
+
+def finish_job_mongo(db, job_id, worker, result=None, error=None, trace=None):
+    jobs = db.jobs
+    outcome = jobs.update_one({"_id": ObjectId(job_id), "worker": worker, "status": "running"}, {
+        "$set": {"status": "failed" if error else "done", "result": pack_json(result), "error": error,
+                 "trace": pack_json(trace), "finished_at": datetime.now(timezone.utc)},
+        "$unset": {"payload": ""}
+    })
+    return outcome.matched_count == 1
+
+def get_job_mongo(db, job_id, username=None):
+    jobs = db.jobs
+    query = {"_id": ObjectId(job_id)}
+    if username is not None:
+        query["username"] = username
+    job = jobs.find_one(query, {"payload": 0})
+    if not job:
+        return None
+    return {"id": str(job["_id"]), "username": job["username"], "kind": job["kind"], "status": job["status"],
+            "result": unpack_json(job.get("result")), "error": job.get("error"),
+            "created_at": job.get("created_at"), "started_at": job.get("started_at"),
+            "finished_at": job.get("finished_at"), "trace": unpack_json(job.get("trace"))}
+
+def requeue_stale_jobs_mongo(db, stale_after=JOB_STALE_AFTER):
+    jobs = db.jobs
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=stale_after)
+    # Jobs claimed before leases existed have no heartbeat_at; their start time stands in
+    result = jobs.update_many({"status": "running", "$or": [
+                                  {"heartbeat_at": {"$lt": cutoff}},
+                                  {"heartbeat_at": {"$exists": False}, "started_at": {"$lt": cutoff}}]},
+                              {"$set": {"status": "queued"},
+                               "$unset": {"worker": "", "started_at": "", "heartbeat_at": ""}})
+    return result.modified_count
+
+def purge_jobs_mongo(db, retention_days=JOB_RETENTION_DAYS):
+    jobs = db.jobs
+    cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    result = jobs.delete_many({"status": {"$in": ["done", "failed"]}, "finished_at": {"$lt": cutoff}})
+    return result.deleted_count
+
+def take_token_mongo(db, key, rate, burst, max_wait):
+    from pymongo.errors import DuplicateKeyError
+    buckets = db.rate_buckets
+    for _ in range(TOKEN_CAS_RETRIES):
+        doc = buckets.find_one({"_id": key})
+        now = time.time()
+        granted, wait, tokens = _take_token(doc["tokens"] if doc else None, doc["updated"] if doc else now, now,
+                                            rate, burst, max_wait)
+        if not granted:
+            return granted, wait
+        try:
+            if doc is None:
+                buckets.insert_one({"_id": key, "tokens": tokens, "updated": now})
+                return granted, wait
+            # Compare-and-set: only applies if no one else took a token since the read
+            if buckets.update_one({"_id": key, "updated": doc["updated"], "tokens": doc["tokens"]},
+                                  {"$set": {"tokens": tokens, "updated": now}}).modified_count:
+                return granted, wait
+        except DuplicateKeyError:
+            pass
+    # Heavy contention on one bucket: refuse rather than spin
+    return False, 1.0
+
+def refund_token_mongo(db, key, burst):
+    db.rate_buckets.update_one({"_id": key}, [{"$set": {"tokens": {"$min": [burst, {"$add": ["$tokens", 1]}]}}}])
+
+# Wrapper functions that route to SQLite or MongoDB (each call is timed, see tracing.py)
+@traced("db.add_user")
 def add_user(db_or_none, username, password):
     if db_or_none is None:
         return add_user_sqlite(username, password)
     return add_user_mongo(db_or_none, username, password)
 
+@traced("db.login_user")
 def login_user(db_or_none, username, password):
     if db_or_none is None:
         return login_user_sqlite(username, password)
     return login_user_mongo(db_or_none, username, password)
 
-def save_profile(db_or_none, username, profile_name, dob, tob, city):
-    if db_or_none is None:
-        return save_profile_sqlite(username, profile_name, dob, tob, city)
-    return save_profile_mongo(db_or_none, username, profile_name, dob, tob, city)
+@traced("db.save_profile")
+def save_profile(db_or_none, username, profile_name, dob, tob, city,
+                 lat=None, lon=None, tz_offset=None, chart=None, chart_version=None):
+    # The Moon placement is stored beside the chart, so matching never decodes charts
+    moon = _moon_placement(chart)
+    try:
+        if db_or_none is None:
+            return save_profile_sqlite(username, profile_name, dob, tob, city,
+                                       lat, lon, tz_offset, chart, chart_version, moon)
+        return save_profile_mongo(db_or_none, username, profile_name, dob, tob, city,
+                                  lat, lon, tz_offset, chart, chart_version, moon)
+    finally:
+        invalidate_read_cache(db_or_none, "profiles", username)
 
+@traced("db.get_user_profiles")
 def get_user_profiles(db_or_none, username):
     if db_or_none is None:
-        return get_user_profiles_sqlite(username)
-    return get_user_profiles_mongo(db_or_none, username)
+        return _cached_read(db_or_none, "profiles", username, lambda: get_user_profiles_sqlite(username))
+    return _cached_read(db_or_none, "profiles", username, lambda: get_user_profiles_mongo(db_or_none, username))
 
-def create_conversation(db_or_none, username, title="New Chat"):
+@traced("db.get_profile_chart")
+def get_profile_chart(db_or_none, username, profile):
+    """
+    Returns the stored location and chart for a profile, given as the
+    (profile_name, dob, tob, city) tuple get_user_profiles() lists, as a dict
+    with keys lat, lon, tz_offset, chart, chart_version (None for legacy
+    rows), or None. Profiles may share a name, so the birth details are part
+    of the key.
+    """
     if db_or_none is None:
-        return create_conversation_sqlite(username, title)
-    return create_conversation_mongo(db_or_none, username, title)
+        return get_profile_chart_sqlite(username, profile)
+    return get_profile_chart_mongo(db_or_none, username, profile)
 
-def get_user_conversations(db_or_none, username):
+@traced("db.get_profile_moons")
+def get_profile_moons(db_or_none, username):
+    """
+    Returns [(profile_name, (Moon nakshatra index, Moon sign index, Manglik
+    flag))] for every profile of a user with a stored chart, read from the
+    placement stored with it rather than the chart itself.
+    """
     if db_or_none is None:
-        return get_user_conversations_sqlite(username)
-    return get_user_conversations_mongo(db_or_none, username)
+        return get_profile_moons_sqlite(username)
+    return get_profile_moons_mongo(db_or_none, username)
 
-def delete_conversation(db_or_none, conversation_id):
+@traced("db.update_profile_chart")
+def update_profile_chart(db_or_none, username, profile, lat, lon, tz_offset, chart, chart_version):
+    """Store a recomputed chart for a profile, keyed like get_profile_chart()."""
+    moon = _moon_placement(chart)
     if db_or_none is None:
-        return delete_conversation_sqlite(conversation_id)
-    return delete_conversation_mongo(db_or_none, conversation_id)
+        return update_profile_chart_sqlite(username, profile, lat, lon, tz_offset, chart, chart_version, moon)
+    return update_profile_chart_mongo(db_or_none, username, profile, lat, lon, tz_offset, chart, chart_version,
+                                      moon)
+
+@traced("db.create_conversation")
+def create_conversation(db_or_none, username, title="New Chat"):
+    try:
+        if db_or_none is None:
+            return create_conversation_sqlite(username, title)
+        return create_conversation_mongo(db_or_none, username, title)
+    finally:
+        invalidate_read_cache(db_or_none, "conversations", username)
+
+@traced("db.get_user_conversations")
+def get_user_conversations(db_or_none, username):
+    if db_or_none is None:
+        return _cached_read(db_or_none, "conversations", username, lambda: get_user_conversations_sqlite(username))
+    return _cached_read(db_or_none, "conversations", username,
+                        lambda: get_user_conversations_mongo(db_or_none, username))
+
+@traced("db.delete_conversation")
+def delete_conversation(db_or_none, conversation_id, username=None):
+    try:
+        if db_or_none is None:
+            return delete_conversation_sqlite(conversation_id)
+        return delete_conversation_mongo(db_or_none, conversation_id)
+    finally:
+        # Without the owner we cannot tell whose cached list to drop, so drop them all
+        invalidate_read_cache(db_or_none, "conversations", username)
 
+@traced("db.save_chat")
 def save_chat(db_or_none, username, role, content, conversation_id):
     if db_or_none is None:
         return save_chat_sqlite(username, role, content, conversation_id)
     return save_chat_mongo(db_or_none, username, role, content, conversation_id)
 
+@traced("db.get_chat_history")
 def get_chat_history(db_or_none, conversation_id):
     if db_or_none is None:
         return get_chat_history_sqlite(conversation_id)
     return get_chat_history_mongo(db_or_none, conversation_id)
 
+@traced("db.search_chats")
+def search_chats(db_or_none, username, query, limit=20, offset=0):
+    """
+    Ranked full-text search over a user's chat messages. Returns a page of dicts
+    with conversation_id, title, role, snippet (matches wrapped in **), timestamp, score.
+    """
+    if db_or_none is None:
+        return search_chats_sqlite(username, query, limit, offset)
+    return search_chats_mongo(db_or_none, username, query, limit, offset)
+
+@traced("db.clear_chat_history")
 def clear_chat_history(db_or_none, username):
+    try:
+        if db_or_none is None:
+            return clear_chat_history_sqlite(username)
+        return clear_chat_history_mongo(db_or_none, username)
+    finally:
+        invalidate_read_cache(db_or_none, "conversations", username)
+
+@traced("db.set_user_quota")
+def set_user_quota(db_or_none, username, max_conversations):
+    try:
+        if db_or_none is None:
+            return set_user_quota_sqlite(username, max_conversations)
+        return set_user_quota_mongo(db_or_none, username, max_conversations)
+    finally:
+        invalidate_read_cache(db_or_none, "conversations", username)
+
+@traced("db.run_maintenance")
+def run_maintenance(db_or_none, idle_days=ARCHIVE_AFTER_DAYS):
+    """
+    Retention job: compact idle conversations, enforce per-user quotas, purge
+    old finished jobs and, on SQLite, reclaim free pages. Archived messages are re-hydrated on open
+    and are not searchable until then. Returns a dict of counts.
+    """
+    try:
+        if db_or_none is None:
+            return run_maintenance_sqlite(idle_days)
+        return run_maintenance_mongo(db_or_none, idle_days)
+    finally:
+        invalidate_read_cache(db_or_none, "conversations")
+
+@traced("db.submit_job")
+def submit_job(db_or_none, username, kind, payload, run_after=None, affinity=None):
+    """
+    Queue a background job (see jobs.py). Returns its id. run_after (a Unix
+    timestamp) holds the job back until then; with an affinity, only workers
+    claiming with that affinity will run it.
+    """
+    if db_or_none is None:
+        return submit_job_sqlite(username, kind, payload, run_after, affinity)
+    return submit_job_mongo(db_or_none, username, kind, payload, run_after, affinity)
+
+@traced("db.claim_job")
+def claim_job(db_or_none, worker, affinity=None):
+    """
+    Atomically mark the oldest due queued job as running for this worker and
+    return it as a dict with keys id, username, kind, payload (or None). Jobs
+    submitted with an affinity are only claimed by workers passing the same one.
+    """
+    if db_or_none is None:
+        return claim_job_sqlite(worker, affinity)
+    return claim_job_mongo(db_or_none, worker, affinity)
+
+@traced("db.heartbeat_job")
+def heartbeat_job(db_or_none, job_id, worker):
+    """
+    Renew a running job's lease for the worker running it. Returns False when
+    the job is no longer that worker's (it was requeued and claimed again).
+    """
+    if db_or_none is None:
+        return heartbeat_job_sqlite(job_id, worker)
+    return heartbeat_job_mongo(db_or_none, job_id, worker)
+
+@traced("db.finish_job")
+def finish_job(db_or_none, job_id, worker, result=None, error=None, trace=None):
+    """
+    Record a job's result (or error) and the tracing spans it produced. The
+    payload is dropped once finished. Only the worker that holds the job can
+    finish it; returns False (and changes nothing) for anyone else.
+    """
+    if db_or_none is None:
+        return finish_job_sqlite(job_id, worker, result, error, trace)
+    return finish_job_mongo(db_or_none, job_id, worker, result, error, trace)
+
+@traced("db.get_job")
+def get_job(db_or_none, job_id, username=None):
+    """
+    Returns a job as a dict with keys id, username, kind, status ('queued',
+    'running', 'done' or 'failed'), result, error, trace and timestamps, or None.
+    Pass username to only return that user's job.
+    """
+    if db_or_none is None:
+        return get_job_sqlite(job_id, username)
+    return get_job_mongo(db_or_none, job_id, username)
+
+@traced("db.requeue_stale_jobs")
+def requeue_stale_jobs(db_or_none, stale_after=JOB_STALE_AFTER):
+    """Requeue running jobs whose lease has not been renewed for stale_after seconds."""
+    if db_or_none is None:
+        return requeue_stale_jobs_sqlite(stale_after)
+    return requeue_stale_jobs_mongo(db_or_none, stale_after)
+
+@traced("db.take_token")
+def take_token(db_or_none, key, rate, burst, max_wait=0.0):
+    """
+    Take one token from the bucket `key` (refilled at `rate` tokens per second
+    up to `burst`), reserving it up to max_wait seconds ahead if none is free.
+    Returns (granted, wait): when granted, the seconds until the token is
+    available (0 if now); otherwise the seconds until a request would be granted.
+    """
+    if db_or_none is None:
+        return take_token_sqlite(key, rate, burst, max_wait)
+    return take_token_mongo(db_or_none, key, rate, burst, max_wait)
+
+@traced("db.refund_token")
+def refund_token(db_or_none, key, burst):
+    """Return a token taken with take_token (e.g. when a later check refused the request)."""
     if db_or_none is None:
-        return clear_chat_history_sqlite(username)
-    return clear_chat_history_mongo(db_or_none, username)
+        return refund_token_sqlite(key, burst)
+    return refund_token_mongo(db_or_none, key, burst)
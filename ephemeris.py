@@ -0,0 +1,78 @@
+"""
+Swiss Ephemeris helpers for computing planetary positions outside the chart
+engine (transits, and anything else that needs positions at arbitrary times).
+
+Positions are computed tropically and shifted by the ayanamsa, which
+reproduces the engine's sidereal (Lahiri) longitudes; Rahu is the mean
+lunar node and Ketu is opposite it, as in jyotishyamitra. Functions take
+and return NumPy arrays of Julian days (UT).
+"""
+import datetime
+import threading
+
+import numpy as np
+import swisseph as swe
+
+PLANET_IDS = {"Sun": swe.SUN, "Moon": swe.MOON, "Mars": swe.MARS, "Mercury": swe.MERCURY,
+              "Jupiter": swe.JUPITER, "Venus": swe.VENUS, "Saturn": swe.SATURN, "Rahu": swe.MEAN_NODE}
+PLANETS = list(PLANET_IDS) + ["Ketu"]
+AYANAMSAS = {"lahiri": swe.SIDM_LAHIRI, "raman": swe.SIDM_RAMAN, "kp": swe.SIDM_KRISHNAMURTI}
+
+_FLAGS = swe.FLG_SWIEPH | swe.FLG_SPEED
+_J2000 = 2451545.0
+_J2000_UTC = datetime.datetime(2000, 1, 1, 12)
+_RATE_STEP = 1 / 24
+# swe.set_sid_mode() is process-wide state
+_sid_lock = threading.Lock()
+
+
+def julian_day(moment):
+    """Julian day (UT) of a naive UTC datetime or a date (taken at 00:00 UTC)."""
+    if not isinstance(moment, datetime.datetime):
+        moment = datetime.datetime(moment.year, moment.month, moment.day)
+    return _J2000 + (moment - _J2000_UTC).total_seconds() / 86400
+
+
+def to_datetime(jd):
+    """Naive UTC datetime of a Julian day, to the second."""
+    return _J2000_UTC + datetime.timedelta(seconds=round((float(jd) - _J2000) * 86400))
+
+
+def ayanamsa(jds, mode="lahiri"):
+    jds = np.atleast_1d(np.asarray(jds, dtype=float))
+    with _sid_lock:
+        swe.set_sid_mode(AYANAMSAS[mode])
+        return np.array([swe.get_ayanamsa_ex_ut(jd, swe.FLG_SWIEPH)[1] for jd in jds])
+
+
+def midheaven(jd, lat, lon, mode="lahiri"):
+    """Sidereal longitude of the midheaven (10th house cusp) at a Julian day and place."""
+    _, ascmc = swe.houses_ex(jd, lat, lon, b"P")
+    return (ascmc[1] - ayanamsa([jd], mode)[0]) % 360.0
+
+
+def houses(jd, lat, lon, system=b"P"):
+    """Tropical house cusps (12,) and ascendant for a Swiss Ephemeris house system code."""
+    cusps, ascmc = swe.houses_ex(jd, lat, lon, system)
+    return np.array(cusps[:12]), ascmc[0]
+
+
+def tropical(planet, jds):
+    """Tropical longitudes and daily speeds (degrees) of a planet at each Julian day."""
+    jds = np.atleast_1d(np.asarray(jds, dtype=float))
+    pid = PLANET_IDS["Rahu" if planet == "Ketu" else planet]
+    out = np.array([swe.calc_ut(jd, pid, _FLAGS)[0][::3] for jd in jds]).reshape(-1, 2)
+    lon, speed = out[:, 0], out[:, 1]
+    if planet == "Ketu":
+        lon = (lon + 180.0) % 360.0
+    return lon, speed
+
+
+def sidereal(planet, jds, mode="lahiri"):
+    """Sidereal longitudes and daily speeds (degrees) of a planet at each Julian day."""
+    jds = np.atleast_1d(np.asarray(jds, dtype=float))
+    lon, speed = tropical(planet, jds)
+    ayan = ayanamsa(jds, mode)
+    # The true ayanamsa includes nutation, whose rate varies from day to day
+    rate = (ayanamsa(jds + _RATE_STEP, mode) - ayan) / _RATE_STEP
+    return (lon - ayan) % 360.0, speed - rate
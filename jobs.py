@@ -0,0 +1,273 @@
+"""
+Background job workers. Jobs are stored in the app database (see
+database.submit_job) and claimed one at a time by worker processes, so slow
+chart generation, Gemini calls and imports never run inside a Streamlit rerun.
+
+    python jobs.py worker --processes 2              # local SQLite database
+    python jobs.py worker --mongo-uri "$MONGO_URI"
+    python jobs.py import dump.ndjson                # queue a batch import (see migrate.py)
+
+app.py also starts JOB_WORKERS local worker processes on first use; set
+JOB_WORKERS = 0 in secrets when running dedicated workers instead.
+
+Job kinds and payloads:
+    chart   {name, dob, tob, city, location?, save?, update_profile?}  -> chart dict (engine JSON)
+            (update_profile is the profile's [name, dob, tob, city])
+    report  {chart, query, key_ref?, conversation_id?}                 -> {"text": ...}
+            (chart is encode_chart() of a chart_model.Chart)
+    import  {path, batch_size?, checkpoint?}                           -> {"written": n, "orphaned_chats": n}
+
+Gemini keys never go into the database. Workers use GEMINI_API_KEY from
+their environment (local workers get the app's secret when started); a key a
+user enters in the app is handed to this server's local workers in memory
+(share_key) and the job only carries a reference to it, with this server's
+local_affinity() so no other worker claims it.
+"""
+import argparse
+import base64
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+
+import database as db
+from astrology import get_chart_data, get_chart_location, CHART_ENGINE_VERSION
+from llm import get_astrology_response, LLMError
+from tracing import trace
+
+JOB_WORKERS = 2
+POLL_INTERVAL = 0.5
+# How often a worker requeues jobs whose worker stopped renewing their lease
+# (seconds; see database.JOB_STALE_AFTER)
+REQUEUE_INTERVAL = 60
+
+FULL_REPORT_QUERY = (
+    "Write a complete life reading of this chart: personality and temperament, career and finances, "
+    "relationships and marriage, health, and the themes of the current and next Mahadasha, "
+    "with practical remedies."
+)
+
+
+class JobFailed(Exception):
+    """Raised by a job handler to fail the job with a user-facing message."""
+
+
+# Workers are long-lived, so repeated requests for the same birth details are
+# served from memory (results are serialized into the job, so sharing is safe).
+# Errors are raised rather than returned, so a transient failure isn't cached.
+@lru_cache(maxsize=128)
+def _compute_chart(name, dob, tob, city, location):
+    data = get_chart_data(name, dob, tob, city, location)
+    if "error" in data:
+        raise JobFailed(data["error"])
+    return data
+
+# Keys users entered in the app, shared with this server's local workers
+# (a multiprocessing manager dict): reference -> key
+_keyring = None
+# Claim affinity of this server's local workers (None until they are started)
+_affinity = None
+
+
+def share_key(api_key):
+    """
+    Hand a user's Gemini key to the local workers. Returns the reference for a
+    report payload, or None when this server runs no local workers.
+    """
+    if _keyring is None or not api_key:
+        return None
+    ref = os.urandom(16).hex()
+    _keyring[ref] = api_key
+    return ref
+
+
+def local_affinity():
+    """The affinity to submit jobs with so only this server's local workers run them (None without any)."""
+    return _affinity
+
+
+def encode_chart(chart):
+    """A Chart as a JSON-safe payload field (its compact binary form, base64)."""
+    return base64.b64encode(chart.to_bytes()).decode("ascii")
+
+
+def run_chart_job(db_conn, job):
+    p = job["payload"]
+    location = tuple(p["location"]) if p.get("location") else None
+    data = _compute_chart(p["name"], p["dob"], p["tob"], p["city"], location)
+
+    lat, lon, tz_offset = get_chart_location(data) or (None, None, None)
+    if p.get("save"):
+        db.save_profile(db_conn, job["username"], p["name"], p["dob"], p["tob"], p["city"],
+                        lat, lon, tz_offset, data, CHART_ENGINE_VERSION)
+    if p.get("update_profile"):
+        db.update_profile_chart(db_conn, job["username"], tuple(p["update_profile"]),
+                                lat, lon, tz_offset, data, CHART_ENGINE_VERSION)
+    return data
+
+
+def run_report_job(db_conn, job):
+    p = job["payload"]
+    from chart_model import Chart  # NumPy is only needed once a job runs
+
+    # Taken out of the keyring first, so it doesn't outlive a failed job
+    api_key = _keyring.pop(p["key_ref"], None) if _keyring is not None and p.get("key_ref") else None
+    chart = Chart.from_bytes(base64.b64decode(p["chart"]))
+    try:
+        text = get_astrology_response(chart, p["query"], api_key or os.environ.get("GEMINI_API_KEY"))
+    except LLMError as e:
+        raise JobFailed(str(e))
+    if p.get("conversation_id"):
+        db.save_chat(db_conn, job["username"], "assistant", text, p["conversation_id"])
+    return {"text": text}
+
+
+def run_import_job(db_conn, job):
+    import migrate
+
+    p = job["payload"]
+    if db_conn is None:
+        conn = sqlite3.connect(db.DB_NAME)
+        write_batch = lambda kind, records, id_map: migrate.write_batch_sqlite(conn, kind, records, id_map)
+    else:
+        conn = None
+        write_batch = lambda kind, records, id_map: migrate.write_batch_mongo(db_conn, kind, records, id_map)
+    try:
+        with open(p["path"]) as src:
+            # Always checkpoint, so a requeued import resumes instead of duplicating rows
+            result = migrate.import_records(src, write_batch, p.get("batch_size") or migrate.BATCH_SIZE,
+                                            p.get("checkpoint") or p["path"] + ".checkpoint")
+    finally:
+        if conn is not None:
+            conn.close()
+    for kind in ("profiles", "conversations"):
+        db.invalidate_read_cache(db_conn, kind)
+    return result
+
+
+HANDLERS = {"chart": run_chart_job, "report": run_report_job, "import": run_import_job}
+
+
+def _renew_lease(db_conn, job_id, worker_id, stop):
+    """Heartbeat a running job until stop is set or another worker took it over."""
+    while not stop.wait(db.JOB_HEARTBEAT_INTERVAL):
+        try:
+            if not db.heartbeat_job(db_conn, job_id, worker_id):
+                return
+        except Exception:
+            # A missed beat is retried on the next one; the lease outlasts several
+            pass
+
+
+def run_job(db_conn, job, worker_id):
+    """Run a claimed job while holding its lease. Returns False if the lease was lost."""
+    handler = HANDLERS.get(job["kind"])
+    result, error = None, None
+    stop = threading.Event()
+    lease = threading.Thread(target=_renew_lease, args=(db_conn, job["id"], worker_id, stop), daemon=True)
+    lease.start()
+    try:
+        # The spans travel back with the job so the submitting process can merge them
+        with trace(f"job.{job['kind']}") as current:
+            try:
+                if handler is None:
+                    raise JobFailed(f"Unknown job kind: {job['kind']}")
+                result = handler(db_conn, job)
+            except Exception as e:
+                error = str(e) or type(e).__name__
+    finally:
+        stop.set()
+        lease.join()
+    spans = current["spans"] + [{"stage": current["trace"], "start_ms": 0.0, "ms": current["ms"]}]
+    return db.finish_job(db_conn, job["id"], worker_id, result=result, error=error, trace=spans)
+
+
+def run_worker(db_conn, worker_id, poll_interval=POLL_INTERVAL, max_jobs=None, affinity=None):
+    """
+    Claim and run jobs until max_jobs have run (forever by default): any job
+    without an affinity, and those submitted with this worker's.
+    """
+    done, requeued_at = 0, None
+    while max_jobs is None or done < max_jobs:
+        if requeued_at is None or time.monotonic() - requeued_at >= REQUEUE_INTERVAL:
+            db.requeue_stale_jobs(db_conn)
+            requeued_at = time.monotonic()
+        job = db.claim_job(db_conn, worker_id, affinity)
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        run_job(db_conn, job, worker_id)
+        done += 1
+
+
+def connect(mongo_uri):
+    """Database handle for a worker process (None means local SQLite)."""
+    if not mongo_uri:
+        db.init_db()
+        return None
+    return db.connect_mongo(mongo_uri).astrology_app
+
+
+def _worker_process(mongo_uri, db_name, worker_id, api_key=None, keyring=None, affinity=None):
+    global _keyring
+    db.DB_NAME = db_name
+    _keyring = keyring
+    if api_key:
+        os.environ["GEMINI_API_KEY"] = api_key
+    run_worker(connect(mongo_uri), worker_id, affinity=affinity)
+
+
+def start_local_workers(count=JOB_WORKERS, mongo_uri=None, api_key=None):
+    """
+    Start daemon worker processes for this server (they exit with it).
+    api_key is the server's Gemini key, if it isn't in the environment.
+    Returns the list of processes.
+    """
+    global _keyring, _affinity
+    # spawn: Streamlit runs scripts on threads, which don't mix with fork
+    ctx = multiprocessing.get_context("spawn")
+    if count and _keyring is None:
+        _keyring = ctx.Manager().dict()
+        _affinity = f"{socket.gethostname()}:{os.getpid()}"
+    workers = []
+    for i in range(count):
+        worker_id = f"{socket.gethostname()}:{os.getpid()}:{i}"
+        proc = ctx.Process(target=_worker_process,
+                           args=(mongo_uri, db.DB_NAME, worker_id, api_key, _keyring, _affinity), daemon=True)
+        proc.start()
+        workers.append(proc)
+    return workers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run background job workers or queue jobs.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    work = sub.add_parser("worker", help="Process queued jobs")
+    work.add_argument("--processes", type=int, default=JOB_WORKERS)
+
+    imp = sub.add_parser("import", help="Queue an NDJSON import (see migrate.py)")
+    imp.add_argument("path")
+    imp.add_argument("--batch-size", type=int)
+    imp.add_argument("--checkpoint")
+
+    for p in (work, imp):
+        p.add_argument("--mongo-uri", help="MongoDB connection string (default: local SQLite)")
+    args = parser.parse_args()
+
+    if args.command == "import":
+        job_id = db.submit_job(connect(args.mongo_uri), None, "import", {
+            "path": os.path.abspath(args.path), "batch_size": args.batch_size, "checkpoint": args.checkpoint
+        })
+        print(f"Queued import job {job_id}")
+        return
+
+    for proc in start_local_workers(args.processes, args.mongo_uri):
+        proc.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,76 +1,155 @@
-import google.generativeai as genai
-import json
+from chart_render import VARGA_NAMES
+from tracing import span, traced
 
-def format_chart_for_prompt(chart_data):
+# The Gemini client is slow to import, so it is loaded on the first request
+genai = None
+
+
+class LLMError(Exception):
+    """get_astrology_response could not get a reading; the message is meant for the user."""
+
+
+def _load_genai():
+    global genai
+    if genai is None:
+        import google.generativeai
+        genai = google.generativeai
+    return genai
+
+def _position(p):
+    return f"{p.sign.label} {p.degree:.2f}° (Nakshatra: {p.nakshatra.label}, pada {p.pada})"
+
+
+@traced("llm.format_prompt")
+def format_chart_for_prompt(chart):
     """
-    Converts complex chart JSON into a structured text summary for LLM.
+    Structured text summary of a Chart for the LLM: birth details, D1
+    positions and houses, every varga, special points, Ashtakavarga and
+    Shadbala, and the Vimshottari periods around today.
     """
-    # Basic verification
-    if "error" in chart_data:
-        return f"Error in chart data: {chart_data['error']}"
-        
-    summary = []
-    summary.append("## Birth Chart Details")
-    
-    # Lagna / Ascendant
-    if "D1" in chart_data and "ascendant" in chart_data["D1"]:
-        asc = chart_data["D1"]["ascendant"]
-        summary.append(f"**Ascendant (Lagna)**: {asc.get('sign')} ({asc.get('nakshatra')})")
-        
-    # Planets
-    if "D1" in chart_data and "planets" in chart_data["D1"]:
+    birth = chart.birth
+    summary = ["## Birth Chart Details"]
+    if birth.moment:
+        tz = f" (UTC{birth.tz_offset:+g})" if birth.tz_offset is not None else ""
+        summary.append(f"**Born**: {birth.moment:%d %b %Y, %H:%M}{tz} at {birth.place}")
+    if chart.details:
+        summary.append("**Panchanga at birth**: " + ", ".join(f"{k.title()}: {v}" for k, v in chart.details.items()))
+
+    d1, d9 = chart.varga("D1"), chart.varga("D9")
+    if d1:
+        if d1.ascendant:
+            summary.append(f"**Ascendant (Lagna)**: {_position(d1.ascendant)}")
         summary.append("\n### Planetary Positions (D1 Rasi):")
-        for planet, details in chart_data["D1"]["planets"].items():
-            summary.append(f"- **{planet}**: {details.get('sign')} in House {details.get('house')} "
-                           f"(Nakshatra: {details.get('nakshatra')})")
-                           
-    # Dasha
-    # The JSON structure for dasha seemed complex in the grep. 
-    # Let's look for "Vimshottari" or similar keys if they exist, or summarize the huge list.
-    # Searching specifically for current dasha would be ideal, but for now we dump what we have efficiently.
-    # If the JSON has a "Vimshottari" section, usage is better.
-    # Based on grep, "dashaLord" appears many times.
-    # We will pass the structural relevant parts.
-    
-    # For now, let's append the whole JSON string but truncated if too huge?
-    # Gemini can handle it. Let's just pass the JSON structure as text in a code block.
-    # But clean it a bit if possible.
-    
-    return json.dumps(chart_data, indent=2)
+        for planet, p in d1.planets.items():
+            notes = [p.dignity]
+            if p.retro and planet not in ("Rahu", "Ketu"):
+                notes.append("retrograde")
+            if d9 and planet in d9.planets and d9.planets[planet].sign == p.sign:
+                notes.append("vargottama")
+            notes = ", ".join(n for n in notes if n)
+            summary.append(f"- **{planet}**: {_position(p)}, House {p.house}" + (f"; {notes}" if notes else ""))
+        summary.append("\n### Houses (D1, whole sign):")
+        for number, sign, planets in d1.houses():
+            summary.append(f"- House {number}: {sign.label}" + (f" ({', '.join(planets)})" if planets else ""))
 
-def get_astrology_response(chart_data, user_query, api_key, stream=False):
+    summary.append("\n### Divisional Charts (sign of the ascendant and each planet):")
+    for name in chart.vargas:
+        varga = chart.varga(name)
+        if name == "D1" or not varga.ascendant:
+            continue
+        planets = ", ".join(f"{planet} {p.sign.label}" for planet, p in varga.planets.items())
+        summary.append(f"- **{name} ({VARGA_NAMES.get(name, name)})**: Ascendant {varga.ascendant.sign.label}; {planets}")
+
+    for point in chart.points:
+        places = ", ".join(f"{v} {p.sign.label} {p.degree:.2f}°" for v, p in chart.special_point(point).items())
+        summary.append(f"- **{point.title()}**: {places}")
+
+    summary.extend(_format_strength(chart))
+
+    summary.append("\n### Vimshottari Dasha:")
+    current = chart.current_dasha()
+    if current:
+        levels = [current.get(k) for k in ("dasha", "bhukti", "paryantardasha") if current.get(k)]
+        summary.append(f"Current (as of {current['date'][:10]}): {' / '.join(levels)}")
+    summary.append("Mahadashas:")
+    for (lord,), start, end in chart.dasha_table(0):
+        summary.append(f"- {lord}: {start:%Y-%m-%d} to {end:%Y-%m-%d}")
+    # Antardashas of the running and next Mahadasha cover the questions about timing people ask
+    running = current.get("dasha") if current else None
+    majors = [lords[0] for lords, _, _ in chart.dasha_table(0)]
+    shown = majors[majors.index(running):majors.index(running) + 2] if running in majors else majors[:2]
+    summary.append(f"Antardashas ({' and '.join(shown)} Mahadashas):")
+    for lords, start, end in chart.dasha_table(1):
+        if lords[0] in shown:
+            summary.append(f"- {lords[0]}-{lords[1]}: {start:%Y-%m-%d} to {end:%Y-%m-%d}")
+    return "\n".join(summary)
+
+def _format_strength(chart):
+    from astrology import get_chart_strength
+    from strength import PLANETS, SHADBALA_COMPONENTS
+    try:
+        strength = get_chart_strength(chart)
+    except Exception as e:
+        return [f"\n(Ashtakavarga and Shadbala unavailable: {e})"]
+    sav = strength["sarvashtakavarga"]
+    lines = ["\n### Ashtakavarga (bindus per sign, Aries to Pisces):",
+             f"- Sarvashtakavarga: {' '.join(map(str, sav))} (total {sav.sum()})"]
+    for planet, row in zip(PLANETS, strength["bhinnashtakavarga"]):
+        lines.append(f"- {planet}: {' '.join(map(str, row))} (total {row.sum()})")
+    lines.append(f"\n### Shadbala components in virupas ({', '.join(SHADBALA_COMPONENTS)}; "
+                 "Chesta, Drik, Ayana and the Kala lords are not included, so these don't add up to Shadbala):")
+    totals = (chart.shadbala or {}).get("Rupas") or {}
+    for i, planet in enumerate(PLANETS):
+        values = [strength["shadbala"][c][i] for c in SHADBALA_COMPONENTS]
+        total = f"; full Shadbala {totals[planet]:.2f} rupas" if planet in totals else ""
+        lines.append(f"- {planet}: {' / '.join(f'{v:.1f}' for v in values)}{total}")
+    return lines
+
+def format_transits(chart):
+    """Transit section of the prompt."""
+    # Loaded on first use: transits pulls in NumPy and the Swiss Ephemeris
+    from transits import format_transits_for_prompt
+    try:
+        return format_transits_for_prompt(chart)
+    except Exception as e:
+        return f"(Transits unavailable: {e})"
+
+def get_astrology_response(chart, user_query, api_key, stream=False):
     """
-    Sends chart context and query to Gemini.
+    Sends the context of a Chart and the query to Gemini. Returns the reading
+    (or, with stream=True, the response stream); raises LLMError on failure.
     """
     if not api_key:
-        return "Error: API Key is missing."
+        raise LLMError("Error: API Key is missing.")
     
     # Clean API Key to prevent metadata errors
     api_key = api_key.strip()
     
     try:
+        _load_genai()
         genai.configure(api_key=api_key)
     except Exception as e:
         # Catch any potential configuration errors, though genai.configure is mostly local.
         # Network errors related to the key typically occur during API calls (e.g., list_models).
-        return f"Error configuring Gemini API: {str(e)}"
+        raise LLMError(f"Error configuring Gemini API: {str(e)}")
     
     # Dynamically find supported models
     supported_models = []
     try:
-        for m in genai.list_models():
-            if 'generateContent' in m.supported_generation_methods:
-                supported_models.append(m.name)
+        with span("llm.list_models"):
+            for m in genai.list_models():
+                if 'generateContent' in m.supported_generation_methods:
+                    supported_models.append(m.name)
     except Exception as e:
         error_msg = str(e)
         if "400" in error_msg or "INVALID_ARGUMENT" in error_msg:
-            return "Error: The API Key provided is invalid (400). Please check for typos."
+            raise LLMError("Error: The API Key provided is invalid (400). Please check for typos.")
         if "403" in error_msg or "PERMISSION_DENIED" in error_msg:
-            return "Error: Permission denied (403). The API Key may not have access to Generative Language API."
-        return f"Error connecting to Google API: {error_msg}"
+            raise LLMError("Error: Permission denied (403). The API Key may not have access to Generative Language API.")
+        raise LLMError(f"Error connecting to Google API: {error_msg}")
         
     if not supported_models:
-        return "No models found that support generateContent. Your API key might need to be enabled for specific models in Google AI Studio."
+        raise LLMError("No models found that support generateContent. Your API key might need to be enabled for specific models in Google AI Studio.")
         
     # Priority list
     priorities = ['models/gemini-1.5-flash', 'models/gemini-1.5-flash-001', 'models/gemini-pro', 'models/gemini-1.0-pro']
@@ -86,7 +165,8 @@ def get_astrology_response(chart_data, user_query, api_key, stream=False):
     if not selected_model:
         selected_model = supported_models[0]
     
-    chart_context = format_chart_for_prompt(chart_data)
+    chart_context = format_chart_for_prompt(chart)
+    transit_context = format_transits(chart)
         
     prompt = f"""
 You are an expert Vedic Astrologer. You have deep knowledge of Parashara Hora Sastra, Jaimini Sutras, and modern interpretations.
@@ -94,17 +174,16 @@ You have been provided with the user's Vedic Birth Chart and Dasha details below
 
 User Query: "{user_query}"
 
-### Chart Data
-```json
 {chart_context}
-```
+
+{transit_context}
 
 Instructions:
 1. Analyze the chart specifically answering the user's query.
 2. Use the provided planetary positions, house placements, and Nakshatras.
-3. Pay close attention to the Vimshottari Dasha (Mahadasha/Antardasha) if relevant to the timing of the query. (Look for 'dasha' keys in the data).
+3. Pay close attention to the Vimshottari Dasha (Mahadasha/Antardasha) if relevant to the timing of the query. (See the Vimshottari Dasha section).
 4. Be accurate, empathetic, and insightul.
-5. If the query is about specific timing, correlate with the Dasha periods provided.
+5. If the query is about specific timing, correlate with the Dasha periods and the transit dates provided. Never estimate transit dates yourself; use only the dates listed.
 6. Try to answer it little information about the charts and more information on the intent. please follow this. 
 Answer:
 """
@@ -112,13 +191,12 @@ Answer:
     try:
         model = genai.GenerativeModel(selected_model)
         if stream:
-            return model.generate_content(prompt, stream=True)
+            # Covers the request only; chunks are timed by whoever consumes them
+            with span("llm.generate_stream"):
+                return model.generate_content(prompt, stream=True)
         else:
-            response = model.generate_content(prompt)
-            return response.text
+            with span("llm.generate"):
+                response = model.generate_content(prompt)
+                return response.text
     except Exception as e:
-        error_msg = f"Error contacting Gemini: {str(e)}"
-        if stream:
-            # Yield error as a chunk so frontend handles it gracefully
-            return (type('obj', (object,), {'text': error_msg}) for _ in [None])
-        return error_msg
+        raise LLMError(f"Error contacting Gemini: {str(e)}")
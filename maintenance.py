@@ -0,0 +1,35 @@
+"""
+Retention job: compacts idle conversations, enforces per-user quotas and
+reclaims SQLite free pages. Run periodically (e.g. daily from cron):
+
+    python maintenance.py                      # local SQLite database
+    python maintenance.py --mongo-uri "$MONGO_URI"
+"""
+import argparse
+import json
+
+import database as db
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run database retention maintenance.")
+    parser.add_argument("--mongo-uri", help="MongoDB connection string (default: local SQLite)")
+    parser.add_argument("--idle-days", type=int, default=db.ARCHIVE_AFTER_DAYS,
+                        help="Compact conversations with no messages for this many days")
+    parser.add_argument("--set-quota", nargs=2, metavar=("USERNAME", "MAX_CONVERSATIONS"),
+                        help="Set a user's conversation quota before running")
+    args = parser.parse_args()
+
+    db_conn = None
+    if args.mongo_uri:
+        db_conn = db.connect_mongo(args.mongo_uri).astrology_app
+
+    if args.set_quota:
+        db.set_user_quota(db_conn, args.set_quota[0], int(args.set_quota[1]))
+
+    stats = db.run_maintenance(db_conn, args.idle_days)
+    print(json.dumps(stats))
+
+
+if __name__ == "__main__":
+    main()
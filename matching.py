@@ -0,0 +1,193 @@
+"""
+Ashtakoota (Guna Milan) compatibility matching with Manglik, Nadi and
+Bhakoot dosha checks.
+
+Each koota is a NumPy lookup table indexed by Moon nakshatra or Moon sign,
+so scoring N grooms against M brides is a handful of fancy-indexing
+gathers over (N, M) arrays rather than N x M Python loops.
+"""
+import numpy as np
+import pandas as pd
+
+from chart_model import NAKSHATRAS, nakshatra_index
+from chart_render import SIGNS, sign_index
+
+KOOTAS = ["Varna", "Vashya", "Tara", "Yoni", "Graha Maitri", "Gana", "Bhakoot", "Nadi"]
+MAX_POINTS = {"Varna": 1, "Vashya": 2, "Tara": 3, "Yoni": 4, "Graha Maitri": 5,
+              "Gana": 6, "Bhakoot": 7, "Nadi": 8}
+
+# Houses from the ascendant in which Mars causes Manglik dosha
+MANGLIK_HOUSES = (1, 2, 4, 7, 8, 12)
+
+# --- Per-sign / per-nakshatra attributes ---------------------------------------
+
+# Varna by Moon sign: 0 Shudra, 1 Vaishya, 2 Kshatriya, 3 Brahmin
+SIGN_VARNA = np.array([2, 1, 0, 3, 2, 1, 0, 3, 2, 1, 0, 3])
+# Vashya by Moon sign: 0 Chatushpada, 1 Manava, 2 Jalachara, 3 Vanachara, 4 Keeta
+SIGN_VASHYA = np.array([0, 0, 1, 2, 3, 1, 1, 4, 1, 2, 1, 2])
+# Sign lord: 0 Sun, 1 Moon, 2 Mars, 3 Mercury, 4 Jupiter, 5 Venus, 6 Saturn
+SIGN_LORD = np.array([2, 5, 3, 1, 0, 3, 5, 2, 4, 6, 6, 4])
+# Yoni animal: 0 Horse, 1 Elephant, 2 Sheep, 3 Serpent, 4 Dog, 5 Cat, 6 Rat,
+# 7 Cow, 8 Buffalo, 9 Tiger, 10 Deer, 11 Monkey, 12 Mongoose, 13 Lion
+NAKSHATRA_YONI = np.array([0, 1, 2, 3, 3, 4, 5, 2, 5, 6, 6, 7, 8, 9,
+                           8, 9, 10, 10, 4, 11, 12, 11, 13, 0, 13, 7, 1])
+# Gana: 0 Deva, 1 Manushya, 2 Rakshasa
+NAKSHATRA_GANA = np.array([0, 1, 2, 1, 0, 1, 0, 0, 2, 2, 1, 1, 0, 2,
+                           0, 2, 0, 2, 2, 1, 1, 0, 2, 2, 1, 1, 0])
+# Nadi: 0 Adi, 1 Madhya, 2 Antya (repeats 0 1 2 2 1 0 through the zodiac)
+NAKSHATRA_NADI = np.resize([0, 1, 2, 2, 1, 0], 27)
+
+# --- Koota tables (rows: groom, columns: bride) --------------------------------
+
+_VARNA = (SIGN_VARNA[:, None] >= SIGN_VARNA[None, :]).astype(float)
+
+_VASHYA_BY_CLASS = np.array([
+    [2.0, 1.0, 1.0, 0.5, 1.0],
+    [1.0, 2.0, 0.5, 0.0, 1.0],
+    [1.0, 0.5, 2.0, 1.0, 1.0],
+    [0.5, 0.0, 1.0, 2.0, 0.0],
+    [1.0, 1.0, 1.0, 0.0, 2.0],
+])
+_VASHYA = _VASHYA_BY_CLASS[SIGN_VASHYA[:, None], SIGN_VASHYA[None, :]]
+
+# Tara counted from each partner's nakshatra to the other's; the 3rd, 5th
+# and 7th taras (Vipat, Pratyak, Naidhana) are inauspicious
+_tara_ok = ~np.isin((np.arange(27)[None, :] - np.arange(27)[:, None]) % 27 % 9, (2, 4, 6))
+_TARA = 1.5 * _tara_ok + 1.5 * _tara_ok.T
+
+_YONI_BY_ANIMAL = np.array([
+    [4, 2, 2, 3, 2, 2, 2, 1, 0, 1, 3, 3, 2, 1],
+    [2, 4, 3, 3, 2, 2, 2, 2, 3, 1, 2, 3, 2, 0],
+    [2, 3, 4, 2, 1, 2, 1, 3, 3, 1, 2, 0, 3, 1],
+    [3, 3, 2, 4, 2, 1, 1, 1, 1, 2, 2, 2, 0, 2],
+    [2, 2, 1, 2, 4, 2, 1, 2, 2, 1, 0, 2, 1, 1],
+    [2, 2, 2, 1, 2, 4, 0, 2, 2, 1, 3, 3, 2, 1],
+    [2, 2, 1, 1, 1, 0, 4, 2, 2, 2, 2, 2, 1, 2],
+    [1, 2, 3, 1, 2, 2, 2, 4, 3, 0, 3, 2, 2, 1],
+    [0, 3, 3, 1, 2, 2, 2, 3, 4, 1, 2, 2, 2, 1],
+    [1, 1, 1, 2, 1, 1, 2, 0, 1, 4, 1, 1, 2, 1],
+    [3, 2, 2, 2, 0, 3, 2, 3, 2, 1, 4, 2, 2, 1],
+    [3, 3, 0, 2, 2, 3, 2, 2, 2, 1, 2, 4, 3, 2],
+    [2, 2, 3, 0, 1, 2, 1, 2, 2, 2, 2, 3, 4, 2],
+    [1, 0, 1, 2, 1, 1, 2, 1, 1, 1, 1, 2, 2, 4],
+], dtype=float)
+_YONI = _YONI_BY_ANIMAL[NAKSHATRA_YONI[:, None], NAKSHATRA_YONI[None, :]]
+
+_MAITRI_BY_LORD = np.array([
+    [5.0, 5.0, 5.0, 4.0, 5.0, 0.0, 0.0],
+    [5.0, 5.0, 4.0, 1.0, 4.0, 0.5, 0.5],
+    [5.0, 4.0, 5.0, 0.5, 5.0, 3.0, 0.5],
+    [4.0, 1.0, 0.5, 5.0, 0.5, 5.0, 4.0],
+    [5.0, 4.0, 5.0, 0.5, 5.0, 0.5, 3.0],
+    [0.0, 0.5, 3.0, 5.0, 0.5, 5.0, 5.0],
+    [0.0, 0.5, 0.5, 4.0, 3.0, 5.0, 5.0],
+])
+_MAITRI = _MAITRI_BY_LORD[SIGN_LORD[:, None], SIGN_LORD[None, :]]
+
+_GANA_BY_CLASS = np.array([[6.0, 6.0, 1.0], [5.0, 6.0, 0.0], [1.0, 0.0, 6.0]])
+_GANA = _GANA_BY_CLASS[NAKSHATRA_GANA[:, None], NAKSHATRA_GANA[None, :]]
+
+# Bhakoot: Moon signs 2/12, 5/9 or 6/8 apart score nothing
+_BHAKOOT = np.where(np.isin((np.arange(12)[None, :] - np.arange(12)[:, None]) % 12, (1, 11, 4, 8, 5, 7)), 0.0, 7.0)
+
+_NADI = np.where(NAKSHATRA_NADI[:, None] == NAKSHATRA_NADI[None, :], 0.0, 8.0)
+
+
+def moon_profile(chart):
+    """
+    (Moon nakshatra index, Moon sign index, Manglik flag) from a Chart, or
+    None when the Moon placement is missing.
+    """
+    d1 = chart.varga("D1")
+    moon = d1 and d1.planets.get("Moon")
+    if moon is None:
+        return None
+    mars = d1.planets.get("Mars")
+    return int(moon.nakshatra), int(moon.sign), (mars.house if mars else None) in MANGLIK_HOUSES
+
+
+def encode_profiles(profiles):
+    """
+    Columnar arrays for a sequence of (nakshatra, sign, manglik) tuples:
+    {"nakshatra": int array, "sign": int array, "manglik": bool array}.
+    """
+    profiles = list(profiles)
+    return {
+        "nakshatra": np.fromiter((p[0] for p in profiles), dtype=np.intp, count=len(profiles)),
+        "sign": np.fromiter((p[1] for p in profiles), dtype=np.intp, count=len(profiles)),
+        "manglik": np.fromiter((bool(p[2]) for p in profiles), dtype=bool, count=len(profiles)),
+    }
+
+
+def read_candidates_csv(file):
+    """
+    Parse an uploaded candidate list. Required columns: name, nakshatra (Moon
+    nakshatra); plus sign (Moon sign) and optionally manglik (yes/no, true/false, 1/0).
+    Returns (names, encoded profiles, list of skipped row numbers).
+    """
+    df = pd.read_csv(file, dtype=str).fillna("")
+    df.columns = [c.strip().lower() for c in df.columns]
+    missing = {"name", "nakshatra", "sign"} - set(df.columns)
+    if missing:
+        raise ValueError(f"Missing column(s): {', '.join(sorted(missing))}")
+
+    nak = df["nakshatra"].map(nakshatra_index)
+    sign = df["sign"].map(sign_index)
+    manglik = df["manglik"].str.strip().str.lower().isin(["yes", "y", "true", "1"]) \
+        if "manglik" in df.columns else pd.Series(False, index=df.index)
+    valid = nak.notna() & sign.notna()
+    skipped = [int(i) + 2 for i in df.index[~valid]]  # 1-based, after the header row
+    encoded = {
+        "nakshatra": nak[valid].to_numpy(dtype=np.intp),
+        "sign": sign[valid].to_numpy(dtype=np.intp),
+        "manglik": manglik[valid].to_numpy(dtype=bool),
+    }
+    return df.loc[valid, "name"].tolist(), encoded, skipped
+
+
+def koota_scores(grooms, brides):
+    """
+    Score every groom against every bride. Both arguments are encoded
+    profiles; returns {koota: (N, M) array} plus "Total" and dosha flags
+    "Manglik Dosha", "Nadi Dosha", "Bhakoot Dosha".
+    """
+    gn, gs = grooms["nakshatra"][:, None], grooms["sign"][:, None]
+    bn, bs = brides["nakshatra"][None, :], brides["sign"][None, :]
+    scores = {
+        "Varna": _VARNA[gs, bs],
+        "Vashya": _VASHYA[gs, bs],
+        "Tara": _TARA[gn, bn],
+        "Yoni": _YONI[gn, bn],
+        "Graha Maitri": _MAITRI[gs, bs],
+        "Gana": _GANA[gn, bn],
+        "Bhakoot": _BHAKOOT[gs, bs],
+        "Nadi": _NADI[gn, bn],
+    }
+    scores["Total"] = sum(scores[k] for k in KOOTAS)
+    # Manglik dosha is cancelled when both partners are Manglik
+    scores["Manglik Dosha"] = grooms["manglik"][:, None] != brides["manglik"][None, :]
+    scores["Nadi Dosha"] = scores["Nadi"] == 0
+    scores["Bhakoot Dosha"] = scores["Bhakoot"] == 0
+    return scores
+
+
+def rank_matches(subject, names, candidates, subject_is_groom=True, limit=None):
+    """
+    Rank candidates for one subject profile (a (nakshatra, sign, manglik)
+    tuple) by total guna score, then by number of doshas. Returns a DataFrame.
+    """
+    one = encode_profiles([subject])
+    if subject_is_groom:
+        scores = {k: v[0] for k, v in koota_scores(one, candidates).items()}
+    else:
+        scores = {k: v[:, 0] for k, v in koota_scores(candidates, one).items()}
+
+    df = pd.DataFrame({"Name": names, **scores})
+    df["Nakshatra"] = np.array(NAKSHATRAS)[candidates["nakshatra"]]
+    df["Moon Sign"] = np.array(SIGNS)[candidates["sign"]]
+    doshas = df[["Manglik Dosha", "Nadi Dosha", "Bhakoot Dosha"]].sum(axis=1)
+    order = np.lexsort((doshas.to_numpy(), -df["Total"].to_numpy()))
+    df = df.iloc[order[:limit] if limit else order].reset_index(drop=True)
+    df.index += 1
+    return df[["Name", "Nakshatra", "Moon Sign", "Total", *KOOTAS,
+               "Manglik Dosha", "Nadi Dosha", "Bhakoot Dosha"]]
@@ -0,0 +1,308 @@
+"""
+Streams users, profiles, conversations and chats between the SQLite and
+MongoDB backends as NDJSON (one JSON record per line):
+
+    python migrate.py export --source sqlite --output dump.ndjson
+    python migrate.py import --target mongo --mongo-uri "$MONGO_URI" --input dump.ndjson
+
+Records are read and written through generators and batched inserts, so
+memory stays flat regardless of data size (apart from the old -> new
+conversation id map). Imports append to a checkpoint file after every batch
+(the line reached, and the ids of newly imported conversations) and resume
+from it when re-run with the same --checkpoint file. Chats whose conversation
+is not in the dump are imported without one and counted as orphaned.
+"""
+import argparse
+import base64
+import json
+import os
+import sqlite3
+import sys
+from datetime import datetime, timezone
+
+import database as db
+
+# Records are exported users, quotas, profiles, conversations, chats: chats
+# must come after the conversations they reference.
+BATCH_SIZE = 500
+
+
+def _to_iso(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None).isoformat()
+    return str(value).replace(" ", "T")
+
+
+def _from_iso(value):
+    if not value:
+        return None
+    return datetime.fromisoformat(value).replace(tzinfo=None)
+
+
+def _sqlite_ts(value):
+    return (_from_iso(value) or datetime.now(timezone.utc).replace(tzinfo=None)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _b64(blob):
+    return base64.b64encode(bytes(blob)).decode("ascii") if blob else None
+
+
+def _unb64(text):
+    return base64.b64decode(text) if text else None
+
+
+# --- Readers -----------------------------------------------------------------
+
+def _sqlite_rows(query, params=()):
+    conn = sqlite3.connect(db.DB_NAME)
+    try:
+        cursor = conn.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(BATCH_SIZE)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        conn.close()
+
+
+def export_sqlite():
+    """Yield every record in the local SQLite database."""
+    db.init_db()
+    for username, password in _sqlite_rows("SELECT username, password FROM users"):
+        yield {"type": "user", "username": username, "password": password}
+    for username, max_conversations in _sqlite_rows("SELECT username, max_conversations FROM user_quotas"):
+        yield {"type": "quota", "username": username, "max_conversations": max_conversations}
+    for row in _sqlite_rows("""SELECT username, profile_name, dob, tob, city, lat, lon, tz_offset, chart, chart_version
+                               FROM profiles ORDER BY id"""):
+        yield {"type": "profile", "username": row[0], "profile_name": row[1], "dob": row[2], "tob": row[3],
+               "city": row[4], "lat": row[5], "lon": row[6], "tz_offset": row[7],
+               "chart": _b64(row[8]), "chart_version": row[9]}
+    for conv_id, username, title, created_at in _sqlite_rows(
+            "SELECT id, username, title, created_at FROM conversations ORDER BY id"):
+        yield {"type": "conversation", "id": str(conv_id), "username": username, "title": title,
+               "created_at": _to_iso(created_at)}
+    for conv_id, username, role, content, timestamp in _sqlite_rows(
+            "SELECT conversation_id, username, role, content, timestamp FROM chats ORDER BY id"):
+        yield {"type": "chat", "conversation_id": str(conv_id), "username": username, "role": role,
+               "content": content, "timestamp": _to_iso(timestamp)}
+    # Compacted conversations are exported as plain chats
+    for conv_id, blob in _sqlite_rows("SELECT conversation_id, messages FROM conversation_archives"):
+        for m in db.unpack_json(blob) or []:
+            yield {"type": "chat", "conversation_id": str(conv_id), "username": m["username"],
+                   "role": m["role"], "content": m["content"], "timestamp": _to_iso(m["timestamp"])}
+
+
+def export_mongo(mongo_db):
+    """Yield every record in a MongoDB database."""
+    for u in mongo_db.users.find({}, batch_size=BATCH_SIZE):
+        yield {"type": "user", "username": u["username"], "password": u["password"]}
+    for q in mongo_db.user_quotas.find({}, batch_size=BATCH_SIZE):
+        yield {"type": "quota", "username": q["username"], "max_conversations": q["max_conversations"]}
+    for p in mongo_db.profiles.find({}, batch_size=BATCH_SIZE).sort("_id", 1):
+        yield {"type": "profile", "username": p["username"], "profile_name": p["profile_name"],
+               "dob": p["dob"], "tob": p["tob"], "city": p["city"], "lat": p.get("lat"), "lon": p.get("lon"),
+               "tz_offset": p.get("tz_offset"), "chart": _b64(p.get("chart")),
+               "chart_version": p.get("chart_version")}
+    for c in mongo_db.conversations.find({}, {"archive": 0}, batch_size=BATCH_SIZE).sort("_id", 1):
+        yield {"type": "conversation", "id": str(c["_id"]), "username": c["username"], "title": c["title"],
+               "created_at": _to_iso(c.get("created_at"))}
+    for c in mongo_db.chats.find({}, batch_size=BATCH_SIZE).sort("_id", 1):
+        yield {"type": "chat", "conversation_id": c["conversation_id"], "username": c["username"],
+               "role": c["role"], "content": c["content"], "timestamp": _to_iso(c.get("timestamp"))}
+    for c in mongo_db.conversations.find({"archive": {"$exists": True}}, {"archive": 1}, batch_size=BATCH_SIZE):
+        for m in db.unpack_json(c["archive"]) or []:
+            yield {"type": "chat", "conversation_id": str(c["_id"]), "username": m["username"],
+                   "role": m["role"], "content": m["content"], "timestamp": _to_iso(m["timestamp"])}
+
+
+# --- Writers -----------------------------------------------------------------
+
+def write_batch_sqlite(conn, kind, records, id_map):
+    c = conn.cursor()
+    if kind == "user":
+        c.executemany("INSERT OR IGNORE INTO users (username, password) VALUES (?, ?)",
+                      [(r["username"], r["password"]) for r in records])
+    elif kind == "quota":
+        c.executemany("INSERT OR REPLACE INTO user_quotas (username, max_conversations) VALUES (?, ?)",
+                      [(r["username"], r["max_conversations"]) for r in records])
+    elif kind == "profile":
+        c.executemany("""INSERT INTO profiles (username, profile_name, dob, tob, city, lat, lon, tz_offset,
+                                               chart, chart_version)
+                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                      [(r["username"], r["profile_name"], r["dob"], r["tob"], r["city"], r["lat"], r["lon"],
+                        r["tz_offset"], _unb64(r["chart"]), r["chart_version"]) for r in records])
+    elif kind == "conversation":
+        # Row-by-row (inside one transaction) to learn each new autoincrement id
+        for r in records:
+            c.execute("INSERT INTO conversations (username, title, created_at) VALUES (?, ?, ?)",
+                      (r["username"], r["title"], _sqlite_ts(r["created_at"])))
+            id_map[r["id"]] = str(c.lastrowid)
+    elif kind == "chat":
+        c.executemany("INSERT INTO chats (username, role, content, conversation_id, timestamp) VALUES (?, ?, ?, ?, ?)",
+                      [(r["username"], r["role"], r["content"], id_map.get(r["conversation_id"]),
+                        _sqlite_ts(r["timestamp"])) for r in records])
+    conn.commit()
+
+
+def write_batch_mongo(mongo_db, kind, records, id_map):
+    if kind == "user":
+        from pymongo import UpdateOne
+        mongo_db.users.bulk_write([UpdateOne({"username": r["username"]},
+                                             {"$setOnInsert": {"password": r["password"]}}, upsert=True)
+                                   for r in records], ordered=False)
+    elif kind == "quota":
+        from pymongo import UpdateOne
+        mongo_db.user_quotas.bulk_write([UpdateOne({"username": r["username"]},
+                                                   {"$set": {"max_conversations": r["max_conversations"]}},
+                                                   upsert=True)
+                                         for r in records], ordered=False)
+    elif kind == "profile":
+        mongo_db.profiles.insert_many([{
+            "username": r["username"], "profile_name": r["profile_name"], "dob": r["dob"], "tob": r["tob"],
+            "city": r["city"], "lat": r["lat"], "lon": r["lon"], "tz_offset": r["tz_offset"],
+            "chart": _unb64(r["chart"]), "chart_version": r["chart_version"]
+        } for r in records])
+    elif kind == "conversation":
+        result = mongo_db.conversations.insert_many([{
+            "username": r["username"], "title": r["title"], "created_at": _from_iso(r["created_at"])
+        } for r in records])
+        for r, new_id in zip(records, result.inserted_ids):
+            id_map[r["id"]] = str(new_id)
+    elif kind == "chat":
+        mongo_db.chats.insert_many([{
+            "username": r["username"], "role": r["role"], "content": r["content"],
+            "conversation_id": id_map.get(r["conversation_id"]), "timestamp": _from_iso(r["timestamp"])
+        } for r in records])
+
+
+# --- Driver ------------------------------------------------------------------
+
+def _load_checkpoint(path):
+    """
+    Replay a checkpoint file: one JSON entry per line, either {"ids": {old: new}}
+    for conversations imported by a batch or {"line": n, "orphaned": k} after it.
+    """
+    state = {"line": 0, "orphaned": 0, "id_map": {}}
+    if not path or not os.path.exists(path):
+        return state
+    with open(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break  # a torn last line: the batch it recorded is redone
+            state["id_map"].update(entry.get("ids") or entry.get("id_map") or {})
+            if "line" in entry:
+                state["line"], state["orphaned"] = entry["line"], entry.get("orphaned", 0)
+    return state
+
+
+def _append_checkpoint(path, line, orphaned, ids):
+    if not path:
+        return
+    with open(path, "a") as f:
+        if ids:
+            f.write(json.dumps({"ids": ids}, separators=(",", ":")) + "\n")
+        f.write(json.dumps({"line": line, "orphaned": orphaned}) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def import_records(lines, write_batch, batch_size=BATCH_SIZE, checkpoint=None):
+    """
+    Consume NDJSON lines, writing consecutive records of the same type in
+    batches. Returns {"written": records written in this run, "orphaned_chats":
+    chats imported without their conversation, over the whole import}.
+    """
+    state = _load_checkpoint(checkpoint)
+    done, id_map, orphaned = state["line"], state["id_map"], state["orphaned"]
+    pending, pending_type, written = [], None, 0
+
+    def flush(upto):
+        nonlocal pending, written, orphaned
+        if pending_type == "chat":
+            orphaned += sum(1 for r in pending if r["conversation_id"] not in id_map)
+        write_batch(pending_type, pending, id_map)
+        written += len(pending)
+        ids = None
+        if pending_type == "conversation":
+            ids = {r["id"]: id_map[r["id"]] for r in pending if r["id"] in id_map}
+        pending = []
+        _append_checkpoint(checkpoint, upto, orphaned, ids)
+
+    for lineno, line in enumerate(lines, 1):
+        if lineno <= done or not line.strip():
+            continue
+        record = json.loads(line)
+        if pending and (record["type"] != pending_type or len(pending) >= batch_size):
+            flush(lineno - 1)
+        pending_type = record["type"]
+        pending.append(record)
+        done = lineno
+    if pending:
+        flush(done)
+    return {"written": written, "orphaned_chats": orphaned}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream data between the SQLite and MongoDB backends.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    exp = sub.add_parser("export", help="Write all records as NDJSON")
+    exp.add_argument("--source", choices=["sqlite", "mongo"], required=True)
+    exp.add_argument("--output", default="-", help="Output file (default: stdout)")
+
+    imp = sub.add_parser("import", help="Load NDJSON records")
+    imp.add_argument("--target", choices=["sqlite", "mongo"], required=True)
+    imp.add_argument("--input", default="-", help="Input file (default: stdin)")
+    imp.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    imp.add_argument("--checkpoint", help="Checkpoint file for resumable imports")
+
+    for p in (exp, imp):
+        p.add_argument("--mongo-uri", help="MongoDB connection string")
+        p.add_argument("--sqlite-path", default=db.DB_NAME, help="SQLite database file")
+    args = parser.parse_args()
+
+    db.DB_NAME = args.sqlite_path
+    backend = args.source if args.command == "export" else args.target
+    mongo_db = None
+    if backend == "mongo":
+        if not args.mongo_uri:
+            parser.error("--mongo-uri is required for the mongo backend")
+        mongo_db = db.connect_mongo(args.mongo_uri).astrology_app
+
+    if args.command == "export":
+        records = export_sqlite() if mongo_db is None else export_mongo(mongo_db)
+        out = sys.stdout if args.output == "-" else open(args.output, "w")
+        try:
+            for record in records:
+                out.write(json.dumps(record, separators=(",", ":")) + "\n")
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        return
+
+    if mongo_db is None:
+        db.init_db()
+        conn = sqlite3.connect(db.DB_NAME)
+        write_batch = lambda kind, records, id_map: write_batch_sqlite(conn, kind, records, id_map)
+    else:
+        write_batch = lambda kind, records, id_map: write_batch_mongo(mongo_db, kind, records, id_map)
+
+    src = sys.stdin if args.input == "-" else open(args.input)
+    try:
+        result = import_records(src, write_batch, args.batch_size, args.checkpoint)
+    finally:
+        if src is not sys.stdin:
+            src.close()
+    print(f"Imported {result['written']} records", file=sys.stderr)
+    if result["orphaned_chats"]:
+        print(f"{result['orphaned_chats']} chats referenced conversations missing from the dump "
+              "and were imported without one", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Daily Panchanga for a location: sunrise, sunset, Rahu Kalam, and the tithi,
+nakshatra, yoga and karana prevailing at sunrise, with the times the tithi
+and nakshatra end.
+
+A year is computed at once as arrays: sunrise and sunset come from the
+NOAA solar equations, Sun and Moon positions from the Swiss Ephemeris (see
+ephemeris.py), and end times from a few Newton steps applied to every day
+together. Years are cached per location; panchanga() slices any date range
+out of them.
+"""
+import datetime
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+import ephemeris
+from chart_model import NAKSHATRAS
+from tracing import traced
+
+TITHIS = ["Pratipada", "Dwitiya", "Tritiya", "Chaturthi", "Panchami", "Shashthi", "Saptami", "Ashtami",
+          "Navami", "Dashami", "Ekadashi", "Dwadashi", "Trayodashi", "Chaturdashi"]
+TITHI_NAMES = ([f"Shukla {t}" for t in TITHIS] + ["Purnima"]
+               + [f"Krishna {t}" for t in TITHIS] + ["Amavasya"])
+YOGAS = ["Vishkambha", "Priti", "Ayushman", "Saubhagya", "Shobhana", "Atiganda", "Sukarma", "Dhriti",
+         "Shula", "Ganda", "Vriddhi", "Dhruva", "Vyaghata", "Harshana", "Vajra", "Siddhi", "Vyatipata",
+         "Variyana", "Parigha", "Shiva", "Siddha", "Sadhya", "Shubha", "Shukla", "Brahma", "Indra", "Vaidhriti"]
+# Karana 0 is Kimstughna, 57-59 are the fixed karanas; the seven movable ones repeat in between
+KARANAS = (["Kimstughna"] + ["Bava", "Balava", "Kaulava", "Taitila", "Garaja", "Vanija", "Vishti"] * 8
+           + ["Shakuni", "Chatushpada", "Naga"])
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+# Which eighth of the daytime is Rahu Kalam, by weekday (Monday first)
+RAHU_KALAM_PART = np.array([1, 6, 4, 5, 3, 2, 7])
+# Upper limb at the horizon with standard refraction, as in almanac sunrise times
+SUNRISE_ZENITH = 90.833
+NEWTON_STEPS = 2
+
+
+def _sun_times(days, lat, lon):
+    """
+    Sunrise and sunset as minutes after 00:00 UTC of each date (NOAA solar
+    equations, accurate to about a minute). NaN where the Sun does not rise or set.
+    """
+    year_len = np.where(days.is_leap_year, 366, 365)
+    gamma = 2 * np.pi / year_len * (days.dayofyear.to_numpy() - 1)
+    eqtime = 229.18 * (0.000075 + 0.001868 * np.cos(gamma) - 0.032077 * np.sin(gamma)
+                       - 0.014615 * np.cos(2 * gamma) - 0.040849 * np.sin(2 * gamma))
+    decl = (0.006918 - 0.399912 * np.cos(gamma) + 0.070257 * np.sin(gamma) - 0.006758 * np.cos(2 * gamma)
+            + 0.000907 * np.sin(2 * gamma) - 0.002697 * np.cos(3 * gamma) + 0.00148 * np.sin(3 * gamma))
+    phi = np.radians(lat)
+    cos_ha = np.cos(np.radians(SUNRISE_ZENITH)) / (np.cos(phi) * np.cos(decl)) - np.tan(phi) * np.tan(decl)
+    with np.errstate(invalid="ignore"):
+        ha = np.degrees(np.arccos(cos_ha))
+    return 720 - 4 * (lon + ha) - eqtime, 720 - 4 * (lon - ha) - eqtime
+
+
+def _end_times(jd, value, rate, value_at, span):
+    """
+    Julian days at which an angle, `value` with daily `rate` at `jd`, next
+    reaches a multiple of `span` degrees, for every day at once; value_at(jd)
+    evaluates the angle and rate.
+    """
+    target = (np.floor(value / span) + 1) * span
+    t = jd + (target - value) / rate
+    for _ in range(NEWTON_STEPS):
+        value, rate = value_at(t)
+        t = t - ((value - target + 180) % 360 - 180) / rate
+    return t
+
+
+def _elongation(jd):
+    moon, moon_speed = ephemeris.sidereal("Moon", jd)
+    sun, sun_speed = ephemeris.sidereal("Sun", jd)
+    return (moon - sun) % 360, moon_speed - sun_speed
+
+
+def _moon(jd):
+    return ephemeris.sidereal("Moon", jd)
+
+
+def _local(jd, tz_hours):
+    """Local naive datetimes (to the minute) for Julian days and UTC offsets in hours."""
+    minutes = np.round((jd - 2440587.5) * 1440 + tz_hours * 60)
+    return pd.to_datetime(minutes, unit="m", errors="coerce")
+
+
+def _tz_offsets(days, tz):
+    """UTC offset in hours for each day: a fixed offset, or a tz database name (follows DST)."""
+    if not isinstance(tz, str):
+        return np.full(len(days), float(tz))
+    import pytz
+    zone = pytz.timezone(tz)
+    return np.array([zone.utcoffset(datetime.datetime(d.year, d.month, d.day, 12)).total_seconds() / 3600
+                     for d in days])
+
+
+@lru_cache(maxsize=32)
+def year_panchanga(lat, lon, tz, year):
+    """One row per day of `year` at (lat, lon); tz is a UTC offset in hours or a tz database name."""
+    days = pd.date_range(f"{year}-01-01", f"{year}-12-31", freq="D")
+    tz_hours = _tz_offsets(days, tz)
+    rise_min, set_min = _sun_times(days, lat, lon)
+
+    # NOAA times are minutes from 00:00 UTC of the date (negative east of about 120°E)
+    day_jd = days.to_numpy().astype("datetime64[s]").astype(np.int64) / 86400 + 2440587.5
+    rise_jd = day_jd + rise_min / 1440
+    set_jd = day_jd + set_min / 1440
+    # Polar day or night: take the Panchanga at local 06:00 instead
+    at = np.where(np.isnan(rise_jd), day_jd + 0.25 - tz_hours / 24, rise_jd)
+
+    moon, moon_speed = ephemeris.sidereal("Moon", at)
+    sun, sun_speed = ephemeris.sidereal("Sun", at)
+    elongation = (moon - sun) % 360
+    tithi = (elongation // 12).astype(int)
+    nakshatra = (moon // (360 / 27)).astype(int)
+    yoga = (((sun + moon) % 360) // (360 / 27)).astype(int)
+    karana = (elongation // 6).astype(int)
+
+    daylight = (set_jd - rise_jd) / 8
+    weekday = days.weekday.to_numpy()
+    rahu_start = rise_jd + RAHU_KALAM_PART[weekday] * daylight
+
+    return pd.DataFrame({
+        "date": days.date,
+        "weekday": [WEEKDAYS[w] for w in weekday],
+        "sunrise": _local(rise_jd, tz_hours),
+        "sunset": _local(set_jd, tz_hours),
+        "rahu_kalam_start": _local(rahu_start, tz_hours),
+        "rahu_kalam_end": _local(rahu_start + daylight, tz_hours),
+        "tithi": [TITHI_NAMES[i] for i in tithi],
+        "tithi_ends": _local(_end_times(at, elongation, moon_speed - sun_speed, _elongation, 12), tz_hours),
+        "paksha": np.where(tithi < 15, "Shukla", "Krishna"),
+        "nakshatra": [NAKSHATRAS[i] for i in nakshatra],
+        "nakshatra_ends": _local(_end_times(at, moon, moon_speed, _moon, 360 / 27), tz_hours),
+        "yoga": [YOGAS[i] for i in yoga],
+        "karana": [KARANAS[i] for i in karana],
+    })
+
+
+@traced("panchanga.range")
+def panchanga(lat, lon, tz, start, end):
+    """Daily Panchanga from `start` to `end` (dates, inclusive) as a DataFrame."""
+    lat, lon = round(float(lat), 4), round(float(lon), 4)
+    if not isinstance(tz, str):
+        tz = float(tz)
+    frames = [year_panchanga(lat, lon, tz, year) for year in range(start.year, end.year + 1)]
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    return df[(df["date"] >= start) & (df["date"] <= end)].reset_index(drop=True)
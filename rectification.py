@@ -0,0 +1,105 @@
+"""
+Birth-time sensitivity: where, in a window around a birth time, the
+ascendant sign, the ascendant's nakshatra, the D9 and D10 lagnas and the
+Moon's nakshatra change.
+
+The ascendant has a closed form in local sidereal time, so it is computed
+for the whole window at once from one sidereal time, obliquity and
+ayanamsa lookup at the birth moment (they drift by far less than an arc
+second over a few hours). The Moon comes from ephemeris.py. Each change
+between two samples is refined by bisection, all changes of a factor
+together.
+"""
+import datetime
+
+import numpy as np
+import swisseph as swe
+
+import ephemeris
+from chart_model import NAKSHATRAS
+from chart_render import SIGNS
+from tracing import traced
+
+DEFAULT_WINDOW_MINUTES = 120
+# Fine enough that no factor changes twice between samples: the fastest,
+# the D10 lagna, spans 3° of ascendant (several minutes even at high latitudes)
+STEP_MINUTES = 1
+PRECISION_SECONDS = 1
+_SIDEREAL_DEGREES_PER_DAY = 360.98564736629
+_NAKSHATRA_SPAN = 360 / 27
+
+
+def _ascendant_model(jd0, lat, lon):
+    """Sidereal ascendant as a vectorized function of the Julian day, valid near jd0."""
+    lst0 = swe.sidtime(jd0) * 15 + lon
+    eps = np.radians(swe.calc_ut(jd0, swe.ECL_NUT)[0][0])
+    tan_phi = np.tan(np.radians(lat))
+    ayanamsa = ephemeris.ayanamsa([jd0])[0]
+
+    def ascendant(jds):
+        theta = np.radians(lst0 + _SIDEREAL_DEGREES_PER_DAY * (np.asarray(jds) - jd0))
+        tropical = np.degrees(np.arctan2(np.cos(theta), -(np.sin(theta) * np.cos(eps) + tan_phi * np.sin(eps))))
+        return (tropical - ayanamsa) % 360
+    return ascendant
+
+
+def navamsa_sign(lon):
+    """D9 sign index: navamsas are counted on from Aries through the zodiac."""
+    return (lon // (30 / 9)).astype(int) % 12
+
+
+def dasamsa_sign(lon):
+    """D10 sign index: counted from the sign itself in odd signs and from its 9th in even signs."""
+    sign = (lon // 30).astype(int)
+    start = np.where(sign % 2 == 0, sign, (sign + 8) % 12)
+    return (start + ((lon % 30) // 3).astype(int)) % 12
+
+
+def _factors(ascendant):
+    moon = lambda jds: ephemeris.sidereal("Moon", jds)[0]
+    return {
+        "Ascendant": (lambda jds: (ascendant(jds) // 30).astype(int), SIGNS),
+        "Ascendant nakshatra": (lambda jds: (ascendant(jds) // _NAKSHATRA_SPAN).astype(int), NAKSHATRAS),
+        "D9 ascendant": (lambda jds: navamsa_sign(ascendant(jds)), SIGNS),
+        "D10 ascendant": (lambda jds: dasamsa_sign(ascendant(jds)), SIGNS),
+        "Moon nakshatra": (lambda jds: (moon(jds) // _NAKSHATRA_SPAN).astype(int), NAKSHATRAS),
+    }
+
+
+def _changes(factor, jds, values):
+    """Refined times of every change in `values` (sampled at `jds`), with the values either side."""
+    at = np.nonzero(values[1:] != values[:-1])[0]
+    lo, hi, before = jds[at], jds[at + 1], values[at]
+    while at.size and (hi - lo).max() * 86400 > PRECISION_SECONDS:
+        mid = (lo + hi) / 2
+        same = factor(mid) == before
+        lo = np.where(same, mid, lo)
+        hi = np.where(same, hi, mid)
+    return (lo + hi) / 2, before, values[at + 1]
+
+
+@traced("rectification.sweep")
+def sensitivity(birth, lat, lon, tz_offset, window_minutes=DEFAULT_WINDOW_MINUTES, step_minutes=STEP_MINUTES):
+    """
+    Sweep `birth` (a naive local datetime) ± window_minutes. Returns
+    {"factors": {name: {"value", "from", "until"}}, "changes": [...]}: each
+    factor's value at the birth time and the local times it holds from and
+    until (None beyond the window), and every change in the window in time
+    order as {"time", "offset_minutes", "factor", "from", "to"}.
+    """
+    jd0 = ephemeris.julian_day(birth - datetime.timedelta(hours=tz_offset))
+    jds = jd0 + np.arange(-window_minutes, window_minutes + step_minutes / 2, step_minutes) / 1440
+    local = lambda jd: ephemeris.to_datetime(jd) + datetime.timedelta(hours=tz_offset)
+
+    factors, changes = {}, []
+    for name, (factor, labels) in _factors(_ascendant_model(jd0, lat, lon)).items():
+        times, before, after = _changes(factor, jds, factor(jds))
+        for t, b, a in zip(times, before, after):
+            changes.append({"time": local(t), "offset_minutes": round(float(t - jd0) * 1440, 1),
+                            "factor": name, "from": labels[b], "to": labels[a]})
+        earlier, later = times[times <= jd0], times[times > jd0]
+        factors[name] = {"value": labels[factor(np.array([jd0]))[0]],
+                         "from": local(earlier.max()) if earlier.size else None,
+                         "until": local(later.min()) if later.size else None}
+    changes.sort(key=lambda c: c["time"])
+    return {"factors": factors, "changes": changes}
@@ -0,0 +1,202 @@
+"""
+Chart strength: Ashtakavarga (Bhinnashtakavarga per planet and the
+Sarvashtakavarga) and the Shadbala components that follow from planet
+positions, for Sun..Saturn.
+
+The rules are lookup tables (benefic points, exaltation points, natural
+friendships, ...) applied as array operations over a batch of charts, so a
+whole profile list is scored in one call; chart_strength() is the
+one-chart view. Shadbala is in virupas (60 to a rupa). The components that
+need more than positions (Chesta, Drik, Ayana and the Kala balas of the
+year/month/day/hour lords) are not computed, and neither is the total.
+"""
+import datetime
+
+import numpy as np
+
+import ephemeris
+from chart_model import ASCENDANT, Planet
+from matching import SIGN_LORD
+
+PLANETS = [p.label for p in Planet][:7]
+BAV_CONTRIBUTORS = PLANETS + ["Ascendant"]
+
+# Bhinnashtakavarga benefic points (BPHS): for each planet's BAV, the houses
+# counted from each contributor (Sun..Saturn, ascendant) that score a point.
+_BENEFIC_HOUSES = [
+    [[1, 2, 4, 7, 8, 9, 10, 11], [3, 6, 10, 11], [1, 2, 4, 7, 8, 9, 10, 11], [3, 5, 6, 9, 10, 11, 12],
+     [5, 6, 9, 11], [6, 7, 12], [1, 2, 4, 7, 8, 9, 10, 11], [3, 4, 6, 10, 11, 12]],
+    [[3, 6, 7, 8, 10, 11], [1, 3, 6, 7, 10, 11], [2, 3, 5, 6, 9, 10, 11], [1, 3, 4, 5, 7, 8, 10, 11],
+     [1, 4, 7, 8, 10, 11, 12], [3, 4, 5, 7, 9, 10, 11], [3, 5, 6, 11], [3, 6, 10, 11]],
+    [[3, 5, 6, 10, 11], [3, 6, 11], [1, 2, 4, 7, 8, 10, 11], [3, 5, 6, 11],
+     [6, 10, 11, 12], [6, 8, 11, 12], [1, 4, 7, 8, 9, 10, 11], [1, 3, 6, 10, 11]],
+    [[5, 6, 9, 11, 12], [2, 4, 6, 8, 10, 11], [1, 2, 4, 7, 8, 9, 10, 11], [1, 3, 5, 6, 9, 10, 11, 12],
+     [6, 8, 11, 12], [1, 2, 3, 4, 5, 8, 9, 11], [1, 2, 4, 7, 8, 9, 10, 11], [1, 2, 4, 6, 8, 10, 11]],
+    [[1, 2, 3, 4, 7, 8, 9, 10, 11], [2, 5, 7, 9, 11], [1, 2, 4, 7, 8, 10, 11], [1, 2, 4, 5, 6, 9, 10, 11],
+     [1, 2, 3, 4, 7, 8, 10, 11], [2, 5, 6, 9, 10, 11], [3, 5, 6, 12], [1, 2, 4, 5, 6, 7, 9, 10, 11]],
+    [[8, 11, 12], [1, 2, 3, 4, 5, 8, 9, 11, 12], [3, 5, 6, 9, 11, 12], [3, 5, 6, 9, 11],
+     [5, 8, 9, 10, 11], [1, 2, 3, 4, 5, 8, 9, 10, 11], [3, 4, 5, 8, 9, 10, 11], [1, 2, 3, 4, 5, 8, 9, 11]],
+    [[1, 2, 4, 7, 8, 10, 11], [3, 6, 11], [3, 5, 6, 10, 11, 12], [6, 8, 9, 10, 11, 12],
+     [5, 6, 11, 12], [6, 11, 12], [3, 5, 6, 11], [1, 3, 4, 6, 10, 11]],
+]
+# (planet, contributor, house - 1) -> 1 for a benefic point
+BENEFIC = np.zeros((7, 8, 12), dtype=np.int8)
+for _p, _rows in enumerate(_BENEFIC_HOUSES):
+    for _c, _houses in enumerate(_rows):
+        BENEFIC[_p, _c, np.array(_houses) - 1] = 1
+
+# Deep exaltation points (sidereal longitude); debilitation is opposite
+EXALTATION = np.array([10.0, 33.0, 298.0, 165.0, 95.0, 357.0, 200.0])
+# Moolatrikona sign and degree range within it
+MOOLATRIKONA = np.array([[4, 0, 20], [1, 3, 30], [0, 0, 12], [5, 15, 20], [8, 0, 10], [6, 0, 15], [10, 0, 20]])
+# Natural friendship of each planet (row) towards each other planet: 1 friend, 0 neutral, -1 enemy
+NATURAL_FRIENDSHIP = np.array([
+    [0, 1, 1, 0, 1, -1, -1],
+    [1, 0, 0, 1, 0, 0, 0],
+    [1, 1, 0, -1, 1, 0, 0],
+    [1, -1, 0, 0, 0, 1, 0],
+    [1, 1, 1, -1, 0, -1, 0],
+    [-1, -1, 0, 1, 0, 0, 1],
+    [-1, -1, -1, 1, 0, 1, 0],
+])
+# Houses from a planet whose occupants are its temporary friends
+_TEMPORARY_FRIEND_HOUSES = np.isin(np.arange(12), [1, 2, 3, 9, 10, 11])
+# Compound relationship (-2 great enemy .. 2 great friend) -> Saptavargaja virupas
+_RELATIONSHIP_VIRUPAS = np.array([1.875, 3.75, 7.5, 15.0, 22.5])
+SAPTAVARGA = ["D1", "D2", "D3", "D7", "D9", "D12", "D30"]
+# Moon and Venus gain in even signs (odd sign index), the rest in odd signs
+_EVEN_SIGN_PLANETS = np.array([False, True, False, False, False, True, False])
+# Decanate (0-2) in which each planet gains Drekkana bala: male, neutral, female
+_DREKKANA = np.array([0, 2, 0, 1, 0, 2, 1])
+# Kendra, panaphara, apoklima houses
+_KENDRADI_VIRUPAS = np.array([60.0, 30.0, 15.0])
+# Strongest direction as a point: 0 ascendant, 1 IC, 2 descendant, 3 MC
+_DIG_POINT = np.array([3, 1, 3, 0, 0, 1, 2])
+# Natonnata: 1 strongest at noon, -1 at midnight, 0 always full (Mercury)
+_DIURNAL = np.array([1, -1, -1, 0, 1, 1, -1])
+_BENEFICS = np.array([False, True, False, True, True, True, False])
+NAISARGIKA = np.array([60.0, 51.43, 17.14, 25.71, 34.29, 42.86, 8.57])
+
+SHADBALA_COMPONENTS = ["Uchcha", "Saptavargaja", "Ojhayugma", "Kendradi", "Drekkana",
+                       "Dig", "Paksha", "Natonnata", "Naisargika"]
+
+
+def _arc(a, b):
+    """Shortest angular distance between longitudes, 0..180."""
+    d = np.abs(a - b) % 360
+    return np.minimum(d, 360 - d)
+
+
+def ashtakavarga(signs):
+    """
+    Bhinnashtakavarga points, (N, 7 planets, 12 signs), from (N, 8) D1 sign
+    indices of Sun..Saturn and the ascendant.
+    """
+    signs = np.asarray(signs, dtype=np.intp)
+    # House of every sign counted from each contributor: (N, 8, 12)
+    houses = (np.arange(12) - signs[:, :, None]) % 12
+    points = BENEFIC[np.arange(7)[None, :, None, None], np.arange(8)[None, None, :, None], houses[:, None]]
+    return points.sum(axis=2, dtype=np.int16)
+
+
+def sarvashtakavarga(bav):
+    """Sarvashtakavarga (N, 12 signs): the BAV points of all seven planets per sign."""
+    return bav.sum(axis=-2)
+
+
+def _saptavargaja(varga_signs, d1_lon):
+    """varga_signs: (N, 7 vargas in SAPTAVARGA order, 7 planets)."""
+    d1 = varga_signs[:, 0]
+    # Temporary friendship from D1: (N, planet, other)
+    apart = (d1[:, None, :] - d1[:, :, None]) % 12
+    compound = NATURAL_FRIENDSHIP + np.where(_TEMPORARY_FRIEND_HOUSES[apart], 1, -1)
+    lords = SIGN_LORD[varga_signs]
+    planet = np.arange(7)
+    relation = compound[np.arange(len(d1))[:, None, None], planet, lords]
+    virupas = np.where(lords == planet, 30.0, _RELATIONSHIP_VIRUPAS[relation + 2])
+    degree = d1_lon % 30
+    moolatrikona = ((d1 == MOOLATRIKONA[:, 0]) & (degree >= MOOLATRIKONA[:, 1])
+                    & (degree < MOOLATRIKONA[:, 2]))
+    virupas[:, 0] = np.where(moolatrikona, 45.0, virupas[:, 0])
+    return virupas.sum(axis=1)
+
+
+def shadbala(varga_signs, lon, asc, mc, solar_hour):
+    """
+    Shadbala components in virupas, {component: (N, 7)}, from:
+    varga_signs: (N, 7, 7) signs in the SAPTAVARGA vargas (index 4 is D9)
+    lon: (N, 7) D1 longitudes; asc, mc: (N,) ascendant and midheaven
+    solar_hour: (N,) local mean solar time of birth, hours after midnight
+    """
+    lon = np.asarray(lon, dtype=float)
+    asc, mc = np.asarray(asc, dtype=float)[:, None], np.asarray(mc, dtype=float)[:, None]
+    d1, d9 = varga_signs[:, 0], varga_signs[:, 4]
+    odd = lambda signs: (signs % 2 == 1) == _EVEN_SIGN_PLANETS
+    house = (d1 - (asc // 30).astype(int)) % 12
+
+    dig_points = np.stack([asc, mc + 180, asc + 180, mc], axis=-1)[:, 0]
+    dig_point = dig_points[:, _DIG_POINT]
+    elongation = _arc(lon[:, 1:2], lon[:, 0:1])
+    noon = 1 - np.abs(np.asarray(solar_hour, dtype=float)[:, None] % 24 - 12) / 12
+    return {
+        "Uchcha": _arc(lon, EXALTATION + 180) / 3,
+        "Saptavargaja": _saptavargaja(varga_signs, lon),
+        "Ojhayugma": 15.0 * odd(d1) + 15.0 * odd(d9),
+        "Kendradi": _KENDRADI_VIRUPAS[house % 3],
+        "Drekkana": np.where((lon % 30) // 10 == _DREKKANA, 15.0, 0.0),
+        "Dig": (180 - _arc(lon, dig_point)) / 3,
+        "Paksha": np.where(_BENEFICS, elongation, 180 - elongation) / 3,
+        "Natonnata": 60 * np.select([_DIURNAL == 1, _DIURNAL == -1], [noon, 1 - noon], 1.0),
+        "Naisargika": np.broadcast_to(NAISARGIKA, lon.shape).copy(),
+    }
+
+
+def chart_inputs(charts):
+    """Stack the positions strength needs from a list of chart_model.Charts, with one gather."""
+    n = len(charts)
+    # Per chart, its varga codes -> index in SAPTAVARGA (-1 for the others)
+    slots = np.full((n, max(len(c.vargas) for c in charts)), -1, dtype=np.intp)
+    for i, chart in enumerate(charts):
+        for j, name in enumerate(SAPTAVARGA):
+            slots[i, chart.vargas.index(name)] = j
+    owner = np.repeat(np.arange(n), [len(c.placements) for c in charts])
+    rows = np.concatenate([c.placements for c in charts])
+    slot = slots[owner, rows["varga"]]
+    keep = (slot >= 0) & (rows["point"] <= ASCENDANT)
+    owner, slot, rows = owner[keep], slot[keep], rows[keep]
+
+    signs = np.zeros((n, len(SAPTAVARGA), ASCENDANT + 1), dtype=np.intp)
+    signs[owner, slot, rows["point"]] = rows["sign"]
+    d1 = slot == 0
+    lon = np.zeros((n, ASCENDANT + 1))
+    lon[owner[d1], rows["point"][d1]] = rows["sign"][d1] * 30.0 + rows["degree"][d1]
+    asc = lon[:, ASCENDANT]
+
+    # Equal houses from the ascendant when the birth moment or place is unknown
+    mc, solar_hour = (asc + 270) % 360, np.full(n, np.nan)
+    for i, chart in enumerate(charts):
+        birth = chart.birth
+        if birth.moment is not None and birth.location is not None:
+            utc = birth.moment - datetime.timedelta(hours=birth.tz_offset)
+            mc[i] = ephemeris.midheaven(ephemeris.julian_day(utc), birth.lat, birth.lon)
+            solar_hour[i] = utc.hour + utc.minute / 60 + utc.second / 3600 + birth.lon / 15
+    return {"signs": np.concatenate([signs[:, 0, :7], signs[:, 0, ASCENDANT:]], axis=1),
+            "varga_signs": signs[:, :, :7], "lon": lon[:, :7], "asc": asc, "mc": mc, "solar_hour": solar_hour}
+
+
+def batch_strength(charts):
+    """
+    Strength for a list of Charts in one pass: {"bhinnashtakavarga": (N, 7, 12),
+    "sarvashtakavarga": (N, 12), "shadbala": {component: (N, 7)}}.
+    """
+    x = chart_inputs(charts)
+    bav = ashtakavarga(x["signs"])
+    return {"bhinnashtakavarga": bav, "sarvashtakavarga": sarvashtakavarga(bav),
+            "shadbala": shadbala(x["varga_signs"], x["lon"], x["asc"], x["mc"], x["solar_hour"])}
+
+
+def chart_strength(chart):
+    """batch_strength() for one chart, without the batch axis."""
+    result = batch_strength([chart])
+    return {"bhinnashtakavarga": result["bhinnashtakavarga"][0], "sarvashtakavarga": result["sarvashtakavarga"][0],
+            "shadbala": {k: v[0] for k, v in result["shadbala"].items()}}
@@ -0,0 +1,170 @@
+"""
+Lightweight stage timing.
+
+Wrap work in `with span("stage"):` (or decorate with @traced("stage")).
+Every span feeds per-stage aggregates (count, sum and a window of recent
+durations for p50/p95). Spans opened inside `with trace("name"):` are also
+collected into that request's trace, which is kept in a short history and,
+when TRACE_LOG is set, appended to that file as one JSON line.
+prometheus_text() renders the aggregates in the Prometheus text format.
+
+State is per process: work done in other processes (job workers, API chart
+workers) is brought back as a list of spans and folded in with merge().
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+# Recent samples kept per stage for percentiles
+WINDOW = 1000
+RECENT_TRACES = 50
+TRACE_LOG = os.environ.get("TRACE_LOG")
+
+_lock = threading.Lock()
+_samples = {}
+_totals = {}
+_recent = deque(maxlen=RECENT_TRACES)
+_current = contextvars.ContextVar("current_trace", default=None)
+
+
+def record(stage, seconds):
+    """Add one duration to a stage's aggregates."""
+    with _lock:
+        _samples.setdefault(stage, deque(maxlen=WINDOW)).append(seconds)
+        totals = _totals.setdefault(stage, [0, 0.0])
+        totals[0] += 1
+        totals[1] += seconds
+
+
+@contextmanager
+def span(stage):
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        record(stage, elapsed)
+        current = _current.get()
+        if current is not None:
+            entry = {"stage": stage, "start_ms": round((start - current["_t0"]) * 1000, 3),
+                     "ms": round(elapsed * 1000, 3)}
+            if error:
+                entry["error"] = error
+            current["spans"].append(entry)
+
+
+def traced(stage):
+    """Decorator form of span()."""
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+@contextmanager
+def trace(name):
+    """
+    Collect the spans of one request (page run, API call, job). Nested
+    traces are recorded as plain spans of the outer one.
+    """
+    if _current.get() is not None:
+        with span(name):
+            yield _current.get()
+        return
+
+    current = {"trace": name, "time": time.time(), "_t0": time.perf_counter(), "spans": []}
+    token = _current.set(current)
+    try:
+        yield current
+    finally:
+        _current.reset(token)
+        elapsed = time.perf_counter() - current.pop("_t0")
+        current["ms"] = round(elapsed * 1000, 3)
+        record(name, elapsed)
+        with _lock:
+            _recent.append(current)
+        if TRACE_LOG:
+            _write_log(current)
+
+
+def current_spans():
+    """Spans recorded so far in the active trace (empty outside a trace)."""
+    current = _current.get()
+    return list(current["spans"]) if current else []
+
+
+def merge(spans):
+    """Fold spans recorded in another process into this one's aggregates and active trace."""
+    current = _current.get()
+    for s in spans or []:
+        record(s["stage"], s["ms"] / 1000)
+        if current is not None:
+            current["spans"].append({**s, "remote": True})
+
+
+def _write_log(entry):
+    line = json.dumps(entry, separators=(",", ":"))
+    with _lock:
+        with open(TRACE_LOG, "a") as f:
+            f.write(line + "\n")
+
+
+def _quantile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def stage_stats():
+    """Per-stage count, p50, p95 and max (ms) over the recent window, sorted by stage."""
+    with _lock:
+        snapshot = {stage: sorted(xs) for stage, xs in _samples.items()}
+        counts = {stage: t[0] for stage, t in _totals.items()}
+    return [{"stage": stage, "count": counts[stage],
+             "p50_ms": round(_quantile(xs, 0.5) * 1000, 3),
+             "p95_ms": round(_quantile(xs, 0.95) * 1000, 3),
+             "max_ms": round(xs[-1] * 1000, 3)}
+            for stage, xs in sorted(snapshot.items())]
+
+
+def recent_traces():
+    """The most recent completed traces, newest first."""
+    with _lock:
+        return list(reversed(_recent))
+
+
+def reset():
+    with _lock:
+        _samples.clear()
+        _totals.clear()
+        _recent.clear()
+
+
+def _label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text():
+    """Stage aggregates as a Prometheus summary (text exposition format)."""
+    with _lock:
+        snapshot = {stage: sorted(xs) for stage, xs in _samples.items()}
+        totals = {stage: tuple(t) for stage, t in _totals.items()}
+    lines = ["# HELP astro_stage_seconds Duration of instrumented pipeline stages.",
+             "# TYPE astro_stage_seconds summary"]
+    for stage, xs in sorted(snapshot.items()):
+        label = _label(stage)
+        for q in (0.5, 0.95):
+            lines.append(f'astro_stage_seconds{{stage="{label}",quantile="{q}"}} {_quantile(xs, q):.6f}')
+        lines.append(f'astro_stage_seconds_sum{{stage="{label}"}} {totals[stage][1]:.6f}')
+        lines.append(f'astro_stage_seconds_count{{stage="{label}"}} {totals[stage][0]}')
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,223 @@
+"""
+Transit events against a natal chart: sign ingresses, retrograde stations
+and transiting planets crossing natal points (the ascendant and planets).
+
+Each planet's longitude is sampled on a coarse grid (STEP_DAYS, well under
+its briefest retrograde spell, so no station is missed). Stations are where
+the sampled speed changes sign, refined by regula falsi on the speed.
+Between stations the motion is monotonic, so every crossing of a target longitude falls inside exactly one
+grid interval; the intervals are found with array arithmetic and each
+crossing is refined by Newton steps kept inside its bracket.
+
+The Moon is not transited (it changes sign every two and a half days), but
+the natal Moon is a target. Dates are UTC; longitudes are sidereal (Lahiri).
+"""
+import datetime
+from functools import lru_cache
+
+import numpy as np
+
+import ephemeris
+from chart_render import SIGNS
+from tracing import traced
+
+TRANSIT_PLANETS = ("Sun", "Mercury", "Venus", "Mars", "Jupiter", "Saturn", "Rahu", "Ketu")
+SLOW_PLANETS = ("Jupiter", "Saturn", "Rahu", "Ketu")
+NATAL_POINTS = ("Ascendant", "Sun", "Moon", "Mars", "Mercury", "Jupiter", "Venus", "Saturn", "Rahu", "Ketu")
+# Sampling step per planet, in days. Retrograde spells last at least about
+# 20 days (Mercury), 40 (Venus), 60 (Mars) and 120 (Jupiter, Saturn); the Sun
+# and the mean nodes never station, and only need steps well under 180°.
+STEP_DAYS = {"Sun": 30.0, "Mercury": 5.0, "Venus": 10.0, "Mars": 10.0,
+             "Jupiter": 15.0, "Saturn": 15.0, "Rahu": 60.0, "Ketu": 60.0}
+TOLERANCE_DAYS = 1 / 1440
+DEFAULT_YEARS = 10
+PROMPT_YEARS = 5
+# The mean nodes always move backwards, so "retrograde" says nothing about them
+_NODES = ("Rahu", "Ketu")
+
+
+def natal_longitudes(chart):
+    """((point, sidereal longitude), ...) for the D1 ascendant and planets of a Chart."""
+    found = chart.longitudes("D1")
+    return tuple((name, round(found[name], 6)) for name in NATAL_POINTS if name in found)
+
+
+def _wrap180(x):
+    return (x + 180.0) % 360.0 - 180.0
+
+
+def _position(planet, jd):
+    lon, speed = ephemeris.sidereal(planet, [jd])
+    return float(lon[0]), float(speed[0])
+
+
+def _refine_station(planet, a, b, speed_a, speed_b):
+    """Zero of the speed inside [a, b] (Illinois variant of regula falsi)."""
+    t, side = a, 0
+    for _ in range(60):
+        if b - a < TOLERANCE_DAYS:
+            break
+        t = (a * speed_b - b * speed_a) / (speed_b - speed_a)
+        speed = _position(planet, t)[1]
+        if (speed > 0) == (speed_a > 0):
+            a, speed_a = t, speed
+            if side == -1:
+                speed_b /= 2
+            side = -1
+        else:
+            b, speed_b = t, speed
+            if side == 1:
+                speed_a /= 2
+            side = 1
+    return t
+
+
+def _refine_crossing(planet, target, a, b, lon_a, fraction):
+    """
+    Time inside [a, b] at which the planet (crossing once there) reaches
+    `target`, starting from `fraction` of the way across.
+    """
+    below = _wrap180(lon_a - target) < 0
+    t = a + (b - a) * fraction
+    for _ in range(60):
+        lon, speed = _position(planet, t)
+        diff = _wrap180(lon - target)
+        if (diff < 0) == below:
+            a = t
+        else:
+            b = t
+        nxt = t - diff / speed if speed else (a + b) / 2
+        if not a < nxt < b:
+            nxt = (a + b) / 2
+        if abs(nxt - t) < TOLERANCE_DAYS:
+            return nxt
+        t = nxt
+    return t
+
+
+def _event(jd, planet, kind, lon, retro, description, natal_point=None):
+    return {"date": ephemeris.to_datetime(jd), "jd": jd, "planet": planet, "event": kind,
+            "sign": SIGNS[int(lon // 30) % 12], "degree": round(lon % 30, 2), "natal_point": natal_point,
+            "retrograde": retro and planet not in _NODES, "description": description}
+
+
+def _planet_events(planet, natal, start_jd, end_jd):
+    jds = np.append(np.arange(start_jd, end_jd, STEP_DAYS[planet]), end_jd)
+    lon, speed = ephemeris.sidereal(planet, jds)
+    events = []
+
+    flips = np.nonzero(np.sign(speed[:-1]) * np.sign(speed[1:]) < 0)[0]
+    station_jds = []
+    for i in flips:
+        t = _refine_station(planet, jds[i], jds[i + 1], speed[i], speed[i + 1])
+        station_lon = _position(planet, t)[0]
+        turn = "retrograde" if speed[i] > 0 else "direct"
+        sign = SIGNS[int(station_lon // 30) % 12]
+        events.append(_event(t, planet, "Station", station_lon, turn == "retrograde",
+                             f"{planet} stations {turn} at {station_lon % 30:.1f}° {sign}"))
+        station_jds.append(t)
+
+    # Splitting the grid at the stations leaves only monotonic intervals
+    if station_jds:
+        at = np.searchsorted(jds, station_jds)
+        jds = np.insert(jds, at, station_jds)
+        lon = np.insert(lon, at, [_position(planet, t)[0] for t in station_jds])
+
+    names = [f"{s}" for s in SIGNS] + [name for name, _ in natal]
+    targets = np.array([30.0 * k for k in range(12)] + [value for _, value in natal])
+    step = _wrap180(np.diff(lon))[:, None]
+    offset = _wrap180(targets[None, :] - lon[:-1, None])
+    hits = np.where(step > 0, (offset > 0) & (offset <= step), (offset < 0) & (offset >= step))
+
+    for i, j in np.argwhere(hits):
+        t = _refine_crossing(planet, targets[j], jds[i], jds[i + 1], lon[i], offset[i, j] / step[i, 0])
+        backwards = step[i, 0] < 0
+        if j < 12:
+            # Moving backwards across a cusp enters the sign before it
+            entered = (j - 1) % 12 if backwards else j
+            verb = "re-enters" if backwards and planet not in _NODES else "enters"
+            events.append(_event(t, planet, "Ingress", entered * 30.0 + (29.99 if backwards else 0.0), backwards,
+                                 f"{planet} {verb} {SIGNS[entered]}"))
+        else:
+            point = names[j]
+            retro = " (retrograde)" if backwards and planet not in _NODES else ""
+            events.append(_event(t, planet, "Conjunction", targets[j], backwards,
+                                 f"{planet} crosses natal {point} at {targets[j] % 30:.1f}° "
+                                 f"{SIGNS[int(targets[j] // 30)]}{retro}", natal_point=point))
+    return events
+
+
+@lru_cache(maxsize=64)
+def _transit_events(natal, start_jd, end_jd, planets):
+    events = []
+    for planet in planets:
+        events.extend(_planet_events(planet, natal, start_jd, end_jd))
+    events.sort(key=lambda e: e["jd"])
+    return tuple(events)
+
+
+@traced("transits.find")
+def find_transits(chart, start=None, years=DEFAULT_YEARS, planets=TRANSIT_PLANETS):
+    """
+    Transit events for a natal chart from `start` (a date, default today in
+    UTC) over `years` years, in time order. Results are cached per natal
+    positions and window and shared between callers, so treat them as
+    read-only.
+    """
+    start = start or datetime.datetime.now(datetime.timezone.utc).date()
+    end = start + datetime.timedelta(days=round(365.25 * years))
+    return list(_transit_events(natal_longitudes(chart), ephemeris.julian_day(start),
+                                ephemeris.julian_day(end), tuple(planets)))
+
+
+def next_event(events, planet, event=None, sign=None, natal_point=None):
+    """The first event matching all the given fields, or None."""
+    for e in events:
+        if (e["planet"] == planet and (event is None or e["event"] == event)
+                and (sign is None or e["sign"] == sign) and (natal_point is None or e["natal_point"] == natal_point)):
+            return e
+    return None
+
+
+def current_positions(moment=None):
+    """Sidereal sign, degree and retrograde flag of each transiting planet at `moment` (UTC, default now)."""
+    jd = ephemeris.julian_day(moment or datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None))
+    positions = {}
+    for planet in TRANSIT_PLANETS:
+        lon, speed = _position(planet, jd)
+        positions[planet] = {"sign": SIGNS[int(lon // 30) % 12], "degree": round(lon % 30, 2),
+                             "retrograde": speed < 0 and planet not in _NODES}
+    return positions
+
+
+def highlights(chart, events):
+    """Answers to the common timing questions for the slow planets, as short sentences."""
+    natal = dict(natal_longitudes(chart))
+    lines = []
+    for planet in SLOW_PLANETS:
+        if "Moon" in natal:
+            moon_sign = SIGNS[int(natal["Moon"] // 30)]
+            e = next_event(events, planet, "Ingress", sign=moon_sign)
+            if e:
+                lines.append(f"{planet} next enters your Moon sign ({moon_sign}) on {e['date']:%d %b %Y}.")
+        for point in ("Ascendant", "Moon"):
+            e = next_event(events, planet, "Conjunction", natal_point=point)
+            if e:
+                lines.append(f"{planet} next crosses your natal {point} on {e['date']:%d %b %Y}.")
+    return lines
+
+
+def format_transits_for_prompt(chart, start=None, years=PROMPT_YEARS):
+    """Current transits, key dates and slow-planet events as text for the LLM context."""
+    start = start or datetime.datetime.now(datetime.timezone.utc).date()
+    events = find_transits(chart, start, years)
+    lines = [f"## Transits (sidereal, Lahiri; dates UTC; today is {start:%d %b %Y})", "", "### Current Positions:"]
+    for planet, pos in current_positions(datetime.datetime(start.year, start.month, start.day, 12)).items():
+        retro = " (retrograde)" if pos["retrograde"] else ""
+        lines.append(f"- **{planet}**: {pos['degree']:.1f}° {pos['sign']}{retro}")
+    key_dates = highlights(chart, events)
+    if key_dates:
+        lines += ["", "### Key Dates:"] + [f"- {line}" for line in key_dates]
+    lines += ["", f"### Slow-Planet Events (next {years} years):"]
+    lines += [f"- {e['date']:%Y-%m-%d}: {e['description']}" for e in events if e["planet"] in SLOW_PLANETS]
+    return "\n".join(lines)
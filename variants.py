@@ -0,0 +1,61 @@
+"""
+Chart variants: one chart's positions under several ayanamsas and house
+systems, for comparing them side by side.
+
+The birth moment's tropical positions and house cusps are computed once;
+each ayanamsa is then a constant shift of every longitude and cusp, and
+house placement is a comparison against the cusps, so all variants come out
+of one array pass instead of one engine run each. Whole-sign houses are
+counted from the sidereal ascendant's sign (so they depend on the
+ayanamsa); the other systems use the Swiss Ephemeris cusps.
+"""
+import datetime
+
+import numpy as np
+
+import ephemeris
+
+AYANAMSA_LABELS = {"lahiri": "Lahiri", "raman": "Raman", "kp": "KP (Krishnamurti)"}
+# Label -> Swiss Ephemeris house system code (whole sign is computed here)
+HOUSE_SYSTEMS = {"Whole sign": b"W", "Equal": b"E", "Sripati": b"S", "Placidus": b"P",
+                 "Koch": b"K", "Porphyry": b"O"}
+POINTS = ephemeris.PLANETS + ["Ascendant"]
+ASCENDANT = len(POINTS) - 1
+
+
+def house_placements(lon, cusps):
+    """
+    House (1-12) of each point: lon (..., P) sidereal longitudes, cusps
+    (..., H, 12) the cusps of H house systems -> (..., H, P).
+    """
+    start = cusps[..., :1]
+    points = (lon[..., None, :] - start) % 360.0
+    bounds = (cusps - start) % 360.0
+    return (points[..., None, :] >= bounds[..., :, None]).sum(axis=-2).astype(np.uint8)
+
+
+def chart_variants(chart, ayanamsas=tuple(AYANAMSA_LABELS), house_systems=tuple(HOUSE_SYSTEMS)):
+    """
+    Positions of a chart_model.Chart under each ayanamsa and house system:
+    {"ayanamsas", "house_systems", "points", "ayanamsa": (A,) degrees,
+    "longitude": (A, P) sidereal, "cusps": (A, H, 12), "house": (A, H, P)}.
+    """
+    birth = chart.birth
+    if birth.moment is None or birth.location is None:
+        return {"error": "Chart variants need the birth time and place"}
+    jd = ephemeris.julian_day(birth.moment - datetime.timedelta(hours=birth.tz_offset))
+
+    rahu = ephemeris.tropical("Rahu", [jd])[0][0]
+    planets = [ephemeris.tropical(p, [jd])[0][0] for p in ephemeris.PLANETS[:-2]]
+    cusps, asc = zip(*(ephemeris.houses(jd, birth.lat, birth.lon, HOUSE_SYSTEMS[h]) for h in house_systems))
+    tropical = np.array(planets + [rahu, (rahu + 180.0) % 360.0, asc[0]])
+    ayan = np.array([ephemeris.ayanamsa([jd], mode)[0] for mode in ayanamsas])
+
+    lon = (tropical[None, :] - ayan[:, None]) % 360.0
+    cusps = (np.array(cusps)[None, :, :] - ayan[:, None, None]) % 360.0
+    whole = [i for i, h in enumerate(house_systems) if h == "Whole sign"]
+    if whole:
+        first = lon[:, ASCENDANT] // 30 * 30
+        cusps[:, whole, :] = ((first[:, None] + np.arange(12) * 30.0) % 360.0)[:, None, :]
+    return {"ayanamsas": list(ayanamsas), "house_systems": list(house_systems), "points": POINTS,
+            "ayanamsa": ayan, "longitude": lon, "cusps": cusps, "house": house_placements(lon, cusps)}